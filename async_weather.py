@@ -0,0 +1,287 @@
+# Weather App - Async Weather Service
+# asyncio version of WeatherService for fanning out several upstream calls at once
+
+import asyncio
+import time
+
+from bulk_format import convert_weather
+from cache import make_cache_key
+from http_client import DEFAULT_POOL_SIZE, DEFAULT_RETRIES, RETRY_STATUSES, backoff_delay, get_backoff, retry_delay
+from locations import canonical_location, coordinate_location, location_key
+from metrics import UpstreamTimer, cache_lookups
+from providers import ProviderError
+from ratelimit import QuotaExceeded
+from singleflight import AsyncSingleFlight
+from weather_app import DERIVED_UNITS, WeatherService
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncWeatherService(WeatherService):
+    """Same API as WeatherService, but every upstream method is a coroutine
+
+    Formatting helpers (format_weather_data, convert_temperature, ...) are
+    inherited unchanged. Current weather and forecasts go through the same
+    ProviderRouter as the sync service (hedging, breakers, failover), with
+    every provider called over this service's aiohttp session. Pass shared
+    to reuse a WeatherService's cache, quota, history, router and snapshot.
+    The aiohttp session is bound to the event loop it was created on, so
+    use one instance per loop and close() it when done.
+    """
+
+    def __init__(self, cache=None, pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, shared=None):
+        if aiohttp is None:
+            raise ImportError("AsyncWeatherService requires aiohttp: pip install aiohttp")
+
+        super().__init__(cache=cache, shared=shared)
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = get_backoff()
+        self.inflight = AsyncSingleFlight()
+        self._aiohttp_session = None
+
+    async def _get_aiohttp_session(self):
+        """Return the keep-alive client session, creating it on first use"""
+        if self._aiohttp_session is None or self._aiohttp_session.closed:
+            connect_timeout, read_timeout = self.timeout
+            self._aiohttp_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+                headers={'Accept': 'application/json', 'User-Agent': 'WeatherApp/1.0'},
+            )
+        return self._aiohttp_session
+
+    async def close(self):
+        """Close the client session and its pooled connections"""
+        if self._aiohttp_session is not None:
+            await self._aiohttp_session.close()
+            self._aiohttp_session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _fetch_json(self, url, params, charge_quota=True, endpoint=None):
+        """GET a JSON document, retrying connection errors and 5xx with jittered backoff
+
+        Every attempt is charged to the quota. Raises aiohttp errors
+        (ValueError for a body that isn't JSON), or QuotaExceeded if the
+        upstream answers 429.
+        """
+        session = await self._get_aiohttp_session()
+        for attempt in range(self.retries + 1):
+            if charge_quota:
+                self.quota.acquire()
+            try:
+                with UpstreamTimer(url, endpoint) as timer:
+                    async with session.get(url, params=params) as response:
+                        timer.status = response.status
+                        if response.status == 429:
+                            retry_after = response.headers.get('Retry-After', '')
+                            raise QuotaExceeded(int(retry_after) if retry_after.isdigit() else 60)
+                        if response.status not in RETRY_STATUSES or attempt == self.retries:
+                            response.raise_for_status()
+                            return await response.json(content_type=None)
+                        retry_after = response.headers.get('Retry-After', '')
+                # Back off outside the timer so latency reflects the upstream alone
+                delay = retry_delay(retry_after, attempt, self.backoff)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+                delay = backoff_delay(attempt, self.backoff)
+            await asyncio.sleep(delay)
+
+    async def _get_json(self, url, params, error_message):
+        """_fetch_json() with failures reported as error_message"""
+        try:
+            return await self._fetch_json(url, params)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            raise Exception(f"{error_message}: {str(e) or type(e).__name__}")
+        except aiohttp.ClientError as e:
+            raise Exception(f"{error_message}: {str(e)}")
+        except ValueError:
+            raise Exception("Invalid response from weather service")
+
+    async def provider_json(self, url, params, name, charge_quota=True, endpoint=None):
+        """_fetch_json() for WeatherProvider.fetch_async, failures raised as ProviderError"""
+        try:
+            return await self._fetch_json(url, params, charge_quota, endpoint)
+        except aiohttp.ClientResponseError as e:
+            # A 400/404 is the upstream's answer, not a sign it is unhealthy
+            raise ProviderError(str(e), retryable=e.status not in (400, 404), status=e.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise ProviderError(str(e) or type(e).__name__)
+        except ValueError:
+            raise ProviderError(f"Invalid response from {name}")
+
+    async def _from_providers(self, kind, query, units, error_message):
+        """Fetch 'current' or 'forecast' through the ProviderRouter on this service's session"""
+        try:
+            return await self.providers.fetch_async(kind, query, units, self)
+        except ProviderError as e:
+            raise Exception(f"{error_message}: {str(e)}")
+
+    async def _cached_fetch(self, endpoint, location, units, fetch):
+        """Serve from cache, coalescing concurrent misses into one upstream call
+
+        Offline mode and upstream failures fall back to the snapshot, and a
+        spent quota to the stale entry, as in WeatherService._cached_fetch.
+        """
+        location = location_key(location)
+        if self.offline:
+            async def fetch():
+                return self._offline_fetch(endpoint, location, units)
+
+        entry = self.cache.lookup(endpoint, location, units)
+        if entry is not None and entry[1] > time.time():
+            cache_lookups.inc(endpoint, 'hit')
+            return entry[0]
+
+        try:
+            value = await self.refresh_entry(endpoint, location, units, fetch)
+            cache_lookups.inc(endpoint, 'miss')
+            return value
+        except QuotaExceeded:
+            if entry is not None:
+                cache_lookups.inc(endpoint, 'stale')
+                return entry[0]
+            fallback = self.from_snapshot(endpoint, location, units)
+            if fallback is None:
+                raise
+            return fallback
+        except Exception:
+            fallback = self.from_snapshot(endpoint, location, units)
+            if fallback is None:
+                raise
+            return fallback
+
+    async def refresh_entry(self, endpoint, location, units, fetch):
+        """Fetch a response from upstream (coalesced) and store it in the cache"""
+        key = make_cache_key(endpoint, location, units)
+        value = await self.inflight.do(key, fetch)
+        if value is not None:
+            self.cache.set(endpoint, location, units, value, self._derived_ttl(endpoint, location, units))
+            # The history store writes to SQLite; keep that off the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._record_observation, endpoint, location, units, value)
+        return value
+
+    async def _from_metric(self, endpoint, location, fetch):
+        """Fresh metric response for a location (cached or fetched), to derive other units from"""
+        location = location_key(location)
+        data = self.cache.get(endpoint, location, 'metric')
+        if data is None:
+            data = await self.refresh_entry(endpoint, location, 'metric', fetch)
+        return data
+
+    async def get_current_weather(self, location, units='metric'):
+        """Fetch current weather data for a location (cached)"""
+        return await self._cached_fetch(
+            'weather', location, units,
+            lambda: self._fetch_current_weather(location, units)
+        )
+
+    async def _fetch_current_weather(self, location, units='metric'):
+        """Fetch current weather data from the best available provider"""
+        if units in DERIVED_UNITS:
+            data = await self._from_metric('weather', location, lambda: self._fetch_current_weather(location))
+            return convert_weather(data, 'metric', units)
+        return await self._from_providers('current', self._provider_query(location), units,
+                                          "Failed to fetch weather data")
+
+    async def get_forecast(self, location, units='metric'):
+        """Fetch 5-day weather forecast (cached)"""
+        return await self._cached_fetch(
+            'forecast', location, units,
+            lambda: self._fetch_forecast(location, units)
+        )
+
+    async def _fetch_forecast(self, location, units='metric'):
+        """Fetch 5-day weather forecast from the best available provider"""
+        if units in DERIVED_UNITS:
+            data = await self._from_metric('forecast', location, lambda: self._fetch_forecast(location))
+            return convert_weather(data, 'metric', units)
+        return await self._from_providers('forecast', self._provider_query(location), units,
+                                          "Failed to fetch forecast data")
+
+    async def get_weather_by_coordinates(self, lat: float, lon: float, units='metric'):
+        """Fetch weather data using coordinates (cached per geohash cell)"""
+        bucket = coordinate_location(lat, lon)
+        return await self._cached_fetch(
+            'weather', bucket.key, units,
+            lambda: self._fetch_weather_by_coordinates(bucket.params['lat'], bucket.params['lon'], units)
+        )
+
+    async def _fetch_weather_by_coordinates(self, lat: float, lon: float, units='metric'):
+        """Fetch weather data for coordinates from the best available provider"""
+        if units in DERIVED_UNITS:
+            data = await self._from_metric('weather', coordinate_location(lat, lon).key,
+                                           lambda: self._fetch_weather_by_coordinates(lat, lon))
+            return convert_weather(data, 'metric', units)
+        return await self._from_providers('current', self._coordinate_query(lat, lon), units,
+                                          "Failed to fetch weather data")
+
+    async def get_air_quality(self, lat: float, lon: float):
+        """Fetch air quality data (cached per geohash cell)"""
+        bucket = coordinate_location(lat, lon)
+        params = {**bucket.params, 'appid': self.api_key}
+        return await self._cached_fetch(
+            'air_quality', bucket.key, '',
+            lambda: self._get_json(f"{self.base_url}/air_pollution", params,
+                                   "Failed to fetch air quality data")
+        )
+
+    async def geocode_location(self, location: str):
+        """Convert location name to coordinates (offline index first, then cached API)"""
+        place = self.resolve_offline(location)
+        if place:
+            return place
+
+        params = {'q': canonical_location(location).params.get('q', location), 'limit': 1,
+                  'appid': self.api_key}
+
+        async def fetch():
+            data = await self._get_json(f"{self.geocoding_url}/direct", params,
+                                        "Failed to geocode location")
+            return data[0] if data else None
+
+        return await self._cached_fetch('geocode', location, '', fetch)
+
+    async def _get_air_quality_for(self, location: str):
+        """Geocode a location, then fetch its air quality"""
+        place = await self.geocode_location(location)
+        if not place:
+            return None
+        return await self.get_air_quality(place['lat'], place['lon'])
+
+    async def get_full_report(self, location, units='metric'):
+        """Fetch current weather, forecast and air quality for one location concurrently
+
+        Geocoding only gates the air quality call, so total latency is about
+        the slowest single branch rather than the sum of all of them.
+        A failing branch is reported in 'errors' instead of failing the report.
+        """
+        names = ('weather', 'forecast', 'air_quality')
+        results = await asyncio.gather(
+            self.get_current_weather(location, units),
+            self.get_forecast(location, units),
+            self._get_air_quality_for(location),
+            return_exceptions=True
+        )
+
+        report = {'location': location, 'units': units, 'errors': {}}
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                report[name] = None
+                report['errors'][name] = str(result)
+            else:
+                report[name] = result
+
+        if report['weather']:
+            report['formatted'] = self.format_weather_data(report['weather'], units)
+        return report
@@ -0,0 +1,674 @@
+#!/usr/bin/env python3
+# Weather App - Benchmarks
+# Load test against a stub upstream, startup time, and micro-benchmarks of hot helpers
+
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+RESULTS_VERSION = 1
+DEFAULT_MIX = 'weather=70,forecast=20,batch=10'
+REGRESSION_THRESHOLD = 0.10     # Flag changes worse than 10% in --compare
+PERCENTILES = (50, 95, 99)
+# Fresh-interpreter import of server.py must stay under this (--import-budget-ms)
+DEFAULT_IMPORT_BUDGET_MS = 300
+# Documents per call in the format_weather_batch micro-benchmark (both unit systems)
+BATCH_FORMAT_ROWS = 200
+
+
+class StubUpstream:
+    """Local stand-in for the OpenWeatherMap (and Open-Meteo) endpoints the app calls
+
+    latency is the mean added delay in seconds (uniformly jittered by
+    +/- jitter), error_rate the fraction of requests answered with a 500,
+    and payload_bytes pads every response to roughly that size. A
+    slow_rate fraction of requests take slow_latency seconds instead,
+    for a long tail.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, payload_bytes=0, seed=None,
+                 slow_rate=0.0, slow_latency=1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.payload_bytes = payload_bytes
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.calls = Counter()
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def weather(self, params, name='Stubville'):
+        """Current-weather document in the upstream's shape"""
+        lat = float(params.get('lat', 51.5))
+        lon = float(params.get('lon', -0.12))
+        return {
+            'coord': {'lat': lat, 'lon': lon},
+            'weather': [{'id': 500, 'main': 'Rain', 'description': 'light rain', 'icon': '10d'}],
+            'main': {'temp': 12.3, 'feels_like': 11.1, 'temp_min': 10.0, 'temp_max': 14.2,
+                     'pressure': 1012, 'humidity': 71},
+            'visibility': 10000,
+            'wind': {'speed': 4.1, 'deg': 240},
+            'clouds': {'all': 75},
+            'dt': int(time.time()),
+            'sys': {'country': 'GB', 'sunrise': 1700000000, 'sunset': 1700030000},
+            'timezone': 0,
+            'name': params.get('q', name).split(',')[0],
+        }
+
+    def forecast(self, params):
+        """40-slot 3-hourly forecast document"""
+        start = int(time.time()) // 10800 * 10800
+        slots = [{
+            'dt': start + i * 10800,
+            'main': {'temp': 8 + i % 8, 'feels_like': 7 + i % 8, 'humidity': 60 + i % 20,
+                     'pressure': 1010},
+            'weather': [{'description': 'light rain' if i % 3 else 'clear sky',
+                         'icon': '10d' if i % 3 else '01d'}],
+            'wind': {'speed': 3.0 + i % 4, 'deg': 200},
+            'clouds': {'all': 40},
+            'pop': round(0.1 * (i % 5), 1),
+        } for i in range(40)]
+        city = {'name': params.get('q', 'Stubville').split(',')[0], 'country': 'GB',
+                'coord': {'lat': float(params.get('lat', 51.5)), 'lon': float(params.get('lon', -0.12))},
+                'timezone': 0}
+        return {'cod': '200', 'cnt': len(slots), 'list': slots, 'city': city}
+
+    def open_meteo(self, params):
+        """Open-Meteo /v1/forecast document with current and hourly blocks"""
+        now = int(time.time())
+        start = now // 3600 * 3600
+        hours = range(0, 6 * 24)
+        doc = {'latitude': float(params.get('latitude', 51.5)), 'longitude': float(params.get('longitude', -0.12)),
+               'utc_offset_seconds': 0, 'timezone': 'GMT'}
+        if 'current' in params:
+            doc['current'] = {'time': now, 'temperature_2m': 12.1, 'relative_humidity_2m': 70,
+                              'apparent_temperature': 10.9, 'is_day': 1, 'weather_code': 61,
+                              'cloud_cover': 75, 'pressure_msl': 1012.4, 'wind_speed_10m': 4.0,
+                              'wind_direction_10m': 235, 'wind_gusts_10m': 7.5, 'visibility': 24000}
+            doc['daily'] = {'time': [start], 'temperature_2m_max': [14.0], 'temperature_2m_min': [9.8],
+                            'sunrise': [1700000000], 'sunset': [1700030000]}
+        if 'hourly' in params:
+            doc['hourly'] = {
+                'time': [start + h * 3600 for h in hours],
+                'temperature_2m': [8 + h % 8 for h in hours],
+                'apparent_temperature': [7 + h % 8 for h in hours],
+                'relative_humidity_2m': [60 + h % 20 for h in hours],
+                'pressure_msl': [1010.0 for h in hours],
+                'weather_code': [61 if h % 3 else 0 for h in hours],
+                'is_day': [1 if 6 <= h % 24 < 18 else 0 for h in hours],
+                'cloud_cover': [40 for h in hours],
+                'wind_speed_10m': [3.0 + h % 4 for h in hours],
+                'wind_direction_10m': [200 for h in hours],
+                'precipitation_probability': [10 * (h % 5) for h in hours],
+            }
+        return doc
+
+    def respond(self, path, params):
+        """Return (status, document) for one upstream request"""
+        if self.error_rate and self._random.random() < self.error_rate:
+            return 500, {'cod': 500, 'message': 'stub error'}
+        if path.startswith('/v1/'):
+            body = self.open_meteo(params)
+        elif path.endswith('/forecast'):
+            body = self.forecast(params)
+        elif path.endswith('/group'):
+            ids = params.get('id', '').split(',')
+            body = {'cnt': len(ids), 'list': [dict(self.weather(params), id=int(i)) for i in ids if i]}
+        elif path.endswith('/air_pollution'):
+            body = {'list': [{'main': {'aqi': 2}, 'components': {'pm2_5': 8.1}}]}
+        elif path.endswith('/direct'):
+            body = [{'name': params.get('q', 'Stubville').split(',')[0], 'lat': 51.5, 'lon': -0.12,
+                     'country': 'GB'}]
+        else:
+            body = self.weather(params)
+        if self.payload_bytes and isinstance(body, dict):
+            body['padding'] = 'x' * self.payload_bytes
+        return 200, body
+
+    def start(self):
+        """Serve on a free local port in a background thread; return the base URL"""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                endpoint = url.path.rsplit('/', 1)[-1]
+                with stub._lock:
+                    stub.calls[endpoint] += 1
+                    delay = max(0.0, stub.latency + stub._random.uniform(-stub.jitter, stub.jitter))
+                    if stub.slow_rate and stub._random.random() < stub.slow_rate:
+                        delay = stub.slow_latency
+                time.sleep(delay)
+                status, body = stub.respond(url.path, params)
+                if status != 200:
+                    with stub._lock:
+                        stub.errors += 1
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self):
+        """Return upstream call counts per endpoint"""
+        with self._lock:
+            return {'total': sum(self.calls.values()), 'errors': self.errors,
+                    'by_endpoint': dict(self.calls)}
+
+
+def zipf_cities(count, exponent=1.1):
+    """Return (names, cumulative weights) for count cities, most popular first
+
+    Real cities come from the gazetteer by population; if more are asked
+    for, synthetic names (resolved upstream by name) fill the long tail.
+    """
+    from gazetteer import get_gazetteer
+
+    seen, places = set(), []
+    try:
+        for _, place in get_gazetteer().iter_entries():
+            label = f"{place['name']}, {place['country']}"
+            if label not in seen:
+                seen.add(label)
+                places.append((place['population'], label))
+    except (OSError, ValueError):
+        pass
+    names = [label for _, label in sorted(places, reverse=True)][:count]
+    names += [f"Testville {i}" for i in range(count - len(names))]
+
+    cumulative, total = [], 0.0
+    for rank in range(1, len(names) + 1):
+        total += 1.0 / rank ** exponent
+        cumulative.append(total)
+    return names, cumulative
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, duration):
+    """Throughput and latency percentiles (in ms) for one traffic class"""
+    ordered = sorted(latencies)
+    summary = {
+        'requests': len(ordered),
+        'throughput_rps': round(len(ordered) / duration, 1) if duration else None,
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2) if ordered else None,
+    }
+    for pct in PERCENTILES:
+        value = percentile(ordered, pct)
+        summary[f'p{pct}_ms'] = round(value * 1000, 2) if value is not None else None
+    return summary
+
+
+def parse_mix(mix):
+    """'weather=70,forecast=20,batch=10' -> {'weather': 70.0, ...}"""
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ('weather', 'forecast', 'batch'):
+            raise Exception(f"Unknown traffic class in --mix: {name}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _process_rss(pid):
+    """Resident memory in bytes of a process and its children (Linux only)"""
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            if current == pid:
+                return None
+    return total
+
+
+def start_server(upstream_url, workers, threads, log_file, poll_interval=0.2, extra_env=None):
+    """Launch main.py against the stub upstream and wait for /healthz"""
+    port = _free_port()
+    env = dict(os.environ)
+    env.update(extra_env or {})
+    env.update({
+        'WEATHER_API_HOST': upstream_url,
+        'WEATHER_API_KEY': env.get('WEATHER_API_KEY') or 'benchmark-api-key',
+        # The benchmark measures the app, not our own throttling
+        'WEATHER_QUOTA_PER_MINUTE': env.get('WEATHER_QUOTA_PER_MINUTE', '0'),
+        'WEATHER_CLIENT_RATE': env.get('WEATHER_CLIENT_RATE', '1000000'),
+        'WEATHER_CLIENT_BURST': env.get('WEATHER_CLIENT_BURST', '1000000'),
+        'WEATHER_REFRESH_ENABLED': env.get('WEATHER_REFRESH_ENABLED', '0'),
+        'WEATHER_HISTORY_PATH': os.path.join(os.path.dirname(log_file.name), 'history.db'),
+        'PYTHONUNBUFFERED': '1',
+    })
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py'),
+               '--host', '127.0.0.1', '--port', str(port),
+               '--workers', str(workers), '--threads', str(threads)]
+    if workers < 1:
+        command.append('--dev')
+    process = subprocess.Popen(command, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+                               stdin=subprocess.DEVNULL)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if requests.get(f"{base_url}/healthz", timeout=1).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(poll_interval)
+
+    process.kill()
+    log_file.seek(0)
+    raise Exception(f"Server did not become healthy:\n{log_file.read()[-2000:]}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def run_load(base_url, duration, concurrency, mix, cities, zipf_exponent, batch_size, seed=None):
+    """Drive the server from concurrency client threads for duration seconds
+
+    Returns per-class latency summaries, status counts and overall
+    throughput. Locations follow a Zipf distribution over cities.
+    """
+    names, cumulative = zipf_cities(cities, zipf_exponent)
+    classes, weights = zip(*parse_mix(mix).items())
+    latencies = defaultdict(list)
+    statuses = Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        rng = random.Random(None if seed is None else seed + index)
+        session = requests.Session()
+        local_latencies, local_statuses = defaultdict(list), Counter()
+        while time.perf_counter() < deadline:
+            kind = rng.choices(classes, weights)[0]
+            started = time.perf_counter()
+            try:
+                if kind == 'batch':
+                    locations = rng.choices(names, cum_weights=cumulative, k=batch_size)
+                    response = session.post(f"{base_url}/api/weather/batch",
+                                            json={'locations': locations}, timeout=30)
+                else:
+                    location = rng.choices(names, cum_weights=cumulative)[0]
+                    response = session.get(f"{base_url}/api/{kind}",
+                                           params={'location': location}, timeout=30)
+                status = response.status_code
+            except requests.RequestException:
+                status = 'error'
+            local_latencies[kind].append(time.perf_counter() - started)
+            local_statuses[status] += 1
+        session.close()
+        with lock:
+            for kind, values in local_latencies.items():
+                latencies[kind].extend(values)
+            statuses.update(local_statuses)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    everything = [value for values in latencies.values() for value in values]
+    return {
+        'elapsed_s': round(elapsed, 2),
+        'overall': summarize(everything, elapsed),
+        'routes': {kind: summarize(values, elapsed) for kind, values in sorted(latencies.items())},
+        'statuses': {str(status): count for status, count in statuses.items()},
+    }
+
+
+def load_test(args):
+    """Start the stub(s) and the server, run the load, collect upstream and memory stats
+
+    With open-meteo in --providers a second stub plays Open-Meteo, so
+    hedging and failover can be measured against a slow or failing primary.
+    """
+    stub = StubUpstream(latency=args.latency / 1000, jitter=args.jitter / 1000,
+                        error_rate=args.error_rate, payload_bytes=args.payload_bytes, seed=args.seed,
+                        slow_rate=args.slow_rate, slow_latency=args.slow_latency / 1000)
+    upstream_url = stub.start()
+    extra_env = {'WEATHER_PROVIDERS': args.providers}
+    fallback = None
+    if 'open-meteo' in args.providers:
+        fallback = StubUpstream(latency=args.fallback_latency / 1000, jitter=args.jitter / 1000, seed=args.seed)
+        extra_env['WEATHER_OPEN_METEO_HOST'] = fallback.start()
+    process = None
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, 'server.log'), 'w+') as log_file:
+            try:
+                if args.url:
+                    base_url = args.url.rstrip('/')
+                    print(f"🎯 Using running server at {base_url} (its upstream is not the stub)")
+                else:
+                    process, base_url = start_server(upstream_url, args.workers, args.threads, log_file,
+                                                     extra_env=extra_env)
+                    print(f"🚀 Server started at {base_url} ({args.workers or 'dev'} workers)")
+
+                print(f"🔥 Driving load for {args.duration}s with {args.concurrency} clients...")
+                results = run_load(base_url, args.duration, args.concurrency, args.mix,
+                                   args.cities, args.zipf, args.batch_size, args.seed)
+                results['upstream'] = stub.stats()
+                results['fallback_upstream'] = fallback.stats() if fallback else None
+                results['server_rss_bytes'] = _process_rss(process.pid) if process else None
+                try:
+                    results['server_stats'] = requests.get(f"{base_url}/api/cache/stats", timeout=5).json()
+                except (requests.RequestException, ValueError):
+                    results['server_stats'] = None
+                return results
+            finally:
+                if process is not None:
+                    stop_server(process)
+                stub.stop()
+                if fallback is not None:
+                    fallback.stop()
+
+
+def import_profile(module='server'):
+    """Import a module in a fresh interpreter with -X importtime
+
+    Returns the module's cumulative import time and the modules that
+    took longest by their own (not counting children's) time.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+        env={**os.environ, 'WEATHER_REFRESH_ENABLED': '0'}, stdin=subprocess.DEVNULL)
+    if result.returncode != 0:
+        raise Exception(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    total_us, modules = None, []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        modules.append((int(own), name))
+        if name == module:
+            total_us = int(cumulative)
+    modules.sort(reverse=True)
+    return {
+        'import_ms': round(total_us / 1000, 1) if total_us is not None else None,
+        'modules_loaded': len(modules),
+        'slowest_imports': [{'module': name, 'self_ms': round(own / 1000, 1)} for own, name in modules[:8]],
+    }
+
+
+def startup_test(args):
+    """Time server.py's import, then process start to first /healthz and first /api/weather
+
+    Each run starts a new server, so the first weather request is a cache
+    miss that goes to the stub upstream like a freshly scaled-up instance.
+    """
+    results = import_profile()
+    stub = StubUpstream(latency=args.latency / 1000, jitter=0, seed=args.seed)
+    upstream_url = stub.start()
+    healthy, first_weather = [], []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for _ in range(args.startup_runs):
+                with open(os.path.join(workdir, 'server.log'), 'w+') as log_file:
+                    started = time.perf_counter()
+                    process, base_url = start_server(upstream_url, args.workers, args.threads,
+                                                     log_file, poll_interval=0.01)
+                    try:
+                        healthy.append((time.perf_counter() - started) * 1000)
+                        response = requests.get(f"{base_url}/api/weather", params={'location': 'London'},
+                                                timeout=10)
+                        if response.status_code != 200:
+                            raise Exception(f"First /api/weather answered {response.status_code}")
+                        first_weather.append((time.perf_counter() - started) * 1000)
+                    finally:
+                        stop_server(process)
+    finally:
+        stub.stop()
+
+    healthy.sort()
+    first_weather.sort()
+    results.update({
+        'runs': args.startup_runs,
+        'time_to_healthy_ms': round(percentile(healthy, 50), 1),
+        'time_to_first_weather_ms': round(percentile(first_weather, 50), 1),
+    })
+    return results
+
+
+def time_call(fn, repeat=5):
+    """Best and median nanoseconds per call of fn"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    runs = sorted(t / number * 1e9 for t in timer.repeat(repeat=repeat, number=number))
+    return {'best_ns': round(runs[0]), 'median_ns': round(runs[len(runs) // 2]), 'loops': number}
+
+
+def micro_benchmarks():
+    """Time the per-request helpers that don't touch the network"""
+    os.environ.setdefault('WEATHER_HISTORY_ENABLED', '0')
+    from forecast import compact_forecast
+    from weather_app import LocationService, WeatherService
+
+    stub = StubUpstream()
+    weather = stub.weather({'q': 'London'})
+    batch = [stub.weather({'q': f'City {i}'}, name=f'City {i}') for i in range(BATCH_FORMAT_ROWS)]
+    forecast = stub.forecast({'q': 'London'})
+    service = WeatherService()
+    locations = LocationService()
+
+    inputs = ['London', 'new york, US', 'Paris, France', '10001', 'K1A 0B6', 'São Paulo',
+              'Springfield, IL', 'x', "St. John's", 'Tokyo']
+    prefixes = ['l', 'lo', 'lon', 'new', 'san', 'sp', 'ber', 'tok']
+    cycle = {'validate': 0, 'suggest': 0}
+
+    def validate():
+        cycle['validate'] = (cycle['validate'] + 1) % len(inputs)
+        locations.validate_location(inputs[cycle['validate']])
+
+    def suggest():
+        cycle['suggest'] = (cycle['suggest'] + 1) % len(prefixes)
+        locations.get_location_suggestions(prefixes[cycle['suggest']], 'benchmark')
+
+    for name in ('London', 'Paris', 'Berlin'):
+        locations.add_to_history(name, 'benchmark')
+
+    benchmarks = {
+        'format_weather_data': lambda: service.format_weather_data(weather, 'metric', include_raw=False),
+        'format_weather_data_raw': lambda: service.format_weather_data(weather, 'metric'),
+        'format_weather_batch': lambda: service.format_weather_batch(batch, 'metric', ('metric', 'imperial')),
+        'validate_location': validate,
+        'location_suggestions': suggest,
+        'compact_forecast': lambda: compact_forecast(forecast),
+    }
+    results = {}
+    for name, fn in benchmarks.items():
+        results[name] = time_call(fn)
+        print(f"   ⏱️  {name:<26} {results[name]['best_ns'] / 1000:>10.2f} µs")
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Print relative changes against a previous results file; return regression count"""
+    rows = []
+    for route, summary in (current.get('load') or {}).get('routes', {}).items():
+        before = (baseline.get('load') or {}).get('routes', {}).get(route, {})
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            rows.append((f"load.{route}.{metric}", before.get(metric), summary.get(metric),
+                         metric == 'throughput_rps'))
+    for name, timing in (current.get('micro') or {}).items():
+        before = (baseline.get('micro') or {}).get(name, {})
+        rows.append((f"micro.{name}.best_ns", before.get('best_ns'), timing.get('best_ns'), False))
+    for metric in ('import_ms', 'time_to_healthy_ms', 'time_to_first_weather_ms'):
+        rows.append((f"startup.{metric}", (baseline.get('startup') or {}).get(metric),
+                     (current.get('startup') or {}).get(metric), False))
+
+    regressions = 0
+    print(f"\n📈 Compared with {baseline.get('git_commit') or 'baseline'}:")
+    for name, before, after, higher_is_better in rows:
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        worse = -change if higher_is_better else change
+        flag = '❌' if worse > threshold else ('✅' if worse < -threshold else '  ')
+        regressions += worse > threshold
+        print(f"   {flag} {name:<40} {before:>12} -> {after:<12} ({change:+.1%})")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Weather App load test and micro-benchmarks")
+    parser.add_argument('suite', nargs='?', choices=('all', 'load', 'micro', 'startup'), default='all')
+    parser.add_argument('--duration', type=float, default=10, help="load test seconds (default: %(default)s)")
+    parser.add_argument('--concurrency', type=int, default=16, help="client threads (default: %(default)s)")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="traffic mix (default: %(default)s)")
+    parser.add_argument('--cities', type=int, default=200, help="distinct locations (default: %(default)s)")
+    parser.add_argument('--zipf', type=float, default=1.1, help="Zipf exponent of city popularity")
+    parser.add_argument('--batch-size', type=int, default=10, help="locations per batch request")
+    parser.add_argument('--latency', type=float, default=50, help="stub upstream latency in ms")
+    parser.add_argument('--jitter', type=float, default=20, help="+/- ms added to the stub latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of stub 500s")
+    parser.add_argument('--payload-bytes', type=int, default=0, help="padding added to stub responses")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="fraction of stub calls that are very slow")
+    parser.add_argument('--slow-latency', type=float, default=1000, help="ms those slow calls take")
+    parser.add_argument('--providers', default='openweathermap',
+                        help="WEATHER_PROVIDERS for the server, e.g. openweathermap,open-meteo:0.5")
+    parser.add_argument('--fallback-latency', type=float, default=50, help="Open-Meteo stub latency in ms")
+    parser.add_argument('--workers', type=int, default=2, help="server workers, 0 = dev server")
+    parser.add_argument('--threads', type=int, default=4, help="threads per server worker")
+    parser.add_argument('--url', help="benchmark an already running server instead")
+    parser.add_argument('--seed', type=int, help="random seed for repeatable traffic")
+    parser.add_argument('--startup-runs', type=int, default=3, help="server starts to time (median is reported)")
+    parser.add_argument('--import-budget-ms', type=float, default=DEFAULT_IMPORT_BUDGET_MS,
+                        help="fail if importing server.py takes longer (default: %(default)s)")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--compare', help="previous results JSON to compare against")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = {
+        'version': RESULTS_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+    }
+
+    if args.suite in ('all', 'micro'):
+        print("🔬 Micro-benchmarks:")
+        results['micro'] = micro_benchmarks()
+
+    failures = 0
+    if args.suite in ('all', 'startup'):
+        print("🧊 Cold start:")
+        startup = results['startup'] = startup_test(args)
+        print(f"   import server.py   {startup['import_ms']} ms ({startup['modules_loaded']} modules, "
+              f"budget {args.import_budget_ms:g} ms)")
+        print(f"   first /healthz     {startup['time_to_healthy_ms']} ms after launch")
+        print(f"   first /api/weather {startup['time_to_first_weather_ms']} ms after launch")
+        print("   slowest imports: " + ', '.join(f"{m['module']} {m['self_ms']} ms"
+                                                for m in startup['slowest_imports'][:5]))
+        if startup['import_ms'] is None or startup['import_ms'] > args.import_budget_ms:
+            print(f"⚠️  Importing server.py is over the {args.import_budget_ms:g} ms budget")
+            failures += 1
+
+    if args.suite in ('all', 'load'):
+        results['load'] = load_test(args)
+        load = results['load']
+        print(f"📊 {load['overall']['requests']} requests, {load['overall']['throughput_rps']} req/s, "
+              f"upstream calls: {load['upstream']['total']}")
+        for route, summary in load['routes'].items():
+            print(f"   {route:<10} p50 {summary['p50_ms']} ms  p95 {summary['p95_ms']} ms  "
+                  f"p99 {summary['p99_ms']} ms  ({summary['requests']} requests)")
+        print(f"   statuses: {load['statuses']}")
+        if load['server_rss_bytes']:
+            print(f"   server memory: {load['server_rss_bytes'] / 1024 / 1024:.1f} MiB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results)
+        if regressions:
+            print(f"⚠️  {regressions} metric(s) regressed by more than {REGRESSION_THRESHOLD:.0%}")
+            failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+# Weather App - Bulk Formatting
+# Unit conversion, derived fields and display strings computed a column at a time
+
+import math
+import os
+import time
+from array import array
+from datetime import datetime, timezone
+
+from lazy_imports import is_installed, lazy_module
+
+# NumPy is optional: without it columns are array('d') and the math runs in Python
+np = lazy_module('numpy')
+USE_NUMPY = is_installed('numpy') and os.getenv('WEATHER_NUMPY', '1').lower() not in ('0', 'false', 'no')
+# Below this many rows NumPy's per-call overhead costs more than it saves; it also
+# keeps a single 40-slot forecast from importing NumPy on a cold worker
+NUMPY_MIN_ROWS = 64
+
+MISSING = float('nan')
+MPS_TO_MPH = 1 / 0.44704
+COMPASS_POINTS = ('N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
+                  'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW')
+DEFAULT_EMOJI = '🌤️'
+
+UNIT_LABELS = {
+    'metric': {'temp': '°C', 'speed': 'm/s'},
+    'imperial': {'temp': '°F', 'speed': 'mph'},
+}
+# Fields of a 'main' / 'wind' object that change with the unit system
+TEMPERATURE_FIELDS = ('temp', 'feels_like', 'temp_min', 'temp_max')
+SPEED_FIELDS = ('speed', 'gust')
+# Key order of a formatted current-weather dict
+DISPLAY_FIELDS = ('location', 'coordinates', 'temperature', 'temp_min', 'temp_max', 'feels_like',
+                  'description', 'emoji', 'humidity', 'pressure', 'wind_speed', 'wind_direction',
+                  'wind_compass', 'wind_gust', 'visibility', 'cloudiness', 'icon', 'sunrise',
+                  'sunset', 'timezone')
+
+
+def _vectorized(rows):
+    return USE_NUMPY and rows >= NUMPY_MIN_ROWS
+
+
+def column(values, vectorized=None):
+    """Float column (NumPy array or array('d')) from a sequence, None becoming NaN"""
+    values = [MISSING if v is None else v for v in values]
+    if vectorized is None:
+        vectorized = _vectorized(len(values))
+    return np.array(values, dtype=float) if vectorized else array('d', values)
+
+
+def to_list(col, digits=None):
+    """Plain list of a column with NaN as None, optionally rounded"""
+    if digits is None:
+        return [None if v != v else v for v in col.tolist()]
+    return [None if v != v else round(v, digits) for v in col.tolist()]
+
+
+def _affine(col, scale, offset=0.0):
+    if isinstance(col, array):
+        return array('d', [v * scale + offset for v in col])
+    return col * scale + offset
+
+
+def convert_temperature(col, from_units, to_units):
+    """Temperatures between 'metric' (°C) and 'imperial' (°F)"""
+    if from_units == to_units:
+        return col
+    if from_units == 'metric' and to_units == 'imperial':
+        return _affine(col, 9 / 5, 32.0)
+    if from_units == 'imperial' and to_units == 'metric':
+        return _affine(col, 5 / 9, -32 * 5 / 9)
+    raise ValueError(f"Unsupported units: {from_units} -> {to_units}")
+
+
+def convert_speed(col, from_units, to_units):
+    """Wind speeds between 'metric' (m/s) and 'imperial' (mph)"""
+    if from_units == to_units:
+        return col
+    if from_units == 'metric' and to_units == 'imperial':
+        return _affine(col, MPS_TO_MPH)
+    if from_units == 'imperial' and to_units == 'metric':
+        return _affine(col, 1 / MPS_TO_MPH)
+    raise ValueError(f"Unsupported units: {from_units} -> {to_units}")
+
+
+def fill_missing(col, fallback):
+    """col with its NaN entries taken from fallback"""
+    if isinstance(col, array):
+        return array('d', [f if v != v else v for v, f in zip(col, fallback)])
+    return np.where(np.isnan(col), fallback, col)
+
+
+def _apparent(t, h, w):
+    return t + 0.33 * (h / 100 * 6.105 * math.exp(17.27 * t / (237.7 + t))) - 0.70 * w - 4.00
+
+
+def _compass_point(degrees):
+    return COMPASS_POINTS[int(degrees % 360 / 22.5 + 0.5) % 16]
+
+
+def apparent_temperature(temp, humidity, wind_speed):
+    """Feels-like °C from °C, % and m/s (Steadman's apparent temperature, shade)"""
+    if isinstance(temp, array):
+        return array('d', map(_apparent, temp, humidity, wind_speed))
+    vapour = humidity / 100 * 6.105 * np.exp(17.27 * temp / (237.7 + temp))
+    return temp + 0.33 * vapour - 0.70 * wind_speed - 4.00
+
+
+def compass_labels(degrees):
+    """16-point compass label per wind direction ('N', 'NNE', ...), None where missing"""
+    if isinstance(degrees, array):
+        return [None if d != d else _compass_point(d) for d in degrees]
+    valid = ~np.isnan(degrees)
+    points = (np.floor(np.mod(np.where(valid, degrees, 0), 360) / 22.5 + 0.5).astype(int) % 16).tolist()
+    return [COMPASS_POINTS[p] if ok else None for p, ok in zip(points, valid.tolist())]
+
+
+def format_column(fmt, col):
+    """Apply a %-format to every value, None where missing"""
+    render = fmt.__mod__
+    return [None if v != v else render(v) for v in col.tolist()]
+
+
+def day_groups(times, offset=0):
+    """Split time-ordered timestamps into local days
+
+    Returns (dates, starts): 'YYYY-MM-DD' per day and the index of each
+    day's first timestamp, the segment layout reduce_days expects.
+    """
+    dates, starts = [], []
+    previous = None
+    for i, timestamp in enumerate(times):
+        day = (timestamp + offset) // 86400
+        if day != previous:
+            previous = day
+            dates.append(datetime.fromtimestamp(day * 86400, tz=timezone.utc).strftime('%Y-%m-%d'))
+            starts.append(i)
+    return dates, starts
+
+
+def reduce_days(col, starts, how):
+    """Per-day 'min', 'max' or 'mean' of a column, ignoring missing values
+
+    Days with no values give NaN.
+    """
+    if not starts:
+        return column([], vectorized=not isinstance(col, array))
+    if isinstance(col, array):
+        bounds = list(starts) + [len(col)]
+        result = array('d')
+        for start, end in zip(bounds, bounds[1:]):
+            values = [v for v in col[start:end] if v == v]
+            if not values:
+                result.append(MISSING)
+            elif how == 'min':
+                result.append(min(values))
+            elif how == 'max':
+                result.append(max(values))
+            else:
+                result.append(sum(values) / len(values))
+        return result
+
+    starts = np.asarray(starts)
+    if how == 'min':
+        return np.fmin.reduceat(col, starts)
+    if how == 'max':
+        return np.fmax.reduceat(col, starts)
+    present = ~np.isnan(col)
+    counts = np.add.reduceat(present.astype(float), starts)
+    totals = np.add.reduceat(np.where(present, col, 0.0), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, totals / counts, MISSING)
+
+
+def convert_entries(entries, from_units, to_units):
+    """Copies of OpenWeatherMap-shaped entries (current weather or forecast
+    slots) with their temperatures and wind speeds in to_units
+
+    Every field is converted as one column across all entries.
+    """
+    if from_units == to_units or not entries:
+        return list(entries)
+    vectorized = _vectorized(len(entries))
+    converted = {}
+    for group, fields, convert in (('main', TEMPERATURE_FIELDS, convert_temperature),
+                                   ('wind', SPEED_FIELDS, convert_speed)):
+        for field in fields:
+            values = column([entry.get(group, {}).get(field) for entry in entries], vectorized)
+            converted[group, field] = to_list(convert(values, from_units, to_units), 2)
+
+    result = []
+    for i, entry in enumerate(entries):
+        entry = dict(entry)
+        for group, fields in (('main', TEMPERATURE_FIELDS), ('wind', SPEED_FIELDS)):
+            if group in entry:
+                values = dict(entry[group])
+                for field in fields:
+                    if field in values and values[field] is not None:
+                        values[field] = converted[group, field][i]
+                entry[group] = values
+        result.append(entry)
+    return result
+
+
+def convert_weather(data, from_units, to_units):
+    """A current-weather or forecast document in another unit system"""
+    if not data or from_units == to_units:
+        return data
+    if 'list' in data:
+        return {**data, 'list': convert_entries(data['list'], from_units, to_units)}
+    return convert_entries([data], from_units, to_units)[0]
+
+
+def _current_row(data):
+    """Raw values of one current-weather document (KeyError/IndexError if malformed)"""
+    main, wind, sys = data['main'], data['wind'], data['sys']
+    weather = data['weather'][0]
+    return (
+        data['name'], sys.get('country'), data['coord']['lat'], data['coord']['lon'],
+        main['temp'], main.get('feels_like'),
+        main.get('temp_min', main['temp']), main.get('temp_max', main['temp']),
+        main['humidity'], main['pressure'],
+        wind['speed'], wind.get('deg', 0), wind.get('gust'),
+        data.get('visibility', 0), data['clouds']['all'],
+        weather['description'], weather['icon'],
+        sys['sunrise'], sys['sunset'], data.get('timezone', 0),
+    )
+
+
+def _local_clock(timestamp):
+    return time.strftime('%H:%M', time.localtime(timestamp))
+
+
+def _observed_at(data):
+    """When the observation was made, so the same document always formats the same"""
+    observed = data.get('dt')
+    moment = datetime.fromtimestamp(observed) if observed else datetime.now()
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _convert_scalar(value, convert, from_units, to_units):
+    if from_units == to_units:
+        return value
+    return convert(array('d', [value]), from_units, to_units)[0]
+
+
+def format_one(data, units='metric', emojis=None, include_raw=True):
+    """Display dict for one current-weather document, same fields as format_current
+
+    A single row skips the columnar setup, which costs more than it saves.
+    """
+    (name, country, lat, lon, temp, feels_like, temp_min, temp_max, humidity, pressure,
+     speed, degrees, gust, visibility, clouds, description, icon,
+     sunrise, sunset, offset) = _current_row(data)
+    labels = UNIT_LABELS[units]
+    temp_unit, speed_unit = labels['temp'], labels['speed']
+    if feels_like is None:
+        feels_like = _convert_scalar(_apparent(_convert_scalar(temp, convert_temperature, units, 'metric'), humidity,
+                                               _convert_scalar(speed, convert_speed, units, 'metric')),
+                                     convert_temperature, 'metric', units)
+
+    info = {
+        'location': ', '.join(part for part in (name, country) if part),
+        'coordinates': f"{lat:.2f}, {lon:.2f}",
+        'temperature': f"{temp:.1f}{temp_unit}",
+        'temp_min': f"{temp_min:.1f}{temp_unit}",
+        'temp_max': f"{temp_max:.1f}{temp_unit}",
+        'feels_like': f"{feels_like:.1f}{temp_unit}",
+        'description': description.title(),
+        'emoji': (emojis or {}).get(description.lower(), DEFAULT_EMOJI),
+        'humidity': f"{humidity:.0f}%",
+        'pressure': f"{pressure:.0f} hPa",
+        'wind_speed': f"{speed:.1f} {speed_unit}",
+        'wind_direction': f"{degrees:.0f}°",
+        'wind_compass': _compass_point(degrees),
+        'wind_gust': f"{gust:.1f} {speed_unit}" if gust is not None else None,
+        'visibility': f"{visibility / 1000:.1f} km",
+        'cloudiness': f"{clouds:.0f}%",
+        'icon': icon,
+        'sunrise': _local_clock(sunrise),
+        'sunset': _local_clock(sunset),
+        'timezone': offset,
+        'timestamp': _observed_at(data),
+    }
+    if include_raw:
+        info['raw_data'] = data  # Keep raw data for advanced processing
+    return info
+
+
+def format_current(docs, units='metric', views=None, emojis=None, include_raw=True):
+    """Display dicts for many current-weather documents in one pass
+
+    docs are in units; views lists the unit systems to produce (default
+    just units), so metric and imperial both come from one fetch.
+    Returns {view: [formatted dict or the exception for a malformed
+    document, ...]}. raw_data is only attached to the view matching the
+    documents' own units. feels_like is derived from temperature, humidity
+    and wind where the document lacks it.
+    """
+    views = tuple(views or (units,))
+    emojis = emojis or {}
+    rows, errors = [], {}
+    for i, data in enumerate(docs):
+        try:
+            rows.append(_current_row(data))
+        except (KeyError, IndexError, TypeError) as e:
+            errors[i] = e
+
+    results = {view: [] for view in views}
+    if rows:
+        (names, countries, lats, lons, temps, feels, lows, highs, humidity, pressure,
+         speeds, degrees, gusts, visibility, clouds, descriptions, icons,
+         sunrises, sunsets, offsets) = zip(*rows)
+        vectorized = _vectorized(len(rows))
+        columns = {
+            name: column(values, vectorized) for name, values in (
+                ('temp', temps), ('feels_like', feels), ('temp_min', lows), ('temp_max', highs),
+                ('speed', speeds), ('gust', gusts),
+            )
+        }
+        humidity_col, degrees_col = column(humidity, vectorized), column(degrees, vectorized)
+
+        # Missing feels-like values are derived in metric, then shown like the rest
+        temp_c = convert_temperature(columns['temp'], units, 'metric')
+        speed_ms = convert_speed(columns['speed'], units, 'metric')
+        derived = convert_temperature(apparent_temperature(temp_c, humidity_col, speed_ms), 'metric', units)
+        columns['feels_like'] = fill_missing(columns['feels_like'], derived)
+
+        # Unit-independent strings are built once and shared by every view
+        shared = {
+            'location': [', '.join(part for part in pair if part) for pair in zip(names, countries)],
+            'coordinates': ['%.2f, %.2f' % pair for pair in zip(lats, lons)],
+            'description': [d.title() for d in descriptions],
+            'emoji': [emojis.get(d.lower(), DEFAULT_EMOJI) for d in descriptions],
+            'humidity': format_column('%.0f%%', humidity_col),
+            'pressure': format_column('%.0f hPa', column(pressure, vectorized)),
+            'wind_direction': format_column('%.0f°', degrees_col),
+            'wind_compass': compass_labels(degrees_col),
+            'visibility': format_column('%.1f km', _affine(column(visibility, vectorized), 0.001)),
+            'cloudiness': format_column('%.0f%%', column(clouds, vectorized)),
+            'icon': list(icons),
+            'sunrise': [_local_clock(t) for t in sunrises],
+            'sunset': [_local_clock(t) for t in sunsets],
+            'timezone': list(offsets),
+        }
+        good_docs = [data for i, data in enumerate(docs) if i not in errors]
+
+        for view in views:
+            labels = UNIT_LABELS[view]
+            temp_fmt = '%.1f' + labels['temp']
+            speed_fmt = '%.1f ' + labels['speed']
+            strings = dict(shared)
+            for field in TEMPERATURE_FIELDS:
+                key = 'temperature' if field == 'temp' else field
+                strings[key] = format_column(temp_fmt, convert_temperature(columns[field], units, view))
+            strings['wind_speed'] = format_column(speed_fmt, convert_speed(columns['speed'], units, view))
+            strings['wind_gust'] = format_column(speed_fmt, convert_speed(columns['gust'], units, view))
+
+            formatted = [dict(zip(DISPLAY_FIELDS, values))
+                         for values in zip(*(strings[key] for key in DISPLAY_FIELDS))]
+            for info, data in zip(formatted, good_docs):
+                info['timestamp'] = _observed_at(data)
+                if include_raw and view == units:
+                    info['raw_data'] = data
+            results[view] = formatted
+
+    for view in views:
+        for i, error in sorted(errors.items()):
+            results[view].insert(i, error)
+    return results
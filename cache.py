@@ -0,0 +1,332 @@
+# Weather App - Response Cache
+# Keeps upstream weather responses around so repeat lookups skip the API
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from locations import location_key
+
+# How long each kind of upstream response stays fresh (seconds)
+DEFAULT_TTLS = {
+    'weather': 10 * 60,       # Current conditions change quickly
+    'forecast': 3 * 60 * 60,  # Forecasts are only updated every few hours
+    'forecast_compact': 3 * 60 * 60,
+    'air_quality': 30 * 60,
+    'geocode': 7 * 24 * 60 * 60,  # City coordinates practically never move
+}
+DEFAULT_TTL = 10 * 60
+# Expired entries stay servable (while being refreshed) for this many TTLs
+DEFAULT_STALE_FACTOR = 1.0
+DEFAULT_MAX_ENTRIES = 1024
+
+
+def make_cache_key(endpoint, location, units='metric'):
+    """Build a cache key from the endpoint, canonical location and units"""
+    return f"{endpoint}|{location_key(location)}|{units}"
+
+
+class MemoryCache:
+    """In-process LRU cache with per-entry expiry"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _read(self, key):
+        """Return (value, expires_at) while still within the stale window"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at, stale_until = entry
+        if stale_until <= time.time():
+            del self._entries[key]
+            return None
+
+        # Mark as most recently used
+        self._entries.move_to_end(key)
+        return value, expires_at
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired"""
+        with self._lock:
+            entry = self._read(key)
+            if entry is None or entry[1] <= time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def get_entry(self, key):
+        """Return (value, expires_at) even if expired but still servable as stale"""
+        with self._lock:
+            entry = self._read(key)
+            if entry is None:
+                self.misses += 1
+            elif entry[1] <= time.time():
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def peek(self, key):
+        """Like get_entry() but without touching the counters"""
+        with self._lock:
+            return self._read(key)
+
+    def set(self, key, value, ttl, stale_ttl=0):
+        """Store a value for ttl seconds (plus stale_ttl seconds servable as stale)"""
+        with self._lock:
+            expires_at = time.time() + ttl
+            self._entries[key] = (value, expires_at, expires_at + stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Remove a single entry"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return hit/miss/eviction counters"""
+        return {
+            'backend': 'memory',
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class SQLiteCache:
+    """File-backed LRU cache that several worker processes can share"""
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " stale_until REAL NOT NULL DEFAULT 0)"
+        )
+        try:
+            # Cache files created before stale-while-revalidate support
+            conn.execute("ALTER TABLE cache ADD COLUMN stale_until REAL NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)")
+        conn.commit()
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use (and after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _read(self, key, touch=True):
+        """Return (value, expires_at) while still within the stale window"""
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires_at, stale_until FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None:
+            return None
+        if max(row[1], row[2]) <= now:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return None
+
+        if touch:
+            conn.execute("UPDATE cache SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), row[1]
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired"""
+        entry = self._read(key)
+        if entry is None or entry[1] <= time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def get_entry(self, key):
+        """Return (value, expires_at) even if expired but still servable as stale"""
+        entry = self._read(key)
+        if entry is None:
+            self.misses += 1
+        elif entry[1] <= time.time():
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def peek(self, key):
+        """Like get_entry() but without touching the counters or LRU order"""
+        return self._read(key, touch=False)
+
+    def set(self, key, value, ttl, stale_ttl=0):
+        """Store a value for ttl seconds (plus stale_ttl seconds servable as stale)"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, last_used, stale_until)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl, now, now + ttl + stale_ttl)
+        )
+
+        overflow = len(self) - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY last_used LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
+
+    def delete(self, key):
+        """Remove a single entry"""
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        """Remove every entry"""
+        self._connect().execute("DELETE FROM cache")
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def stats(self):
+        """Return hit/miss/eviction counters (for this process)"""
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class ResponseCache:
+    """Caches upstream responses keyed on (endpoint, location, units)"""
+
+    def __init__(self, backend=None, ttls=None, stale_factor=DEFAULT_STALE_FACTOR):
+        self.backend = backend if backend is not None else MemoryCache()
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.stale_factor = stale_factor
+
+    def ttl_for(self, endpoint):
+        """Return the freshness lifetime for an endpoint"""
+        return self.ttls.get(endpoint, DEFAULT_TTL)
+
+    def stale_ttl_for(self, endpoint):
+        """How long past expiry an entry may still be served while it refreshes"""
+        return self.ttl_for(endpoint) * self.stale_factor
+
+    def get(self, endpoint, location, units='metric'):
+        """Look up a cached response"""
+        return self.backend.get(make_cache_key(endpoint, location, units))
+
+    def lookup(self, endpoint, location, units='metric'):
+        """Return (value, expires_at) for a fresh or still-servable stale response"""
+        return self.backend.get_entry(make_cache_key(endpoint, location, units))
+
+    def expires_at(self, endpoint, location, units='metric'):
+        """When a cached response expires (None if not cached); doesn't count as a hit"""
+        entry = self.backend.peek(make_cache_key(endpoint, location, units))
+        return entry[1] if entry else None
+
+    def set(self, endpoint, location, units, value, ttl=None):
+        """Store a response using the endpoint's TTL (or ttl seconds when given)"""
+        self.backend.set(
+            make_cache_key(endpoint, location, units), value,
+            self.ttl_for(endpoint) if ttl is None else ttl, self.stale_ttl_for(endpoint)
+        )
+
+    def get_or_fetch(self, endpoint, location, units, fetch):
+        """Return a cached response, calling fetch() and caching the result on a miss"""
+        value = self.get(endpoint, location, units)
+        if value is not None:
+            return value
+
+        value = fetch()
+        if value is not None:
+            self.set(endpoint, location, units, value)
+        return value
+
+    def clear(self):
+        """Remove every cached response"""
+        self.backend.clear()
+
+    def stats(self):
+        """Return cache counters and TTL settings"""
+        stats = self.backend.stats()
+        stats['ttls'] = dict(self.ttls)
+        stats['stale_factor'] = self.stale_factor
+        return stats
+
+
+def create_cache_from_env():
+    """Build a ResponseCache from WEATHER_CACHE_* environment variables
+
+    WEATHER_CACHE_PATH     - SQLite file to share the cache between workers
+    WEATHER_CACHE_SIZE     - maximum number of cached responses
+    WEATHER_CACHE_TTL_WEATHER / WEATHER_CACHE_TTL_FORECAST - TTLs in seconds
+    WEATHER_CACHE_STALE_FACTOR - how many TTLs an expired entry stays servable
+    """
+    max_entries = int(os.getenv('WEATHER_CACHE_SIZE', DEFAULT_MAX_ENTRIES))
+    path = os.getenv('WEATHER_CACHE_PATH')
+
+    if path:
+        backend = SQLiteCache(path, max_entries=max_entries)
+    else:
+        backend = MemoryCache(max_entries=max_entries)
+
+    ttls = {}
+    for endpoint in DEFAULT_TTLS:
+        value = os.getenv(f'WEATHER_CACHE_TTL_{endpoint.upper()}')
+        if value:
+            ttls[endpoint] = int(value)
+
+    stale_factor = float(os.getenv('WEATHER_CACHE_STALE_FACTOR', DEFAULT_STALE_FACTOR))
+    return ResponseCache(backend, ttls, stale_factor)
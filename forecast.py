@@ -0,0 +1,95 @@
+# Weather App - Forecast Reshaping
+# Turns the 40-slot OpenWeatherMap forecast into compact parallel arrays
+
+from collections import Counter
+
+from bulk_format import (apparent_temperature, column, compass_labels, convert_speed,
+                         convert_temperature, day_groups, fill_missing, reduce_days, to_list)
+
+# Columns pulled out of every 3-hour forecast slot
+SLOT_FIELDS = {
+    'temp': lambda s: s['main']['temp'],
+    'feels_like': lambda s: s['main'].get('feels_like'),
+    'humidity': lambda s: s['main'].get('humidity'),
+    'pressure': lambda s: s['main'].get('pressure'),
+    'wind_speed': lambda s: s.get('wind', {}).get('speed'),
+    'wind_deg': lambda s: s.get('wind', {}).get('deg'),
+    'clouds': lambda s: s.get('clouds', {}).get('all'),
+    'pop': lambda s: s.get('pop', 0),
+    'description': lambda s: s['weather'][0]['description'] if s.get('weather') else None,
+    'icon': lambda s: s['weather'][0]['icon'] if s.get('weather') else None,
+}
+
+
+def to_columnar(forecast, units='metric'):
+    """Reshape a raw forecast response into {'city', 'times', <field>: [...]}
+
+    Each field becomes one list with a value per time slot, so the payload
+    has no repeated keys or nested objects. Missing feels-like values are
+    derived from temperature, humidity and wind, and wind_dir holds a
+    compass label per slot.
+    """
+    slots = forecast.get('list', [])
+    city = forecast.get('city', {})
+    columns = {
+        'city': {
+            'name': city.get('name'),
+            'country': city.get('country'),
+            'lat': city.get('coord', {}).get('lat'),
+            'lon': city.get('coord', {}).get('lon'),
+            'timezone': city.get('timezone', 0),
+        },
+        'times': [slot['dt'] for slot in slots],
+    }
+    for field, extract in SLOT_FIELDS.items():
+        columns[field] = [extract(slot) for slot in slots]
+
+    if None in columns['feels_like']:
+        temp_c = convert_temperature(column(columns['temp']), units, 'metric')
+        wind_ms = convert_speed(column(columns['wind_speed']), units, 'metric')
+        derived = apparent_temperature(temp_c, column(columns['humidity']), wind_ms)
+        columns['feels_like'] = to_list(fill_missing(
+            column(columns['feels_like']), convert_temperature(derived, 'metric', units)), 2)
+    columns['wind_dir'] = compass_labels(column(columns['wind_deg']))
+    return columns
+
+
+def _most_common(values, starts):
+    """Most frequent value per day segment"""
+    bounds = list(starts) + [len(values)]
+    return [Counter(values[start:end]).most_common(1)[0][0] for start, end in zip(bounds, bounds[1:])]
+
+
+def daily_summary(columns):
+    """Aggregate columnar slots into one row per local calendar day
+
+    Slots are time-ordered, so each day is one contiguous segment and
+    every statistic is a single reduction over a column.
+    """
+    offset = columns['city'].get('timezone') or 0
+    dates, starts = day_groups(columns['times'], offset)
+
+    temp = column(columns['temp'])
+    feels_like = column(columns['feels_like'])
+    wind_speed = column(columns['wind_speed'])
+    return {
+        'city': columns['city'],
+        'dates': dates,
+        'temp_min': to_list(reduce_days(temp, starts, 'min')),
+        'temp_max': to_list(reduce_days(temp, starts, 'max')),
+        'temp_mean': to_list(reduce_days(temp, starts, 'mean'), 1),
+        'feels_like_min': to_list(reduce_days(feels_like, starts, 'min')),
+        'feels_like_max': to_list(reduce_days(feels_like, starts, 'max')),
+        'humidity_mean': to_list(reduce_days(column(columns['humidity']), starts, 'mean'), 1),
+        'wind_speed_max': to_list(reduce_days(wind_speed, starts, 'max')),
+        'pop_max': to_list(reduce_days(column([p or 0 for p in columns['pop']]), starts, 'max')),
+        # The most frequent condition describes the day best
+        'description': _most_common(columns['description'], starts),
+        'icon': _most_common(columns['icon'], starts),
+    }
+
+
+def compact_forecast(forecast, units='metric'):
+    """Build the cacheable compact form: columnar slots plus the daily summary"""
+    slots = to_columnar(forecast, units)
+    return {'slots': slots, 'daily': daily_summary(slots)}
@@ -0,0 +1,336 @@
+# Weather App - Offline City Gazetteer
+# Resolves city names to coordinates locally, without a geocoding API call
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import unicodedata
+
+BUNDLED_CITIES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cities.tsv')
+
+INDEX_MAGIC = b'GAZ1'
+INDEX_VERSION = 1
+_HEADER = struct.Struct('<4sII')  # magic, version, record count
+
+# Qualifier names -> ISO country codes (codes themselves are always accepted)
+COUNTRY_CODES = {
+    'argentina': 'AR', 'australia': 'AU', 'austria': 'AT', 'bangladesh': 'BD',
+    'belgium': 'BE', 'brazil': 'BR', 'canada': 'CA', 'chile': 'CL', 'china': 'CN',
+    'colombia': 'CO', 'czech republic': 'CZ', 'czechia': 'CZ', 'denmark': 'DK',
+    'egypt': 'EG', 'england': 'GB', 'finland': 'FI', 'france': 'FR', 'germany': 'DE',
+    'great britain': 'GB', 'greece': 'GR', 'hong kong': 'HK', 'hungary': 'HU',
+    'india': 'IN', 'indonesia': 'ID', 'ireland': 'IE', 'italy': 'IT', 'japan': 'JP',
+    'kenya': 'KE', 'mexico': 'MX', 'netherlands': 'NL', 'new zealand': 'NZ',
+    'nigeria': 'NG', 'norway': 'NO', 'pakistan': 'PK', 'peru': 'PE',
+    'philippines': 'PH', 'poland': 'PL', 'portugal': 'PT', 'russia': 'RU',
+    'scotland': 'GB', 'singapore': 'SG', 'south africa': 'ZA', 'south korea': 'KR',
+    'korea': 'KR', 'spain': 'ES', 'sweden': 'SE', 'switzerland': 'CH',
+    'thailand': 'TH', 'turkey': 'TR', 'turkiye': 'TR', 'uae': 'AE',
+    'united arab emirates': 'AE', 'uk': 'GB', 'united kingdom': 'GB',
+    'ukraine': 'UA', 'united states': 'US', 'united states of america': 'US',
+    'usa': 'US', 'america': 'US',
+}
+
+US_STATES = {
+    'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas',
+    'CA': 'California', 'CO': 'Colorado', 'CT': 'Connecticut', 'DE': 'Delaware',
+    'DC': 'District of Columbia', 'FL': 'Florida', 'GA': 'Georgia', 'HI': 'Hawaii',
+    'ID': 'Idaho', 'IL': 'Illinois', 'IN': 'Indiana', 'IA': 'Iowa', 'KS': 'Kansas',
+    'KY': 'Kentucky', 'LA': 'Louisiana', 'ME': 'Maine', 'MD': 'Maryland',
+    'MA': 'Massachusetts', 'MI': 'Michigan', 'MN': 'Minnesota', 'MS': 'Mississippi',
+    'MO': 'Missouri', 'MT': 'Montana', 'NE': 'Nebraska', 'NV': 'Nevada',
+    'NH': 'New Hampshire', 'NJ': 'New Jersey', 'NM': 'New Mexico', 'NY': 'New York',
+    'NC': 'North Carolina', 'ND': 'North Dakota', 'OH': 'Ohio', 'OK': 'Oklahoma',
+    'OR': 'Oregon', 'PA': 'Pennsylvania', 'RI': 'Rhode Island', 'SC': 'South Carolina',
+    'SD': 'South Dakota', 'TN': 'Tennessee', 'TX': 'Texas', 'UT': 'Utah',
+    'VT': 'Vermont', 'VA': 'Virginia', 'WA': 'Washington', 'WV': 'West Virginia',
+    'WI': 'Wisconsin', 'WY': 'Wyoming',
+}
+_STATE_CODES = {name.lower(): code for code, name in US_STATES.items()}
+
+
+def normalize_name(name):
+    """Fold a place name to its lookup key: no accents, lower case, single spaces"""
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    cleaned = stripped.casefold().replace('.', '').replace("'", '').replace('-', ' ')
+    return ' '.join(cleaned.split())
+
+
+def parse_qualifier(qualifier):
+    """Turn a 'Country' or 'State' qualifier into (country_code, state_code)"""
+    if not qualifier:
+        return None, None
+
+    text = normalize_name(qualifier)
+    upper = text.upper()
+    if text in _STATE_CODES:
+        return None, _STATE_CODES[text]
+    if text in COUNTRY_CODES:
+        return COUNTRY_CODES[text], None
+    if len(upper) == 2:
+        # Two letters could be a country (FR) or a US state (IL); let the
+        # lookup try both
+        return upper, upper if upper in US_STATES else None
+    return None, None
+
+
+def _fits_qualifier(record, country, state):
+    """Whether a record satisfies a parsed qualifier"""
+    if country is None and state is None:
+        return True
+    if state is not None and record['country'] == 'US' and record['state_code'] == state:
+        return True
+    return country is not None and record['country'] == country
+
+
+def qualifier_filter(qualifier):
+    """Predicate for records fitting a qualifier that may still be half typed
+
+    A complete country or state ('IL', 'France') matches the way exact
+    lookups match it; anything else is taken as the start of a country
+    or US state code.
+    """
+    country, state = parse_qualifier(qualifier)
+    if country is not None or state is not None:
+        return lambda record: _fits_qualifier(record, country, state)
+    typed = normalize_name(qualifier or '').upper()
+    if not typed:
+        return lambda record: True
+    return lambda record: (record['country'].startswith(typed)
+                           or (record['country'] == 'US' and (record['state_code'] or '').startswith(typed)))
+
+
+def build_index(source_path, index_path):
+    """Compile a GeoNames-style dump into a sorted, memory-mappable index file
+
+    Each name and alternate name becomes one record:
+        key \\t name \\t country \\t admin1 \\t lat \\t lon \\t population \\n
+    The file starts with a header and an array of uint32 record offsets in
+    key order, so lookups can binary search the mapped file directly.
+    """
+    records = []
+    with open(source_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) < 15 or not cols[1]:
+                continue
+
+            name, ascii_name, alternates = cols[1], cols[2], cols[3]
+            lat, lon, country, admin1 = cols[4], cols[5], cols[8], cols[10]
+            population = cols[14] or '0'
+
+            keys = {normalize_name(name), normalize_name(ascii_name)}
+            keys.update(normalize_name(alt) for alt in alternates.split(',') if alt)
+            keys.discard('')
+
+            payload = '\t'.join([name, country, admin1, lat, lon, population])
+            for key in keys:
+                records.append(f"{key}\t{payload}\n".encode('utf-8'))
+
+    # Byte order of UTF-8 matches code point order, so the mapped file can
+    # be searched with plain bytes comparisons
+    records.sort()
+
+    offsets = []
+    position = 0
+    for record in records:
+        offsets.append(position)
+        position += len(record)
+
+    directory = os.path.dirname(index_path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as out:
+        out.write(_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(records)))
+        out.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        out.writelines(records)
+    # Atomic so concurrent workers never map a half-written index
+    os.replace(tmp_path, index_path)
+    return len(records)
+
+
+def _default_index_path(source_path):
+    """Put the index next to the dump, or in the temp dir if that isn't writable"""
+    directory = os.path.dirname(os.path.abspath(source_path))
+    if os.access(directory, os.W_OK):
+        return source_path + '.idx'
+    return os.path.join(tempfile.gettempdir(), os.path.basename(source_path) + '.idx')
+
+
+class CityIndex:
+    """Memory-mapped city lookup by normalized name with optional country/state"""
+
+    def __init__(self, source_path=BUNDLED_CITIES, index_path=None):
+        self.source_path = source_path
+        self.index_path = index_path or _default_index_path(source_path)
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._offsets = None
+        self._data_start = 0
+        self.count = 0
+
+    def load(self):
+        """Build the index if it's missing or stale, then map it into memory"""
+        if self._mmap is not None:
+            return self
+
+        with self._lock:
+            if self._mmap is not None:
+                return self
+
+            if (not os.path.exists(self.index_path) or
+                    os.path.getmtime(self.index_path) < os.path.getmtime(self.source_path)):
+                build_index(self.source_path, self.index_path)
+
+            mapped = self._map_index()
+            magic, version, count = _HEADER.unpack_from(mapped, 0)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                # Index left over from an older format; rebuild it once
+                mapped.close()
+                build_index(self.source_path, self.index_path)
+                mapped = self._map_index()
+                magic, version, count = _HEADER.unpack_from(mapped, 0)
+
+            offsets_end = _HEADER.size + 4 * count
+            self._offsets = memoryview(mapped)[_HEADER.size:offsets_end].cast('I')
+            self._data_start = offsets_end
+            self.count = count
+            self._mmap = mapped
+        return self
+
+    def _map_index(self):
+        """Map the index file read-only"""
+        with open(self.index_path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _key_at(self, i):
+        """Return the raw key bytes of record i"""
+        start = self._data_start + self._offsets[i]
+        return self._mmap[start:self._mmap.find(b'\t', start)]
+
+    def _record_at(self, i):
+        """Decode record i into a geocode-style dict"""
+        start = self._data_start + self._offsets[i]
+        end = self._mmap.find(b'\n', start)
+        _, name, country, admin1, lat, lon, population = \
+            self._mmap[start:end].decode('utf-8').split('\t')
+        return {
+            'name': name,
+            'lat': float(lat),
+            'lon': float(lon),
+            'country': country,
+            'state': US_STATES.get(admin1, admin1) if country == 'US' else admin1,
+            'state_code': admin1,
+            'population': int(population),
+            'source': 'gazetteer',
+        }
+
+    def _lower_bound(self, key):
+        """Index of the first record whose key is >= key"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup_all(self, name, qualifier=None):
+        """Return every exact match for a name, most populous first"""
+        self.load()
+        key = normalize_name(name).encode('utf-8')
+        if not key:
+            return []
+
+        country, state = parse_qualifier(qualifier)
+        matches = []
+        i = self._lower_bound(key)
+        while i < self.count and self._key_at(i) == key:
+            record = self._record_at(i)
+            if _fits_qualifier(record, country, state):
+                matches.append(record)
+            i += 1
+
+        matches.sort(key=lambda r: r['population'], reverse=True)
+        return matches
+
+    def lookup(self, name, qualifier=None):
+        """Return the best exact match for a name, or None"""
+        matches = self.lookup_all(name, qualifier)
+        return matches[0] if matches else None
+
+    def resolve(self, location):
+        """Resolve a 'City' or 'City, Country/State' string, or return None"""
+        name, _, qualifier = location.partition(',')
+        return self.lookup(name, qualifier.strip() or None)
+
+    def prefix(self, prefix, limit=10, scan_limit=2000):
+        """Return up to limit cities whose key starts with prefix, most populous first
+
+        A ', Country/State' qualifier narrows the matches the way it does
+        for resolve(). At most scan_limit index entries are examined so very
+        short prefixes stay cheap on large dumps.
+        """
+        self.load()
+        name, _, qualifier = prefix.partition(',')
+        key = normalize_name(name).encode('utf-8')
+        if not key:
+            return []
+        fits = qualifier_filter(qualifier)
+
+        seen = set()
+        matches = []
+        i = self._lower_bound(key)
+        end = min(self.count, i + scan_limit)
+        while i < end and self._key_at(i).startswith(key):
+            record = self._record_at(i)
+            identity = (record['name'], record['country'], record['state_code'])
+            if identity not in seen and fits(record):
+                seen.add(identity)
+                matches.append(record)
+            i += 1
+
+        matches.sort(key=lambda r: r['population'], reverse=True)
+        return matches[:limit]
+
+    def iter_entries(self):
+        """Yield (key, record) for every index entry in key order"""
+        self.load()
+        for i in range(self.count):
+            yield self._key_at(i).decode('utf-8'), self._record_at(i)
+
+    def __contains__(self, location):
+        return self.resolve(location) is not None
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Return the shared CityIndex (not loaded until first lookup)
+
+    WEATHER_GAZETTEER_PATH - GeoNames-style dump to use instead of the bundled list
+    WEATHER_GAZETTEER_INDEX - where to write the compiled index
+    """
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = CityIndex(
+                    os.getenv('WEATHER_GAZETTEER_PATH', BUNDLED_CITIES),
+                    os.getenv('WEATHER_GAZETTEER_INDEX') or None
+                )
+    return _gazetteer
+
+
+def gazetteer_is_authoritative():
+    """Whether unknown names may be rejected without asking the upstream API
+
+    Only true when the operator opts in with WEATHER_GAZETTEER_STRICT=1,
+    which only makes sense with a full (not the bundled sample) dump.
+    """
+    return os.getenv('WEATHER_GAZETTEER_STRICT', '').lower() in ('1', 'true', 'yes')
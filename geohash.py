@@ -0,0 +1,148 @@
+# Weather App - Geohash and Station Index
+# Snaps nearby coordinates to one bucket and finds the closest known station
+
+import math
+import os
+import threading
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {ch: i for i, ch in enumerate(BASE32)}
+
+# 6 characters is a cell of about 1.2 km x 0.6 km
+DEFAULT_PRECISION = 6
+# Stations are bucketed at this precision (about 39 km x 20 km cells)
+INDEX_PRECISION = 4
+MAX_STATIONS = 50000
+EARTH_RADIUS_KM = 6371.0
+
+
+def encode(lat, lon, precision=DEFAULT_PRECISION):
+    """Geohash of a point, precision characters long"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def bounds(geohash):
+    """(min_lat, min_lon, max_lat, max_lon) of a geohash cell"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for ch in geohash:
+        value = _DECODE.get(ch)
+        if value is None:
+            raise ValueError(f"Invalid geohash character: {ch!r}")
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def decode(geohash):
+    """Center (lat, lon) of a geohash cell"""
+    min_lat, min_lon, max_lat, max_lon = bounds(geohash)
+    return (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+
+
+def neighbors(geohash):
+    """The cell itself and the (up to) eight cells around it"""
+    min_lat, min_lon, max_lat, max_lon = bounds(geohash)
+    height, width = max_lat - min_lat, max_lon - min_lon
+    lat, lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+    cells = []
+    for d_lat in (-height, 0, height):
+        for d_lon in (-width, 0, width):
+            n_lat = lat + d_lat
+            if -90 <= n_lat <= 90:
+                n_lon = (lon + d_lon + 180) % 360 - 180
+                cell = encode(n_lat, n_lon, len(geohash))
+                if cell not in cells:
+                    cells.append(cell)
+    return cells
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    d_lat, d_lon = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def get_precision():
+    """Bucket precision from WEATHER_GEOHASH_PRECISION (1-12, default 6)"""
+    return max(1, min(12, int(os.getenv('WEATHER_GEOHASH_PRECISION', DEFAULT_PRECISION))))
+
+
+class StationIndex:
+    """Grid index of weather stations seen in upstream responses
+
+    Stations are bucketed by a coarse geohash; a nearest query only looks
+    at the query's cell and its eight neighbours, so it costs the same
+    however many stations are indexed. Each station remembers the cache
+    location key its observation was stored under.
+    """
+
+    def __init__(self, precision=INDEX_PRECISION, max_stations=MAX_STATIONS):
+        self.precision = precision
+        self.max_stations = max_stations
+        self._cells = {}        # geohash -> {station id: station}
+        self._stations = {}     # station id -> cell
+        self._lock = threading.Lock()
+
+    def add(self, data, location, units):
+        """Index the station of a current-weather response"""
+        coord = data.get('coord') or {}
+        if 'lat' not in coord or 'lon' not in coord:
+            return
+        lat, lon = float(coord['lat']), float(coord['lon'])
+        station_id = data.get('id') or f"{lat:.4f},{lon:.4f}"
+        cell = encode(lat, lon, self.precision)
+
+        with self._lock:
+            old_cell = self._stations.get(station_id)
+            if old_cell is None and len(self._stations) >= self.max_stations:
+                return
+            station = self._cells.get(old_cell, {}).get(station_id) if old_cell else None
+            if station is None:
+                station = {'id': station_id, 'locations': {}}
+            station.update(lat=lat, lon=lon, name=data.get('name'),
+                           country=(data.get('sys') or {}).get('country'), observed=data.get('dt'))
+            station['locations'][units] = location
+            if old_cell and old_cell != cell:
+                self._cells[old_cell].pop(station_id, None)
+            self._cells.setdefault(cell, {})[station_id] = station
+            self._stations[station_id] = cell
+
+    def nearest(self, lat, lon, limit=1, max_distance_km=None):
+        """Return up to limit (distance_km, station) pairs, closest first"""
+        found = []
+        with self._lock:
+            for cell in neighbors(encode(lat, lon, self.precision)):
+                for station in self._cells.get(cell, {}).values():
+                    distance = distance_km(lat, lon, station['lat'], station['lon'])
+                    if max_distance_km is None or distance <= max_distance_km:
+                        found.append((distance, dict(station, locations=dict(station['locations']))))
+        found.sort(key=lambda item: item[0])
+        return found[:limit]
+
+    def __len__(self):
+        return len(self._stations)
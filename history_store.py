@@ -0,0 +1,201 @@
+# Weather App - Observation History
+# Append-only SQLite store of every real observation we fetch
+
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from locations import location_key
+
+# Relative paths resolve against WEATHER_DATA_DIR, else the app directory,
+# so the database doesn't move with the working directory
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HISTORY_PATH = 'weather_history.db'
+
+RESOLUTIONS = {
+    'raw': None,
+    'hourly': 3600,
+    'daily': 86400,
+}
+
+# Everything is stored metric; these convert imperial input on the way in
+_MPH_TO_MS = 0.44704
+
+
+def normalize_location(location):
+    """Key observations are stored under (the canonical location key)"""
+    return location_key(location)
+
+
+def data_path(path):
+    """Resolve a data file path against WEATHER_DATA_DIR (default: the app directory)"""
+    return os.path.join(os.getenv('WEATHER_DATA_DIR') or APP_DIR, os.path.expanduser(path))
+
+
+def _to_celsius(value):
+    return None if value is None else (value - 32) * 5 / 9
+
+
+def _from_celsius(value):
+    return None if value is None else value * 9 / 5 + 32
+
+
+class HistoryStore:
+    """Time-series of observations keyed on (location, timestamp)
+
+    The table is clustered on its primary key (WITHOUT ROWID), so a range
+    query for one location reads one contiguous slice of the B-tree.
+    The file is created on the first write; reads before that find nothing.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = data_path(path)
+        self._local = threading.local()
+        self.recorded = 0
+
+    def _exists(self):
+        return os.path.exists(self.path)
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use (and after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_table(conn)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _create_table(conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS observations ("
+            " location TEXT NOT NULL,"
+            " ts INTEGER NOT NULL,"
+            " temp REAL,"
+            " feels_like REAL,"
+            " humidity REAL,"
+            " pressure REAL,"
+            " wind_speed REAL,"
+            " clouds REAL,"
+            " condition TEXT,"
+            " PRIMARY KEY (location, ts)"
+            ") WITHOUT ROWID"
+        )
+
+    def record(self, location, data, units='metric'):
+        """Append one current-weather response; repeated observations are ignored"""
+        main = data.get('main', {})
+        temp, feels_like = main.get('temp'), main.get('feels_like')
+        wind_speed = data.get('wind', {}).get('speed')
+        if units == 'imperial':
+            temp, feels_like = _to_celsius(temp), _to_celsius(feels_like)
+            wind_speed = None if wind_speed is None else wind_speed * _MPH_TO_MS
+
+        weather = data.get('weather') or [{}]
+        self._connect().execute(
+            "INSERT OR IGNORE INTO observations"
+            " (location, ts, temp, feels_like, humidity, pressure, wind_speed, clouds, condition)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                normalize_location(location),
+                int(data.get('dt') or time.time()),
+                temp, feels_like,
+                main.get('humidity'), main.get('pressure'),
+                wind_speed,
+                data.get('clouds', {}).get('all'),
+                weather[0].get('description', '').title() or None,
+            )
+        )
+        self.recorded += 1
+
+    def query(self, location, start, end, resolution='daily', units='metric'):
+        """Return observations for a location between two Unix timestamps
+
+        resolution is 'raw', 'hourly' or 'daily'; aggregated rows carry the
+        mean/min/max temperature, mean humidity and most common condition.
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"resolution must be one of {', '.join(RESOLUTIONS)}")
+
+        if not self._exists():
+            return []
+        key = normalize_location(location)
+        conn = self._connect()
+        convert = _from_celsius if units == 'imperial' else (lambda v: v)
+        bucket = RESOLUTIONS[resolution]
+
+        if bucket is None:
+            rows = conn.execute(
+                "SELECT ts, temp, feels_like, humidity, pressure, wind_speed, clouds, condition"
+                " FROM observations WHERE location = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                (key, start, end)
+            ).fetchall()
+            return [{
+                'timestamp': ts,
+                'date': datetime.fromtimestamp(ts, tz=timezone.utc).strftime('%Y-%m-%d %H:%M'),
+                'temperature': _round(convert(temp)),
+                'feels_like': _round(convert(feels_like)),
+                'humidity': humidity,
+                'pressure': pressure,
+                'wind_speed': wind_speed,
+                'clouds': clouds,
+                'condition': condition,
+            } for ts, temp, feels_like, humidity, pressure, wind_speed, clouds, condition in rows]
+
+        rows = conn.execute(
+            "SELECT ts / ? AS b, AVG(temp), MIN(temp), MAX(temp), AVG(humidity), COUNT(*)"
+            " FROM observations WHERE location = ? AND ts BETWEEN ? AND ?"
+            " GROUP BY b ORDER BY b",
+            (bucket, key, start, end)
+        ).fetchall()
+
+        conditions = defaultdict(Counter)
+        for b, condition, count in conn.execute(
+            "SELECT ts / ? AS b, condition, COUNT(*) FROM observations"
+            " WHERE location = ? AND ts BETWEEN ? AND ? GROUP BY b, condition",
+            (bucket, key, start, end)
+        ):
+            conditions[b][condition] = count
+
+        date_format = '%Y-%m-%d' if resolution == 'daily' else '%Y-%m-%d %H:00'
+        return [{
+            'timestamp': b * bucket,
+            'date': datetime.fromtimestamp(b * bucket, tz=timezone.utc).strftime(date_format),
+            'temperature': _round(convert(mean)),
+            'temp_min': _round(convert(low)),
+            'temp_max': _round(convert(high)),
+            'humidity': _round(humidity),
+            'condition': conditions[b].most_common(1)[0][0] if conditions[b] else None,
+            'samples': samples,
+        } for b, mean, low, high, humidity, samples in rows]
+
+    def stats(self):
+        """Return store size and write counter"""
+        count = 0
+        if self._exists():
+            count = self._connect().execute("SELECT COUNT(*) FROM observations").fetchone()[0]
+        return {'path': self.path, 'observations': count, 'recorded': self.recorded}
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
+
+
+def create_history_from_env():
+    """Build the HistoryStore, or None when disabled
+
+    WEATHER_HISTORY_PATH    - SQLite file for observations (default weather_history.db);
+                              relative paths resolve against WEATHER_DATA_DIR,
+                              else the app directory
+    WEATHER_HISTORY_ENABLED - set to 0 to stop recording
+    """
+    if os.getenv('WEATHER_HISTORY_ENABLED', '1').lower() in ('0', 'false', 'no'):
+        return None
+    return HistoryStore(os.getenv('WEATHER_HISTORY_PATH', DEFAULT_HISTORY_PATH))
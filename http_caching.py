@@ -0,0 +1,130 @@
+# Weather App - HTTP Caching and Compression
+# ETags, conditional GET and cached gzip/brotli bodies for Flask responses
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_COMPRESS_SIZE = 500         # Smaller bodies aren't worth the CPU
+MAX_COMPRESSED_BODIES = 512
+COMPRESSIBLE_TYPES = ('application/json', 'text/javascript', 'application/javascript',
+                      'text/css', 'text/html')
+ENCODING_SUFFIXES = ('-br', '-gzip')
+
+
+def make_etag(*parts):
+    """Strong ETag value derived from whatever identifies a representation"""
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()[:20]
+
+
+def etag_matches(request, etag):
+    """Whether If-None-Match names this ETag (in any of our encodings)"""
+    if not request.if_none_match:
+        return False
+    return any(request.if_none_match.contains(etag + suffix)
+               for suffix in ('',) + ENCODING_SUFFIXES)
+
+
+def not_modified(etag, max_age=0):
+    """Empty 304 response carrying the validators"""
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+class CompressedBodyCache:
+    """LRU of compressed bodies keyed on (ETag, encoding)"""
+
+    def __init__(self, max_entries=MAX_COMPRESSED_BODIES):
+        self.max_entries = max_entries
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compress(self, etag, encoding, body):
+        """Return the compressed body, compressing it only the first time"""
+        key = (etag, encoding)
+        with self._lock:
+            cached = self._bodies.get(key)
+            if cached is not None:
+                self._bodies.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        if encoding == 'br':
+            compressed = brotli.compress(body, quality=5)
+        else:
+            compressed = gzip.compress(body, compresslevel=6)
+
+        with self._lock:
+            self._bodies[key] = compressed
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+        return compressed
+
+    def stats(self):
+        """Return hit/miss counters"""
+        return {'entries': len(self._bodies), 'hits': self.hits, 'misses': self.misses}
+
+
+compressed_bodies = CompressedBodyCache()
+
+
+def _choose_encoding(request):
+    """Best encoding the client accepts, or None"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def finalize_response(request, response):
+    """Add ETag/conditional handling and compression to a successful GET
+
+    Routes that know their data version set their own ETag and
+    Cache-Control first; anything else gets a body-hash ETag and must
+    revalidate. Compressed bodies are cached per ETag and encoding, and
+    the ETag gets an encoding suffix so each representation stays distinct.
+    """
+    if request.method != 'GET' or response.status_code != 200:
+        return response
+    if response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers:
+        return response
+
+    response.direct_passthrough = False
+    body = response.get_data()
+
+    etag, _ = response.get_etag()
+    if etag is None:
+        etag = hashlib.sha1(body).hexdigest()[:20]
+        response.set_etag(etag)
+        if not response.cache_control.max_age:
+            response.cache_control.no_cache = True
+
+    if etag_matches(request, etag):
+        return not_modified(etag, response.cache_control.max_age or 0)
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding(request)
+    if encoding is None or len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    response.set_data(compressed_bodies.get_or_compress(etag, encoding, body))
+    response.headers['Content-Encoding'] = encoding
+    response.set_etag(f"{etag}-{encoding}")
+    return response
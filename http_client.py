@@ -0,0 +1,137 @@
+# Weather App - HTTP Client
+# One pooled, keep-alive session shared by every upstream call
+
+import os
+import random
+import threading
+
+DEFAULT_POOL_SIZE = 20
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.3
+DEFAULT_BACKOFF_JITTER = 0.2
+# Longest wait before a retry, whatever the upstream's Retry-After asks for
+MAX_RETRY_DELAY = 5.0
+
+# Upstream statuses worth retrying: server-side trouble. A 429 isn't
+# retried; the caller raises QuotaExceeded and serves stale data instead.
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _make_retry(retries, backoff, jitter):
+    """Build a urllib3 Retry policy for connection failures, with jittered backoff
+
+    Only requests that never reached the upstream are retried here. Retries
+    on 5xx answers are made by WeatherService._upstream_get, which charges
+    each one to the quota.
+    """
+    from urllib3.util.retry import Retry
+
+    options = {
+        'total': retries,
+        'connect': retries,
+        'read': 0,
+        'status': 0,
+        'backoff_factor': backoff,
+        'backoff_max': MAX_RETRY_DELAY,
+        'allowed_methods': frozenset(['GET', 'HEAD']),
+        'respect_retry_after_header': False,
+        # Let the caller see the final response and raise_for_status() on it
+        'raise_on_status': False,
+    }
+    try:
+        return Retry(backoff_jitter=jitter, **options)
+    except TypeError:
+        # urllib3 < 2.0 has no jitter support (nor backoff_max, fixed at 120s)
+        options.pop('backoff_max')
+        return Retry(**options)
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES,
+                   backoff=DEFAULT_BACKOFF, jitter=DEFAULT_BACKOFF_JITTER):
+    """Create a requests session with a bounded keep-alive pool and retries
+
+    pool_size is the number of connections kept open per upstream host.
+    The underlying urllib3 pool is thread-safe, so one session can serve
+    every worker thread. requests is imported here rather than at module
+    load so a cold process only pays for it once it calls the upstream.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=8,        # Number of distinct hosts to keep pools for
+        pool_maxsize=pool_size,    # Keep-alive connections per host
+        max_retries=_make_retry(retries, backoff, jitter),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'Accept': 'application/json',
+        'Connection': 'keep-alive',
+        'User-Agent': 'WeatherApp/1.0',
+    })
+    return session
+
+
+def backoff_delay(attempt, backoff=DEFAULT_BACKOFF, jitter=DEFAULT_BACKOFF_JITTER):
+    """Seconds to wait before retry number attempt (0-based), with jitter"""
+    return backoff * (2 ** attempt) + random.uniform(0, jitter)
+
+
+def retry_delay(retry_after, attempt, backoff=DEFAULT_BACKOFF):
+    """Seconds to wait before a retry: the upstream's Retry-After (capped), else our backoff"""
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), MAX_RETRY_DELAY)
+    return min(backoff_delay(attempt, backoff), MAX_RETRY_DELAY)
+
+
+def get_retries():
+    """Retries per upstream call (WEATHER_HTTP_RETRIES)"""
+    return int(os.getenv('WEATHER_HTTP_RETRIES', DEFAULT_RETRIES))
+
+
+def get_backoff():
+    """Exponential backoff factor in seconds (WEATHER_HTTP_BACKOFF)"""
+    return float(os.getenv('WEATHER_HTTP_BACKOFF', DEFAULT_BACKOFF))
+
+
+def get_timeout():
+    """Return the (connect, read) timeout pair from the environment"""
+    return (
+        float(os.getenv('WEATHER_HTTP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+        float(os.getenv('WEATHER_HTTP_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)),
+    )
+
+
+def get_session():
+    """Return the process-wide session, creating it on first use
+
+    WEATHER_HTTP_POOL_SIZE - keep-alive connections per host
+    WEATHER_HTTP_RETRIES   - retries on connection errors (5xx: see WeatherService._upstream_get)
+    WEATHER_HTTP_BACKOFF   - exponential backoff factor in seconds
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session(
+                    pool_size=int(os.getenv('WEATHER_HTTP_POOL_SIZE', DEFAULT_POOL_SIZE)),
+                    retries=get_retries(),
+                    backoff=get_backoff(),
+                )
+    return _session
+
+
+def close_session():
+    """Close the shared session and its pooled connections"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,359 @@
+# Weather App - IP Geolocation
+# Client IP to city from a local range database, cached per /24 prefix
+
+import csv
+import ipaddress
+import mmap
+import os
+import socket
+import struct
+import tempfile
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from singleflight import SingleFlight
+
+INDEX_MAGIC = b'WIPR'
+INDEX_VERSION = 1
+# magic, version, range count, place count
+_HEADER = struct.Struct('<4sIII')
+_IPV4 = struct.Struct('!I')
+
+PREFIX_CACHE_SIZE = 65536
+DEFAULT_LOOKUP_TIMEOUT = 3.0        # Seconds to wait for the online fallback
+FALLBACK_WORKERS = 4
+
+
+def _parse_address(value):
+    """IPv4 range bound as an int (dotted or already numeric), or None for IPv6"""
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return number if number <= 0xFFFFFFFF else None
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        return None
+    return int(address) if address.version == 4 else None
+
+
+def build_index(source_path, index_path):
+    """Compile an IP-range CSV into a sorted, memory-mappable index file
+
+    Rows are start, end, then either DB-IP's continent, country, region,
+    city, lat, lon or IP2Location's country code, country, region, city,
+    lat, lon. Addresses may be dotted or numeric; IPv6 rows are skipped.
+    The file holds three uint32 arrays (range starts, range ends, place
+    number) followed by place offsets and 'city\\tregion\\tcountry\\tlat\\tlon'
+    records, so one bisect over the starts finds a range.
+    """
+    ranges = []
+    places = {}
+    with open(source_path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 8:
+                continue
+            start, end = _parse_address(row[0]), _parse_address(row[1])
+            if start is None or end is None or end < start:
+                continue
+            country, region, city, lat, lon = row[3], row[4], row[5], row[6], row[7]
+            if len(country) != 2:
+                # IP2Location: code first, full name second
+                country = row[2]
+            record = '\t'.join([city, region, country.upper(), lat, lon])
+            place = places.setdefault(record, len(places))
+            ranges.append((start, end, place))
+
+    ranges.sort()
+
+    place_offsets = []
+    position = 0
+    records = []
+    for record in places:
+        encoded = f"{record}\n".encode('utf-8')
+        place_offsets.append(position)
+        records.append(encoded)
+        position += len(encoded)
+
+    count = len(ranges)
+    directory = os.path.dirname(index_path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as out:
+        out.write(_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, count, len(places)))
+        for column in range(3):
+            out.write(struct.pack(f'<{count}I', *(r[column] for r in ranges)))
+        out.write(struct.pack(f'<{len(place_offsets)}I', *place_offsets))
+        out.writelines(records)
+    # Atomic so concurrent workers never map a half-written index
+    os.replace(tmp_path, index_path)
+    return count
+
+
+def _default_index_path(source_path):
+    """Put the index next to the CSV, or in the temp dir if that isn't writable"""
+    directory = os.path.dirname(os.path.abspath(source_path))
+    if os.access(directory, os.W_OK):
+        return source_path + '.idx'
+    return os.path.join(tempfile.gettempdir(), os.path.basename(source_path) + '.idx')
+
+
+class IPRangeIndex:
+    """Read-only IPv4 range database backed by a memory-mapped index
+
+    The index is compiled from the CSV the first time it is needed (or
+    when the CSV is newer) and shared between worker processes through
+    the page cache. A lookup is one bisect over the mapped range starts.
+    """
+
+    def __init__(self, source_path, index_path=None):
+        self.source_path = source_path
+        self.index_path = index_path or _default_index_path(source_path)
+        self._mmap = None
+        self._starts = self._ends = self._places = self._place_offsets = None
+        self._records_start = 0
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def load(self):
+        """Compile the index if needed and map it (safe to call repeatedly)"""
+        if self._mmap is not None:
+            return self
+        with self._lock:
+            if self._mmap is None:
+                if (not os.path.exists(self.index_path)
+                        or os.path.getmtime(self.index_path) < os.path.getmtime(self.source_path)):
+                    print(f"🌐 Building IP range index from {self.source_path}...")
+                    count = build_index(self.source_path, self.index_path)
+                    print(f"✅ Indexed {count:,} IP ranges")
+                self._map_index()
+        return self
+
+    def _map_index(self):
+        with open(self.index_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, place_count = _HEADER.unpack_from(mapped, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            mapped.close()
+            raise ValueError(f"Unsupported IP range index: {self.index_path}")
+
+        table = memoryview(mapped)[_HEADER.size:].cast('B')
+        size = count * 4
+        self._starts = table[:size].cast('I')
+        self._ends = table[size:2 * size].cast('I')
+        self._places = table[2 * size:3 * size].cast('I')
+        self._place_offsets = table[3 * size:3 * size + place_count * 4].cast('I')
+        self._records_start = _HEADER.size + 3 * size + place_count * 4
+        self.count = count
+        self._mmap = mapped
+
+    def _place(self, number):
+        start = self._records_start + self._place_offsets[number]
+        end = self._mmap.find(b'\n', start)
+        city, region, country, lat, lon = self._mmap[start:end].decode('utf-8').split('\t')
+        return {
+            'city': city,
+            'region': region,
+            'country': country,
+            'lat': float(lat) if lat else None,
+            'lon': float(lon) if lon else None,
+        }
+
+    def find(self, address):
+        """Return (range start, range end, place dict) containing an int IPv4 address, or None"""
+        self.load()
+        i = bisect_right(self._starts, address) - 1
+        if i < 0 or address > self._ends[i]:
+            return None
+        return self._starts[i], self._ends[i], self._place(self._places[i])
+
+
+class IPLocator:
+    """Client IP to location, memoized per network prefix
+
+    Answers come from the local range database when one is configured.
+    A public client IP is only sent to geocoder's online lookup when
+    online_fallback is on; a local client shares the server's own public
+    address, which is always looked up online. Online lookups run on a
+    small worker pool with a timeout so a slow provider can't tie up
+    request threads, and are coalesced so a burst from one network makes
+    one call. Results are cached per /24 (IPv4) or /64
+    (IPv6). A database answer is only cached for the prefix when its
+    range covers the whole prefix, so finer-grained ranges stay exact.
+    """
+
+    def __init__(self, index=None, cache_size=PREFIX_CACHE_SIZE,
+                 online_fallback=False, timeout=DEFAULT_LOOKUP_TIMEOUT):
+        self.index = index
+        self.cache_size = cache_size
+        self.online_fallback = online_fallback
+        self.timeout = timeout
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._executor = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _prefix(address):
+        if address.version == 4:
+            return 4, int(address) >> 8
+        return 6, int(address) >> 64
+
+    def _cached(self, prefix):
+        with self._lock:
+            if prefix in self._cache:
+                self._cache.move_to_end(prefix)
+                self.hits += 1
+                return True, self._cache[prefix]
+            self.misses += 1
+        return False, None
+
+    def _remember(self, prefix, location):
+        with self._lock:
+            self._cache[prefix] = location
+            self._cache.move_to_end(prefix)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def locate(self, ip):
+        """Location dict (name, city, region, country, lat, lon, method) for an IP, or None"""
+        # Fast path for IPv4: a cached prefix needs no further parsing
+        try:
+            prefix = (4, _IPV4.unpack(socket.inet_pton(socket.AF_INET, ip.strip()))[0] >> 8)
+        except (AttributeError, OSError):
+            prefix = None
+        if prefix is not None:
+            found, location = self._cached(prefix)
+            if found:
+                return location
+
+        try:
+            address = ipaddress.ip_address(ip.strip())
+        except (AttributeError, ValueError):
+            return None
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        local = address.is_private or address.is_loopback or address.is_link_local
+
+        if prefix is None:
+            prefix = ('local',) if local else self._prefix(address)
+            found, location = self._cached(prefix)
+            if found:
+                return location
+
+        if self.index is not None and address.version == 4 and not local:
+            try:
+                match = self.index.find(int(address))
+            except (OSError, ValueError) as e:
+                print(f"⚠️  IP range database unavailable: {e}")
+                self.index = None
+                match = None
+            if match:
+                start, end, place = match
+                location = _describe(place, 'ip_database')
+                network = int(address) & ~0xFF
+                if start <= network and end >= network + 0xFF:
+                    self._remember(prefix, location)
+                return location
+
+        if not (local or self.online_fallback):
+            # Client addresses stay here unless the operator opted in
+            return None
+        # A client on the same machine or LAN shares the server's public IP
+        query = 'me' if local else str(address)
+        location = self._flight.do(prefix, lambda: self._lookup_online(query))
+        if location is not None:
+            # Failures aren't cached so a timeout is retried on the next request
+            self._remember(prefix, location)
+        return location
+
+    def _lookup_online(self, query):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=FALLBACK_WORKERS,
+                                                        thread_name_prefix='weather-ipgeo')
+        future = self._executor.submit(_geocoder_lookup, query)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            print(f"⚠️  IP geolocation timed out after {self.timeout}s")
+            return None
+
+    def after_fork(self):
+        """Drop the worker pool inherited from a parent process"""
+        self._executor = None
+
+    def stats(self):
+        """Return cache counters"""
+        with self._lock:
+            return {
+                'prefixes': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'database_ranges': self.index.count if self.index is not None else 0,
+            }
+
+
+def _describe(place, method):
+    city, country = place.get('city'), place.get('country')
+    name = ', '.join(part for part in (city, country) if part)
+    if not name:
+        return None
+    return {
+        'name': name,
+        'city': city,
+        'region': place.get('region'),
+        'country': country,
+        'lat': place.get('lat'),
+        'lon': place.get('lon'),
+        'method': method,
+    }
+
+
+def _geocoder_lookup(query):
+    try:
+        import geocoder
+    except ImportError:
+        print("💡 Tip: Install 'geocoder' package or set WEATHER_IPDB_PATH for location detection")
+        return None
+    try:
+        g = geocoder.ip(query)
+    except Exception as e:
+        print(f"⚠️  Location detection failed: {e}")
+        return None
+    if not g.ok:
+        return None
+    lat, lon = g.latlng if g.latlng else (None, None)
+    return _describe({'city': g.city, 'region': g.state, 'country': g.country,
+                      'lat': lat, 'lon': lon}, 'ip_detection')
+
+
+_locator = None
+_locator_lock = threading.Lock()
+
+
+def get_ip_locator():
+    """Return the shared IPLocator
+
+    WEATHER_IPDB_PATH        - IP-range CSV (DB-IP or IP2Location lite layout)
+    WEATHER_IPDB_INDEX       - where to write the compiled index
+    WEATHER_IPDB_ONLINE      - send client IPs the database doesn't cover to
+                               geocoder's online lookup (default 0)
+    WEATHER_IP_LOOKUP_TIMEOUT - seconds to wait for the online lookup (default 3)
+    """
+    global _locator
+    if _locator is None:
+        with _locator_lock:
+            if _locator is None:
+                source = os.getenv('WEATHER_IPDB_PATH')
+                index = IPRangeIndex(source, os.getenv('WEATHER_IPDB_INDEX') or None) if source else None
+                _locator = IPLocator(
+                    index,
+                    online_fallback=os.getenv('WEATHER_IPDB_ONLINE', '0').lower() in ('1', 'true', 'yes'),
+                    timeout=float(os.getenv('WEATHER_IP_LOOKUP_TIMEOUT', DEFAULT_LOOKUP_TIMEOUT))
+                )
+    return _locator
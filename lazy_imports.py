@@ -0,0 +1,51 @@
+# Weather App - Lazy Imports
+# Heavy modules are imported on first use, and dependency checks don't import anything
+
+import importlib
+import importlib.util
+
+
+class LazyModule:
+    """Stands in for a module until one of its attributes is first used
+
+    requests, aiohttp and asyncio together are a large share of the app's
+    import time, but a cold process can answer /healthz, static files and
+    cached pages without them. importlib.import_module holds the import
+    lock, so concurrent first uses still import the module only once.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        # Only called for names not set in __init__
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name):
+    """Module proxy that imports name on first attribute access"""
+    return LazyModule(name)
+
+
+def is_installed(name):
+    """Whether a module can be imported, without importing it"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        # find_spec imports parent packages of dotted names, which may be missing
+        return False
+
+
+def missing_packages(names):
+    """Names from names that aren't installed"""
+    return [name for name in names if not is_installed(name)]
@@ -0,0 +1,283 @@
+# Weather App - Live Updates
+# Server-Sent Events: one upstream fetch per location, fanned out to every viewer
+
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+from locations import location_key, validate_format
+from lazy_imports import is_installed, lazy_module
+from metrics import registry
+
+# Imported when the stream server starts, not when the web app loads
+asyncio = lazy_module('asyncio')
+web = lazy_module('aiohttp.web')
+
+DEFAULT_STREAM_PORT = 5001
+DEFAULT_STREAM_INTERVAL = 60        # Seconds between fetches per location
+DEFAULT_HEARTBEAT = 25              # Comment line that keeps proxies from timing out
+DEFAULT_MAX_SUBSCRIBERS = 50000
+SUBSCRIBER_QUEUE_SIZE = 8
+# Fields not worth an update on their own; sent only alongside real changes
+VOLATILE_FIELDS = ('timestamp',)
+
+stream_subscribers = registry.gauge(
+    'weather_stream_subscribers', 'Open live-update connections')
+stream_channels = registry.gauge(
+    'weather_stream_channels', 'Locations with at least one live-update subscriber')
+stream_events = registry.counter(
+    'weather_stream_events_total', 'Live-update events queued for subscribers', ('event',))
+
+
+def changed_fields(old, new):
+    """Fields of new that differ from old (the whole of new if there is no old)"""
+    if old is None:
+        return dict(new)
+    changes = {field: value for field, value in new.items()
+               if old.get(field) != value and field not in VOLATILE_FIELDS}
+    if changes:
+        changes.update((field, new[field]) for field in VOLATILE_FIELDS if field in new)
+    return changes
+
+
+class Channel:
+    """Subscribers of one (location, units) pair and the last state sent to them"""
+
+    def __init__(self, location, units):
+        self.location = location
+        self.units = units
+        self.subscribers = set()
+        self.state = None
+        self.task = None
+
+
+class LiveUpdateHub:
+    """Fans one periodic fetch per location out to all of its subscribers
+
+    Everything runs on one asyncio event loop: a subscriber is just a small
+    queue, so idle connections cost memory, not threads. Each channel's
+    poller fetches through the service's cache every interval seconds and
+    queues only the fields that changed. A subscriber that falls behind
+    has its queue replaced by a full snapshot instead of growing without
+    bound.
+    """
+
+    def __init__(self, service, interval=DEFAULT_STREAM_INTERVAL,
+                 max_subscribers=DEFAULT_MAX_SUBSCRIBERS):
+        self.service = service
+        self.interval = interval
+        self.max_subscribers = max_subscribers
+        self._channels = {}
+        self.subscriber_count = 0
+        self.fetches = 0
+        self.errors = 0
+
+    def subscribe(self, location, units):
+        """Return a queue of (event, data) for a location, or None when full"""
+        if self.subscriber_count >= self.max_subscribers:
+            return None
+
+        key = (location_key(location), units)
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = Channel(location, units)
+            stream_channels.set(len(self._channels))
+
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        channel.subscribers.add(queue)
+        self.subscriber_count += 1
+        stream_subscribers.set(self.subscriber_count)
+
+        if channel.state is not None:
+            queue.put_nowait(('snapshot', channel.state))
+        if channel.task is None:
+            channel.task = asyncio.ensure_future(self._poll(channel))
+        return queue
+
+    def unsubscribe(self, location, units, queue):
+        key = (location_key(location), units)
+        channel = self._channels.get(key)
+        if channel is None or queue not in channel.subscribers:
+            return
+        channel.subscribers.discard(queue)
+        self.subscriber_count -= 1
+        stream_subscribers.set(self.subscriber_count)
+        if not channel.subscribers:
+            # Last viewer gone: stop polling this location
+            if channel.task is not None:
+                channel.task.cancel()
+            del self._channels[key]
+            stream_channels.set(len(self._channels))
+
+    def _publish(self, channel, event, data):
+        stream_events.inc(event)
+        for queue in channel.subscribers:
+            if queue.full():
+                while not queue.empty():
+                    queue.get_nowait()
+                if channel.state is not None:
+                    # Dropped diffs would leave the client wrong; resync it instead
+                    queue.put_nowait(('snapshot', channel.state))
+                    continue
+            queue.put_nowait((event, data))
+
+    async def _poll(self, channel):
+        """Fetch, diff and publish until the channel has no subscribers"""
+        while channel.subscribers:
+            try:
+                data = await self.service.get_current_weather(channel.location, channel.units)
+                formatted = self.service.format_weather_data(data, channel.units, include_raw=False)
+                self.fetches += 1
+                changes = changed_fields(channel.state, formatted)
+                first = channel.state is None
+                channel.state = formatted
+                if first:
+                    self._publish(channel, 'snapshot', formatted)
+                elif changes:
+                    self._publish(channel, 'update', changes)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self._publish(channel, 'error', {'error': str(e)})
+            await asyncio.sleep(self.interval)
+
+    def close(self):
+        """Stop every poller and tell every open stream to finish"""
+        for channel in self._channels.values():
+            if channel.task is not None:
+                channel.task.cancel()
+            for queue in channel.subscribers:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait((None, None))
+
+    def stats(self):
+        """Return subscriber and fetch counters"""
+        return {
+            'subscribers': self.subscriber_count,
+            'channels': len(self._channels),
+            'fetches': self.fetches,
+            'errors': self.errors,
+            'interval': self.interval,
+        }
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode('utf-8')
+
+
+def allowed_origin(origin, host, extra_origins=()):
+    """Whether a page at origin may read the stream served on host
+
+    The web app links to the stream on its own host name but another
+    port, so that host is allowed on any port; anything else must be
+    listed in WEATHER_STREAM_ORIGINS.
+    """
+    if not origin:
+        return False
+    if origin in extra_origins:
+        return True
+    return urlsplit(origin).hostname == urlsplit(f"//{host}").hostname
+
+
+def create_stream_app(hub, heartbeat=DEFAULT_HEARTBEAT, validate=validate_format, limiter=None,
+                      extra_origins=()):
+    """aiohttp application serving GET /api/stream?location=...&units=...
+
+    validate(location) -> (is_valid, message) and limiter (a
+    ClientRateLimiter) should be the web app's, so a stream is held to
+    the same checks as /api/weather.
+    """
+
+    async def stream(request):
+        location = request.query.get('location', '').strip()
+        units = request.query.get('units', 'metric')
+        origin = request.headers.get('Origin', '')
+        headers = {'Vary': 'Origin'}
+        if allowed_origin(origin, request.host, extra_origins):
+            headers['Access-Control-Allow-Origin'] = origin
+
+        if limiter is not None:
+            wait = limiter.check(request.remote or 'unknown')
+            if wait:
+                retry_after = max(1, int(wait + 0.999))
+                return web.json_response({'error': 'Too many requests, please slow down', 'retry_after': retry_after},
+                                         status=429, headers={**headers, 'Retry-After': str(retry_after)})
+
+        is_valid, message = validate(location)
+        if not is_valid or units not in ('metric', 'imperial'):
+            return web.json_response({'error': message if not is_valid else 'Invalid units'},
+                                     status=400, headers=headers)
+
+        queue = hub.subscribe(location, units)
+        if queue is None:
+            return web.json_response({'error': 'Too many live connections, try again later'},
+                                     status=503, headers={**headers, 'Retry-After': '30'})
+
+        response = web.StreamResponse(headers={
+            **headers,
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',      # Stop nginx buffering the stream
+        })
+        try:
+            await response.prepare(request)
+            await response.write(f"retry: {int(hub.interval * 250)}\n\n".encode('utf-8'))
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    await response.write(f": {int(time.time())}\n\n".encode('utf-8'))
+                    continue
+                if event is None:
+                    break
+                await response.write(_sse(event, data))
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            hub.unsubscribe(location, units, queue)
+        return response
+
+    async def close_streams(app):
+        hub.close()
+
+    app = web.Application()
+    app.router.add_get('/api/stream', stream)
+    app.on_shutdown.append(close_streams)
+    return app
+
+
+async def start_stream_server(hub, host, port, reuse_port=False, **app_options):
+    """Start serving the SSE app on the running loop; return the runner
+
+    app_options are passed on to create_stream_app.
+    """
+    if not is_installed('aiohttp'):
+        raise ImportError("Live updates require aiohttp: pip install aiohttp")
+    runner = web.AppRunner(create_stream_app(hub, **app_options), access_log=None, shutdown_timeout=3)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port, reuse_port=reuse_port or None, backlog=1024)
+    await site.start()
+    return runner
+
+
+def stream_settings_from_env():
+    """Live-update settings
+
+    WEATHER_STREAM_PORT     - port for the SSE server (default 5001, 0 = disabled)
+    WEATHER_STREAM_INTERVAL - seconds between fetches per location (default 60)
+    WEATHER_STREAM_MAX      - most open connections per worker (default 50000)
+    WEATHER_STREAM_URL      - public URL of /api/stream if it is proxied elsewhere
+    WEATHER_STREAM_ORIGINS  - comma-separated page origins allowed to read the
+                              stream besides the web app's own host
+    """
+    return {
+        'port': int(os.getenv('WEATHER_STREAM_PORT', DEFAULT_STREAM_PORT)),
+        'interval': float(os.getenv('WEATHER_STREAM_INTERVAL', DEFAULT_STREAM_INTERVAL)),
+        'max_subscribers': int(os.getenv('WEATHER_STREAM_MAX', DEFAULT_MAX_SUBSCRIBERS)),
+        'url': os.getenv('WEATHER_STREAM_URL', ''),
+        'origins': tuple(origin.strip() for origin in os.getenv('WEATHER_STREAM_ORIGINS', '').split(',')
+                         if origin.strip()),
+    }
@@ -0,0 +1,205 @@
+# Weather App - Location Normalization
+# Turns whatever the user typed into one canonical key per place
+
+import re
+import unicodedata
+from collections import namedtuple
+from functools import lru_cache
+
+import geohash
+from gazetteer import get_gazetteer, normalize_name, parse_qualifier
+
+LOCATION_CACHE_SIZE = 8192
+# Coordinates within one geohash cell share a cache entry
+GEOHASH_PRECISION = geohash.get_precision()
+
+# Compiled once; validation runs on every request
+_ALLOWED = re.compile(r"^[a-zA-Z0-9\s,.'-]+$")
+_KNOWN_FORMATS = (
+    re.compile(r'^[a-zA-Z\s]+$'),                           # City name only
+    re.compile(r'^[a-zA-Z\s]+,\s*[a-zA-Z\s]+$'),            # City, Country
+    re.compile(r'^[a-zA-Z\s]+,\s*[A-Z]{2}$'),               # City, State Code
+    re.compile(r'^\d{5}$'),                                 # ZIP code (US)
+    re.compile(r'^[a-zA-Z]\d[a-zA-Z]\s*\d[a-zA-Z]\d$'),     # Postal code (Canada)
+)
+_US_ZIP = re.compile(r'^(\d{5})(?:-\d{4})?$')
+_CA_POSTAL = re.compile(r'^([a-z]\d[a-z])\s*(\d[a-z]\d)$', re.IGNORECASE)
+_ZIP_KEY = re.compile(r'^zip:([a-z0-9 ]+),([a-z]{2})$')
+_CITY_ID = re.compile(r'^id:(\d+)$')
+_GEOHASH_KEY = re.compile(r'^gh:([0-9b-hjkmnp-z]{1,12})$')
+_COORDINATES = re.compile(r'^-?\d{1,3}(?:\.\d+)?,\s*-?\d{1,3}(?:\.\d+)?$')
+
+# key: canonical string used for cache keys and history
+# kind: 'city', 'zip', 'coordinates' (a geohash cell), 'id' or 'other'
+# params: upstream query parameters when the place isn't resolved offline
+# place: gazetteer record, or None
+Location = namedtuple('Location', ['key', 'kind', 'params', 'place'])
+
+
+def fold(text):
+    """Strip accents and collapse whitespace, keeping case ('São  Paulo' -> 'Sao Paulo')"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ' '.join(''.join(ch for ch in decomposed if not unicodedata.combining(ch)).split())
+
+
+@lru_cache(maxsize=LOCATION_CACHE_SIZE)
+def validate_format(location):
+    """Return (is_valid, message) for the shape of a location string"""
+    if not location or len(location.strip()) < 2:
+        return False, "Location must be at least 2 characters long"
+
+    # Accented names are fine; everything else must be plain text
+    folded = fold(location)
+    if not _ALLOWED.match(folded):
+        return False, "Location contains invalid characters"
+
+    if any(pattern.match(folded) for pattern in _KNOWN_FORMATS):
+        return True, "Valid location"
+
+    # If no pattern matches but basic validation passed, still allow it
+    return True, "Location format accepted"
+
+
+def _bucket_location(cell):
+    lat, lon = geohash.decode(cell)
+    return Location(f"gh:{cell}", 'coordinates', {'lat': round(lat, 5), 'lon': round(lon, 5)}, None)
+
+
+def coordinate_location(lat, lon, precision=None):
+    """Location for a point, snapped to its geohash cell
+
+    The key is 'gh:<geohash>' and the upstream parameters are the cell's
+    center, so every request inside the cell shares one cached answer.
+    """
+    lat, lon = float(lat), float(lon)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("Coordinates out of range")
+    return _bucket_location(geohash.encode(lat, lon, precision or GEOHASH_PRECISION))
+
+
+def _resolve(name, country, state):
+    """Gazetteer record for a name and parsed qualifier, or None"""
+    try:
+        return get_gazetteer().lookup(name, state or country)
+    except (OSError, ValueError):
+        return None
+
+
+def place_key(place):
+    """Canonical key of a gazetteer record: 'name,cc' or 'name,st,us'"""
+    name = normalize_name(place['name'])
+    if place['country'] == 'US' and place['state_code']:
+        return f"{name},{place['state_code'].lower()},us"
+    return f"{name},{place['country'].lower()}"
+
+
+def _parse_qualifiers(parts):
+    """Reduce 'State', 'Country' or 'State, Country' qualifiers to (country, state)
+
+    Returns None when a qualifier isn't recognized. A bare two-letter code
+    that is both a country and a US state (CA, IL, ...) keeps both readings.
+    """
+    country = state = None
+    for part in parts:
+        part_country, part_state = parse_qualifier(part)
+        if part_country is None and part_state is None:
+            return None
+        if part_state and not part_country:
+            state, country = part_state, country or 'US'
+        elif part_country and not part_state:
+            country = part_country
+        else:
+            country, state = country or part_country, state or part_state
+    if state and country not in (None, 'US', state):
+        state = None
+    return country, state
+
+
+@lru_cache(maxsize=LOCATION_CACHE_SIZE)
+def _canonical(text):
+    folded = fold(text)
+
+    if _COORDINATES.match(folded):
+        try:
+            return coordinate_location(*folded.split(','))
+        except ValueError:
+            return Location(folded, 'other', {'q': folded}, None)
+
+    bucket = _GEOHASH_KEY.match(folded)
+    if bucket:
+        return _bucket_location(bucket.group(1))
+
+    city_id = _CITY_ID.match(folded)
+    if city_id:
+        return Location(folded, 'id', {'id': city_id.group(1)}, None)
+
+    zip_key = _ZIP_KEY.match(folded.lower())
+    if zip_key:
+        code, country = zip_key.groups()
+        return Location(folded.lower(), 'zip', {'zip': f"{code.upper()},{country.upper()}"}, None)
+
+    us_zip = _US_ZIP.match(folded)
+    if us_zip:
+        code = us_zip.group(1)
+        return Location(f"zip:{code},us", 'zip', {'zip': f"{code},US"}, None)
+
+    postal = _CA_POSTAL.match(folded)
+    if postal:
+        code = f"{postal.group(1)} {postal.group(2)}".upper()
+        return Location(f"zip:{code.lower()},ca", 'zip', {'zip': f"{code},CA"}, None)
+
+    name, *qualifiers = [normalize_name(part) for part in folded.split(',')]
+    qualifiers = [q for q in qualifiers if q]
+    if not name:
+        return Location(folded.lower(), 'other', {'q': folded}, None)
+
+    parsed = _parse_qualifiers(qualifiers)
+    if parsed is None:
+        # Unknown qualifier: keep it as typed and let the upstream decide
+        key = ','.join([name] + qualifiers)
+        return Location(key, 'city', {'q': key}, None)
+
+    country, state = parsed
+    place = _resolve(name, country, state)
+    if place:
+        key = place_key(place)
+        return Location(key, 'city', {'q': key}, place)
+
+    if state and country == 'US':
+        key = f"{name},{state.lower()},us"
+    elif state and country == state:
+        # Ambiguous two-letter code; OpenWeatherMap reads it as a country
+        key = f"{name},{state.lower()}"
+    elif country:
+        key = f"{name},{country.lower()}"
+    else:
+        key = name
+    return Location(key, 'city', {'q': key}, None)
+
+
+def canonical_location(location):
+    """Parse a location into its canonical Location (memoized)
+
+    'London', '  london ' and 'London, UK' all map to the key
+    'london,gb'. Names known to the gazetteer are keyed on the
+    matching record; ZIP and postal codes become 'zip:<code>,<country>'
+    'lat,lon' strings snap to their 'gh:<geohash>' cell and 'id:<n>' passes through. Canonical keys parse to themselves.
+    """
+    return _canonical(str(location))
+
+
+def location_key(location):
+    """Canonical cache/history key for a location string, coordinates or city ID"""
+    if isinstance(location, (int, float)):
+        return str(location)
+    if isinstance(location, tuple):
+        return coordinate_location(*location).key
+    return canonical_location(location).key
+
+
+def cache_info():
+    """Memoization counters for validation and canonicalization"""
+    return {
+        'validate': validate_format.cache_info()._asdict(),
+        'canonical': _canonical.cache_info()._asdict(),
+    }
@@ -12,26 +12,26 @@ Features:
 - Detailed weather information including humidity, wind, etc.
 """
 
+import argparse
 import os
+import time
 
-def check_dependencies():
-    """Check if required packages are installed"""
-    missing_packages = []
+from lazy_imports import is_installed, missing_packages
 
-    try:
-        import requests
-    except ImportError:
-        missing_packages.append("requests")
+DEFAULT_HOST = '0.0.0.0'
+DEFAULT_PORT = 5000
+DEFAULT_SNAPSHOT_PATH = 'weather_snapshot.bin'
 
-    try:
-        import flask
-    except ImportError:
-        missing_packages.append("flask")
+def check_dependencies():
+    """Check if required packages are installed"""
+    # find_spec only looks for the packages; importing them here would
+    # double the time it takes to start
+    missing = missing_packages(["requests", "flask"])
 
-    if missing_packages:
+    if missing:
         print("⚠️  Missing Dependencies:")
         print("The following packages need to be installed:")
-        for package in missing_packages:
+        for package in missing:
             print(f"   - {package}")
         print()
         print("📦 To install dependencies, run:")
@@ -63,7 +63,53 @@ def setup_api_key():
     print("     Add line: WEATHER_API_KEY=your_key_here")
     print()
 
-def launch_web():
+def launch_production(app, host, port, workers, threads):
+    """Serve the app with gunicorn: pre-forked workers sharing a warmed-up master
+
+    The app is imported and warmed up once before forking, so workers start
+    with the gazetteer mapped and the suggestion index built. Each worker then
+    reopens its own upstream connections and background refresher.
+    SIGHUP to the master reloads workers gracefully.
+    """
+    from gunicorn.app.base import BaseApplication
+    import server
+
+    class WeatherApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    def when_ready(arbiter):
+        # Only workers refresh hot locations; the master just supervises
+        server.refresher.stop()
+
+    def post_fork(arbiter, worker):
+        server.after_fork()
+
+    options = {
+        'bind': f"{host}:{port}",
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'preload_app': True,
+        'timeout': int(os.getenv('WEATHER_WORKER_TIMEOUT', 30)),
+        'graceful_timeout': 10,
+        'keepalive': 5,
+        'max_requests': int(os.getenv('WEATHER_MAX_REQUESTS', 0)),
+        'max_requests_jitter': 50,
+        'when_ready': when_ready,
+        'post_fork': post_fork,
+    }
+    WeatherApplication(options).run()
+
+def launch_web(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=1, threads=1, dev=False):
     """Launch web interface"""
     try:
         print("🌤️" + "=" * 50 + "🌤️")
@@ -79,14 +125,34 @@ def launch_web():
             print("   pip install -r requirements.txt")
             return
 
-        # Import and run the Flask app
-        from server import app
-        print("✅ Server ready!")
-        print("📍 Open your browser and go to: http://localhost:5000")
+        if not dev:
+            if not is_installed('gunicorn'):
+                print("⚠️  gunicorn not installed, falling back to the development server")
+                print("💡 For production: pip install gunicorn")
+                dev = True
+
+        if not dev and workers > 1 and not (os.getenv('WEATHER_QUOTA_PATH') or os.getenv('WEATHER_CACHE_PATH')):
+            # One call budget for all workers, not one per worker
+            from ratelimit import shared_quota_path
+            os.environ['WEATHER_QUOTA_PATH'] = shared_quota_path()
+            print(f"🔒 Sharing the upstream call budget via {os.environ['WEATHER_QUOTA_PATH']}")
+
+        # Import and warm up the Flask app; workers forked from a preloaded
+        # master share everything it imported
+        from server import app, warm_up
+        elapsed = warm_up(preload=not dev)
+        print(f"✅ Server ready! (warm-up {elapsed * 1000:.0f} ms)")
+        print(f"📍 Open your browser and go to: http://localhost:{port}")
         print("🛑 Press Ctrl+C to stop the server")
         print("-" * 50)
 
-        app.run(debug=False, host='0.0.0.0', port=5000)
+        if dev:
+            from server import start_live_updates
+            start_live_updates(wait=False)
+            app.run(debug=False, host=host, port=port, threaded=True)
+        else:
+            print(f"🏭 Production mode: {workers} worker(s) x {threads} thread(s)")
+            launch_production(app, host, port, workers, threads)
 
     except ImportError as e:
         print(f"❌ Error importing web module: {e}")
@@ -94,8 +160,67 @@ def launch_web():
     except Exception as e:
         print(f"❌ Error launching web app: {e}")
 
+def build_snapshot(cities, path, max_age=0):
+    """Prefetch weather and forecasts for a city list into an offline snapshot"""
+    from snapshot import read_location_list, refresh_snapshot
+    from weather_app import WeatherService
+
+    locations = read_location_list(cities)
+    if not locations:
+        print("❌ No cities to prefetch")
+        print("💡 Pass --cities with a file (one city per line) or 'London, UK; Paris'")
+        print("   or set WEATHER_SNAPSHOT_CITIES")
+        return False
+
+    service = WeatherService()
+    # Same lookup as the server: environment, then .env, then the development key
+    if not service.get_api_key():
+        print("⚠️  API Key not found!")
+        setup_api_key()
+        return False
+    # Always fetch from the upstream, never from the snapshot being written
+    service.snapshot = None
+    service.offline = False
+
+    print(f"📦 Prefetching {len(locations)} location(s) into {path}...")
+    started = time.time()
+    counts = refresh_snapshot(service, locations, path, max_age)
+    print(f"✅ Wrote {counts['entries']} entries in {time.time() - started:.1f}s")
+    print(f"   fetched {counts['fetched']} ({counts['changed']} changed, {counts['unchanged']} unchanged), "
+          f"kept {counts['kept']}, failed {counts['failed']}, removed {counts['removed']}")
+    return counts['failed'] == 0
+
+def parse_args():
+    """Parse command line options (environment variables provide the defaults)"""
+    parser = argparse.ArgumentParser(description="Weather App web server")
+    parser.add_argument('command', nargs='?', choices=('serve', 'snapshot'), default='serve',
+                        help="serve the web app (default), or prefetch an offline snapshot")
+    parser.add_argument('--host', default=os.getenv('WEATHER_HOST', DEFAULT_HOST),
+                        help="interface to bind (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=int(os.getenv('WEATHER_PORT', DEFAULT_PORT)),
+                        help="port to listen on (default: %(default)s)")
+    parser.add_argument('--workers', type=int,
+                        default=int(os.getenv('WEATHER_WORKERS', (os.cpu_count() or 1) * 2 + 1)),
+                        help="worker processes in production mode (default: %(default)s)")
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WEATHER_THREADS', 4)),
+                        help="threads per worker (default: %(default)s)")
+    parser.add_argument('--dev', action='store_true',
+                        help="use Flask's single-process development server")
+    snapshot = parser.add_argument_group('snapshot options')
+    snapshot.add_argument('--cities', default=os.getenv('WEATHER_SNAPSHOT_CITIES'),
+                          help="file with one city per line, or a ';'-separated list")
+    snapshot.add_argument('--output', default=os.getenv('WEATHER_SNAPSHOT_PATH', DEFAULT_SNAPSHOT_PATH),
+                          help="snapshot file to write or refresh (default: %(default)s)")
+    snapshot.add_argument('--max-age', type=float, default=0,
+                          help="keep entries fetched less than this many seconds ago (default: refetch all)")
+    return parser.parse_args()
+
 def main():
     """Main application launcher"""
+    args = parse_args()
+    if args.command == 'snapshot':
+        ok = build_snapshot(args.cities, args.output, args.max_age)
+        raise SystemExit(0 if ok else 1)
     try:
         print("🌤️ Welcome to Weather App!")
         print("🌐 Starting web interface...")
@@ -108,7 +233,7 @@ def main():
             setup_api_key()
             print()
 
-        launch_web()
+        launch_web(args.host, args.port, args.workers, args.threads, args.dev)
 
     except KeyboardInterrupt:
         print("\n\n👋 Goodbye! Thanks for using Weather App!")
@@ -0,0 +1,323 @@
+# Weather App - Metrics
+# In-process counters, gauges and latency histograms in Prometheus text format
+
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Counts, defaultdict
+
+# Latency buckets in seconds, from cache hits to slow upstream retries
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DEFAULT_PROFILE_INTERVAL = 0.005
+DEFAULT_PROFILE_PATH = 'slow_requests.folded'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Shared label handling for all metric types"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        return tuple(str(v) for v in labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = _Counts()
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, *labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}"
+                                for k, v in items]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests currently in flight"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = defaultdict(float)
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}"
+                                for k, v in items]
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._series = {}
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metrics plus collector callbacks that read other components' stats at scrape time"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def add_collector(self, collect):
+        """collect() returns [(name, help, type, {labels tuple: value} or value), ...]"""
+        self._collectors.append(collect)
+
+    def render(self):
+        """Text exposition format for everything registered"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                collected = collect()
+            except Exception as e:
+                lines.append(f"# collector failed: {_escape(e)}")
+                continue
+            for name, help_text, kind, values in collected:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if not isinstance(values, dict):
+                    values = {(): values}
+                for labels, value in sorted(values.items()):
+                    if value is not None:
+                        lines.append(f"{name}{_format_labels((), (), labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# Inbound requests
+http_requests = registry.counter(
+    'weather_http_requests_total', 'HTTP requests handled', ('route', 'method', 'status'))
+http_latency = registry.histogram(
+    'weather_http_request_duration_seconds', 'HTTP request latency', ('route',))
+http_in_flight = registry.gauge(
+    'weather_http_requests_in_flight', 'HTTP requests currently being handled')
+api_errors = registry.counter(
+    'weather_api_errors_total', 'Errors returned by API routes', ('route', 'error'))
+
+# Upstream API calls
+upstream_requests = registry.counter(
+    'weather_upstream_requests_total', 'Upstream API responses by status', ('endpoint', 'status'))
+upstream_latency = registry.histogram(
+    'weather_upstream_request_duration_seconds', 'Upstream API latency including retries', ('endpoint',))
+upstream_in_flight = registry.gauge(
+    'weather_upstream_requests_in_flight', 'Upstream API calls currently waiting', ('endpoint',))
+
+# Response cache
+cache_lookups = registry.counter(
+    'weather_cache_lookups_total', 'Response cache lookups by result (hit, stale, miss)',
+    ('endpoint', 'result'))
+
+
+def upstream_endpoint(url):
+    """Short label for an upstream URL: weather, forecast, group, air_pollution, direct"""
+    return url.rstrip('/').rsplit('/', 1)[-1]
+
+
+class UpstreamTimer:
+    """Context manager that times one upstream call and counts its status
+
+    Set .status once the response is known; exceptions are counted by type.
+    endpoint overrides the label taken from the URL's last path segment.
+    """
+
+    def __init__(self, url, endpoint=None):
+        self.endpoint = endpoint or upstream_endpoint(url)
+        self.status = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        upstream_in_flight.inc(self.endpoint)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        upstream_in_flight.dec(self.endpoint)
+        upstream_latency.observe(time.perf_counter() - self.started, self.endpoint)
+        status = self.status if exc_type is None or self.status else exc_type.__name__
+        upstream_requests.inc(self.endpoint, status or 'unknown')
+        return False
+
+
+class SlowRequestProfiler:
+    """Sampling profiler that keeps stacks only for requests slower than a threshold
+
+    A background thread samples the stacks of threads that are handling a
+    request every interval seconds. When a request finishes over
+    threshold seconds, its samples are appended to path in folded format
+    ("frame;frame;frame count"), ready for flamegraph.pl or speedscope.
+    Fast requests' samples are simply dropped.
+    """
+
+    def __init__(self, threshold, interval=DEFAULT_PROFILE_INTERVAL, path=DEFAULT_PROFILE_PATH):
+        self.threshold = threshold
+        self.interval = interval
+        self.path = path
+        self._active = {}           # thread id -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._thread = None
+        self.dumped = 0
+
+    def begin(self):
+        """Start sampling the calling thread"""
+        with self._lock:
+            self._active[threading.get_ident()] = _Counts()
+            if self._thread is None or not self._thread.is_alive():
+                # Started lazily so a forked worker gets its own sampler
+                self._thread = threading.Thread(target=self._run, name='weather-profiler', daemon=True)
+                self._thread.start()
+
+    def end(self, label, duration):
+        """Stop sampling the calling thread; dump its stacks if it was slow"""
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if not samples or duration < self.threshold:
+            return
+        try:
+            with open(self.path, 'a') as f:
+                for stack, count in samples.items():
+                    f.write(f"{label};{stack} {count}\n")
+            self.dumped += 1
+        except OSError as e:
+            print(f"⚠️  Could not write profile: {e}")
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is None or ident == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    samples[';'.join(reversed(stack))] += 1
+
+
+def create_profiler_from_env():
+    """Build the slow-request profiler, or None unless switched on
+
+    WEATHER_PROFILE_SLOW_MS     - profile requests slower than this many ms (unset = off)
+    WEATHER_PROFILE_INTERVAL_MS - sampling interval in ms (default 5)
+    WEATHER_PROFILE_PATH        - folded-stack output file (default slow_requests.folded)
+    """
+    threshold = os.getenv('WEATHER_PROFILE_SLOW_MS')
+    if not threshold:
+        return None
+    return SlowRequestProfiler(
+        threshold=float(threshold) / 1000,
+        interval=float(os.getenv('WEATHER_PROFILE_INTERVAL_MS', DEFAULT_PROFILE_INTERVAL * 1000)) / 1000,
+        path=os.getenv('WEATHER_PROFILE_PATH', DEFAULT_PROFILE_PATH)
+    )
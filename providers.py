@@ -0,0 +1,720 @@
+# Weather App - Weather Providers
+# Interchangeable upstream APIs behind one router with hedging and circuit breakers
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+from http_client import get_session, get_timeout
+from lazy_imports import lazy_module
+from metrics import UpstreamTimer, registry
+from ratelimit import QuotaExceeded
+
+requests = lazy_module('requests')
+
+DEFAULT_PROVIDERS = 'openweathermap'
+DEFAULT_OPEN_METEO_HOST = 'https://api.open-meteo.com'
+
+BREAKER_FAILURES = 5            # Consecutive failures that open a breaker
+BREAKER_COOLDOWN = 30.0         # Seconds an open breaker rejects calls before a trial call
+LATENCY_WINDOW = 200            # Recent successful calls kept per provider for p95
+MIN_LATENCY_SAMPLES = 20        # Until then the hedge waits DEFAULT_HEDGE_DELAY
+DEFAULT_HEDGE_DELAY = 1.0
+MIN_HEDGE_DELAY = 0.05
+HEDGE_RATIO = 0.1               # At most this fraction of calls may send a hedge
+HEALTH_DECAY = 0.1              # Weight of the newest outcome in the success-rate average
+LATENCY_SCALE = 1.0             # Median seconds that halve a provider's routing score
+HEDGE_WORKERS = 64
+
+provider_calls = registry.counter(
+    'weather_provider_calls_total', 'Provider calls by outcome (ok, error, rejected, quota)',
+    ('provider', 'outcome'))
+provider_hedges = registry.counter(
+    'weather_provider_hedges_total', 'Second-provider calls fired because the first was slow',
+    ('provider',))
+
+# What a provider needs to know about a location: upstream query parameters
+# (q/zip/id/lat+lon) plus coordinates and a display name when known offline
+ProviderQuery = namedtuple('ProviderQuery', ['params', 'lat', 'lon', 'name', 'country'])
+
+
+class ProviderError(Exception):
+    """An upstream call failed
+
+    retryable=False marks a final answer (unknown city, bad request) that
+    another provider would not change, so it is neither failed over nor
+    counted against the provider's health.
+    """
+
+    def __init__(self, message, retryable=True, status=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.status = status
+
+
+class CircuitBreaker:
+    """Stops calling a provider after repeated failures, then probes it
+
+    Closed: calls go through. After failure_threshold consecutive failures
+    it opens and rejects calls for cooldown seconds; then one trial call is
+    let through (half-open) and its outcome closes or re-opens it.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half_open'
+
+    def allow(self):
+        """Whether a call may go out now (claims the trial call when half-open)"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def available(self):
+        """Like allow(), without claiming anything (for ranking)"""
+        state = self.state
+        return state == 'closed' or (state == 'half_open' and not self.trial_running)
+
+    def release(self):
+        """Give back a trial call that never reached the provider"""
+        with self._lock:
+            self.trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    self.opened += 1
+                self.opened_at = time.monotonic()
+
+
+class ProviderHealth:
+    """Recent latency and success rate of one provider"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.success_rate = 1.0
+        self._sorted = None
+        self._lock = threading.Lock()
+
+    def record(self, ok, latency=None):
+        with self._lock:
+            self.success_rate += HEALTH_DECAY * ((1.0 if ok else 0.0) - self.success_rate)
+            if ok and latency is not None:
+                self.latencies.append(latency)
+                self._sorted = None
+
+    def percentile(self, pct):
+        """Latency percentile of recent successful calls, or None with too few samples"""
+        with self._lock:
+            if len(self.latencies) < MIN_LATENCY_SAMPLES:
+                return None
+            if self._sorted is None:
+                self._sorted = sorted(self.latencies)
+            return self._sorted[min(len(self._sorted) - 1, int(len(self._sorted) * pct / 100))]
+
+    def p95(self):
+        return self.percentile(95)
+
+
+class WeatherProvider:
+    """One upstream weather API
+
+    current() and forecast() return documents in OpenWeatherMap's shape,
+    which is what the cache, format_weather_data and compact_forecast
+    read, so a response doesn't care which provider produced it.
+    Subclasses describe the upstream call with request() and normalize
+    its JSON with parse(), so the same provider works over the blocking
+    requests session and over AsyncWeatherService's aiohttp session.
+    """
+
+    name = 'provider'
+    # Whether calls spend from the WeatherService's upstream quota
+    charges_quota = False
+    # Label for upstream metrics (None: the URL's last path segment)
+    metrics_endpoint = None
+
+    def __init__(self, weight=1.0):
+        self.weight = weight
+        self.breaker = CircuitBreaker()
+        self.health = ProviderHealth()
+
+    def supports(self, query):
+        """Whether this provider can look the query up at all"""
+        return True
+
+    def request(self, kind, query, units):
+        """(url, params) of the upstream call for 'current' or 'forecast'"""
+        raise NotImplementedError
+
+    def parse(self, kind, query, data):
+        """Upstream JSON -> a document in OpenWeatherMap's shape"""
+        return data
+
+    def _session_get(self, url, params):
+        raise NotImplementedError
+
+    def current(self, query, units):
+        return self.fetch('current', query, units)
+
+    def forecast(self, query, units):
+        return self.fetch('forecast', query, units)
+
+    def fetch(self, kind, query, units):
+        url, params = self.request(kind, query, units)
+        return self.parse(kind, query, self._get_json(url, params, self._session_get))
+
+    async def fetch_async(self, kind, query, units, client):
+        """fetch() over an AsyncWeatherService's aiohttp session"""
+        url, params = self.request(kind, query, units)
+        data = await client.provider_json(url, params, self.name, charge_quota=self.charges_quota,
+                                          endpoint=self.metrics_endpoint)
+        return self.parse(kind, query, data)
+
+    def score(self):
+        """Routing preference: weight, discounted by failures and typical latency
+
+        The median, not the p95, so a few slow calls don't move all traffic
+        away; hedging is what deals with the tail.
+        """
+        median = self.health.percentile(50) or 0.0
+        return self.weight * self.health.success_rate / (1 + median / LATENCY_SCALE)
+
+    def _get_json(self, url, params, session_get):
+        """GET and decode JSON, turning transport and HTTP errors into ProviderError"""
+        try:
+            response = session_get(url, params)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            # A 400/404 is the upstream's answer, not a sign it is unhealthy
+            raise ProviderError(str(e), retryable=status not in (400, 404), status=status)
+        except requests.exceptions.RequestException as e:
+            raise ProviderError(str(e))
+        except ValueError:
+            raise ProviderError(f"Invalid response from {self.name}")
+
+
+class OpenWeatherMapProvider(WeatherProvider):
+    """OpenWeatherMap, called through the WeatherService's quota-checked session"""
+
+    name = 'openweathermap'
+    charges_quota = True
+
+    def __init__(self, service, weight=1.0):
+        super().__init__(weight)
+        self.service = service
+
+    def request(self, kind, query, units):
+        url = f"{self.service.base_url}/weather" if kind == 'current' else self.service.forecast_url
+        return url, {**query.params, 'appid': self.service.api_key, 'units': units}
+
+    def _session_get(self, url, params):
+        return self.service._upstream_get(url, params)
+
+
+# WMO weather interpretation codes -> OpenWeatherMap (id, main, description, icon)
+WMO_CONDITIONS = {
+    0: (800, 'Clear', 'clear sky', '01'),
+    1: (801, 'Clouds', 'few clouds', '02'),
+    2: (802, 'Clouds', 'scattered clouds', '03'),
+    3: (804, 'Clouds', 'overcast clouds', '04'),
+    45: (741, 'Fog', 'fog', '50'),
+    48: (741, 'Fog', 'fog', '50'),
+    51: (300, 'Drizzle', 'light intensity drizzle', '09'),
+    53: (301, 'Drizzle', 'drizzle', '09'),
+    55: (302, 'Drizzle', 'heavy intensity drizzle', '09'),
+    56: (511, 'Rain', 'freezing rain', '13'),
+    57: (511, 'Rain', 'freezing rain', '13'),
+    61: (500, 'Rain', 'light rain', '10'),
+    63: (501, 'Rain', 'moderate rain', '10'),
+    65: (502, 'Rain', 'heavy intensity rain', '10'),
+    66: (511, 'Rain', 'freezing rain', '13'),
+    67: (511, 'Rain', 'freezing rain', '13'),
+    71: (600, 'Snow', 'light snow', '13'),
+    73: (601, 'Snow', 'snow', '13'),
+    75: (602, 'Snow', 'heavy snow', '13'),
+    77: (601, 'Snow', 'snow', '13'),
+    80: (520, 'Rain', 'light intensity shower rain', '09'),
+    81: (521, 'Rain', 'shower rain', '09'),
+    82: (522, 'Rain', 'heavy intensity shower rain', '09'),
+    85: (620, 'Snow', 'light shower snow', '13'),
+    86: (622, 'Snow', 'heavy shower snow', '13'),
+    95: (211, 'Thunderstorm', 'thunderstorm', '11'),
+    96: (201, 'Thunderstorm', 'thunderstorm with rain', '11'),
+    99: (202, 'Thunderstorm', 'thunderstorm with heavy rain', '11'),
+}
+
+_OPEN_METEO_CURRENT = ('temperature_2m,relative_humidity_2m,apparent_temperature,is_day,weather_code,'
+                       'cloud_cover,pressure_msl,wind_speed_10m,wind_direction_10m,wind_gusts_10m,visibility')
+_OPEN_METEO_HOURLY = ('temperature_2m,relative_humidity_2m,apparent_temperature,is_day,weather_code,'
+                      'cloud_cover,pressure_msl,wind_speed_10m,wind_direction_10m,precipitation_probability')
+
+
+def _present(row, column, default=None):
+    """row[column], or default when it is missing or null (Open-Meteo sends explicit nulls)"""
+    value = row.get(column)
+    return default if value is None else value
+
+
+def _condition(code, is_day=1):
+    owm_id, main, description, icon = WMO_CONDITIONS.get(int(code or 0), WMO_CONDITIONS[0])
+    return [{'id': owm_id, 'main': main, 'description': description,
+             'icon': icon + ('d' if is_day else 'n')}]
+
+
+class OpenMeteoProvider(WeatherProvider):
+    """Open-Meteo (no API key), normalized to OpenWeatherMap's response shape
+
+    It only takes coordinates, so it serves gazetteer-resolved places and
+    coordinate lookups; anything else stays with providers that geocode.
+    """
+
+    name = 'open-meteo'
+    metrics_endpoint = 'open_meteo'
+
+    def __init__(self, host=DEFAULT_OPEN_METEO_HOST, weight=1.0):
+        super().__init__(weight)
+        self.url = f"{host.rstrip('/')}/v1/forecast"
+
+    def supports(self, query):
+        return query.lat is not None and query.lon is not None
+
+    def request(self, kind, query, units):
+        if kind == 'current':
+            extra = {'current': _OPEN_METEO_CURRENT,
+                     'daily': 'temperature_2m_max,temperature_2m_min,sunrise,sunset', 'forecast_days': 1}
+        else:
+            extra = {'hourly': _OPEN_METEO_HOURLY, 'forecast_days': 6}
+        return self.url, {
+            'latitude': query.lat,
+            'longitude': query.lon,
+            'timezone': 'auto',
+            'timeformat': 'unixtime',
+            'temperature_unit': 'fahrenheit' if units == 'imperial' else 'celsius',
+            'wind_speed_unit': 'mph' if units == 'imperial' else 'ms',
+            **extra,
+        }
+
+    def _session_get(self, url, params):
+        with UpstreamTimer(url, endpoint=self.metrics_endpoint) as timer:
+            response = get_session().get(url, params=params, timeout=get_timeout())
+            timer.status = response.status_code
+        return response
+
+    def parse(self, kind, query, data):
+        return self._current(query, data) if kind == 'current' else self._forecast(query, data)
+
+    def _place(self, query, data):
+        return {
+            'name': query.name or f"{data['latitude']:.2f}, {data['longitude']:.2f}",
+            'country': query.country or '',
+            'coord': {'lat': data['latitude'], 'lon': data['longitude']},
+            'timezone': data.get('utc_offset_seconds', 0),
+        }
+
+    def _current(self, query, data):
+        now, daily = data['current'], data.get('daily') or {}
+        place = self._place(query, data)
+        temp = now.get('temperature_2m')
+        if temp is None:
+            raise ProviderError(f"{self.name} returned no temperature")
+
+        def first(column, default=None):
+            values = daily.get(column) or [None]
+            return default if values[0] is None else values[0]
+
+        weather = {
+            'coord': place['coord'],
+            'weather': _condition(now.get('weather_code'), _present(now, 'is_day', 1)),
+            'main': {
+                'temp': temp,
+                'feels_like': _present(now, 'apparent_temperature', temp),
+                'temp_min': first('temperature_2m_min', temp),
+                'temp_max': first('temperature_2m_max', temp),
+                'pressure': round(_present(now, 'pressure_msl', 0)),
+                'humidity': _present(now, 'relative_humidity_2m', 0),
+            },
+            'visibility': _present(now, 'visibility', 10000),
+            'wind': {'speed': _present(now, 'wind_speed_10m', 0), 'deg': _present(now, 'wind_direction_10m', 0)},
+            'clouds': {'all': _present(now, 'cloud_cover', 0)},
+            'dt': _present(now, 'time', int(time.time())),
+            'sys': {'country': place['country'], 'sunrise': first('sunrise', 0), 'sunset': first('sunset', 0)},
+            'timezone': place['timezone'],
+            'name': place['name'],
+            'provider': self.name,
+        }
+        if now.get('wind_gusts_10m') is not None:
+            weather['wind']['gust'] = now['wind_gusts_10m']
+        return weather
+
+    def _forecast(self, query, data):
+        hourly = data['hourly']
+        place = self._place(query, data)
+        slots = []
+        now = time.time()
+
+        def value(column, default=None):
+            values = hourly.get(column)
+            return default if not values or values[i] is None else values[i]
+
+        # OpenWeatherMap's forecast is 40 slots, 3 hours apart on UTC multiples of 3h
+        for i, timestamp in enumerate(hourly['time']):
+            if timestamp % 10800 or timestamp < now - 10800:
+                continue
+            temp = value('temperature_2m')
+            if temp is None:
+                continue
+            pop = value('precipitation_probability')
+            slots.append({
+                'dt': timestamp,
+                'main': {'temp': temp, 'feels_like': value('apparent_temperature', temp),
+                         'humidity': value('relative_humidity_2m', 0),
+                         'pressure': round(value('pressure_msl', 0))},
+                'weather': _condition(value('weather_code'), value('is_day', 1)),
+                'wind': {'speed': value('wind_speed_10m', 0), 'deg': value('wind_direction_10m', 0)},
+                'clouds': {'all': value('cloud_cover', 0)},
+                'pop': round(pop / 100, 2) if pop is not None else 0,
+                'dt_txt': datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            })
+            if len(slots) == 40:
+                break
+        city = {'name': place['name'], 'country': place['country'], 'coord': place['coord'],
+                'timezone': place['timezone']}
+        return {'cod': '200', 'cnt': len(slots), 'list': slots, 'city': city, 'provider': self.name}
+
+
+class ProviderRouter:
+    """Sends each upstream call to the healthiest provider, hedging slow ones
+
+    Providers whose breaker is open are skipped; the rest are ranked by
+    score() (configured weight times recent success rate, discounted by
+    median latency). The best one is called first. If it hasn't answered
+    within its own p95 the next one is called too and whichever answers
+    first wins (at most HEDGE_RATIO of calls may hedge, so a slow upstream
+    can't double the traffic). Failures fail over down the ranking.
+    """
+
+    def __init__(self, providers, hedging=True, hedge_delay=None):
+        self.providers = list(providers)
+        self.hedging = hedging
+        self.hedge_delay = hedge_delay
+        self.calls = 0
+        self.hedges = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def ranked(self, query):
+        """Providers that can take the query now, best first"""
+        candidates = [p for p in self.providers if p.supports(query) and p.breaker.available()]
+        # sorted() is stable, so equal scores keep the configured order
+        return sorted(candidates, key=lambda p: p.score(), reverse=True)
+
+    def current(self, query, units):
+        return self.fetch('current', query, units)
+
+    def forecast(self, query, units):
+        return self.fetch('forecast', query, units)
+
+    def fetch(self, kind, query, units):
+        """Fetch 'current' or 'forecast' for a ProviderQuery from the best available provider"""
+        with self._lock:
+            self.calls += 1
+        candidates = self.ranked(query)
+        if not candidates:
+            raise ProviderError("No weather provider is available right now")
+
+        errors = []
+        if self.hedging and len(candidates) > 1:
+            result = self._hedged(candidates[0], candidates[1], kind, query, units, errors)
+            if result is not None:
+                return result
+            candidates = candidates[2:]
+
+        for provider in candidates:
+            try:
+                return self._call(provider, kind, query, units)
+            except (ProviderError, QuotaExceeded) as e:
+                if isinstance(e, ProviderError) and not e.retryable:
+                    raise
+                errors.append((provider, e))
+        self._raise(errors)
+
+    async def fetch_async(self, kind, query, units, client):
+        """fetch() for asyncio callers, over client's (an AsyncWeatherService) aiohttp session
+
+        Same ranking, breakers, hedging and failover; the calls run as
+        tasks on the event loop instead of in the hedge thread pool.
+        """
+        with self._lock:
+            self.calls += 1
+        candidates = self.ranked(query)
+        if not candidates:
+            raise ProviderError("No weather provider is available right now")
+
+        errors = []
+        if self.hedging and len(candidates) > 1:
+            result = await self._hedged_async(candidates[0], candidates[1], kind, query, units, client, errors)
+            if result is not None:
+                return result
+            candidates = candidates[2:]
+
+        for provider in candidates:
+            try:
+                return await self._call_async(provider, kind, query, units, client)
+            except (ProviderError, QuotaExceeded) as e:
+                if isinstance(e, ProviderError) and not e.retryable:
+                    raise
+                errors.append((provider, e))
+        self._raise(errors)
+
+    def _call(self, provider, kind, query, units):
+        """One call to one provider, recording its outcome"""
+        self._admit(provider)
+        started = time.perf_counter()
+        try:
+            result = provider.fetch(kind, query, units)
+        except Exception as e:
+            raise self._failed(provider, e, started)
+        self._succeeded(provider, started)
+        return result
+
+    async def _call_async(self, provider, kind, query, units, client):
+        """_call() for the asyncio path"""
+        self._admit(provider)
+        started = time.perf_counter()
+        try:
+            result = await provider.fetch_async(kind, query, units, client)
+        except asyncio.CancelledError:
+            provider.breaker.release()
+            raise
+        except Exception as e:
+            raise self._failed(provider, e, started)
+        self._succeeded(provider, started)
+        return result
+
+    def _admit(self, provider):
+        if not provider.breaker.allow():
+            provider_calls.inc(provider.name, 'rejected')
+            raise ProviderError(f"{provider.name} is temporarily disabled after repeated failures")
+
+    def _succeeded(self, provider, started):
+        provider.breaker.record_success()
+        provider.health.record(True, time.perf_counter() - started)
+        provider_calls.inc(provider.name, 'ok')
+
+    def _failed(self, provider, error, started):
+        """Record a failed call; returns the exception to raise"""
+        if isinstance(error, QuotaExceeded):
+            # Our own budget, not the provider's health
+            provider.breaker.release()
+            provider_calls.inc(provider.name, 'quota')
+            return error
+        if isinstance(error, ProviderError) and not error.retryable:
+            self._succeeded(provider, started)
+            return error
+        provider.breaker.record_failure()
+        provider.health.record(False)
+        provider_calls.inc(provider.name, 'error')
+        return error if isinstance(error, ProviderError) else ProviderError(f"{provider.name}: {error}")
+
+    def _delay_for(self, provider):
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        p95 = provider.health.p95()
+        return max(MIN_HEDGE_DELAY, p95) if p95 is not None else DEFAULT_HEDGE_DELAY
+
+    def _take_hedge(self):
+        with self._lock:
+            if self.hedges >= HEDGE_RATIO * self.calls + 1:
+                return False
+            self.hedges += 1
+            return True
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS,
+                                                    thread_name_prefix='weather-hedge')
+        return self._pool
+
+    def _hedged(self, first, second, kind, query, units, errors):
+        """Race first against second (started late or on failure); None if both fail"""
+        pool = self._get_pool()
+        futures = {pool.submit(self._call, first, kind, query, units): first}
+        pending = set(futures)
+        deadline = time.monotonic() + self._delay_for(first)
+        second_started = hedge_declined = False
+
+        while True:
+            if not pending:
+                if second_started:
+                    return None
+                # First provider failed: fail over right away
+                second_started = True
+                future = pool.submit(self._call, second, kind, query, units)
+                futures[future] = second
+                pending.add(future)
+
+            waiting = second_started or hedge_declined
+            timeout = None if waiting else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except (ProviderError, QuotaExceeded) as e:
+                    if isinstance(e, ProviderError) and not e.retryable:
+                        raise
+                    errors.append((futures[future], e))
+
+            if not done and not waiting:
+                # First provider is slower than its p95: hedge, if the budget allows
+                if self._take_hedge():
+                    provider_hedges.inc(second.name)
+                    second_started = True
+                    future = pool.submit(self._call, second, kind, query, units)
+                    futures[future] = second
+                    pending.add(future)
+                else:
+                    hedge_declined = True
+
+    async def _hedged_async(self, first, second, kind, query, units, client, errors):
+        """_hedged() with tasks; a losing call is left to finish so its latency is still recorded"""
+        def start(provider):
+            task = asyncio.ensure_future(self._call_async(provider, kind, query, units, client))
+            # Retrieve the outcome of calls nobody waits for anymore
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            tasks[task] = provider
+            pending.add(task)
+
+        tasks = {}
+        pending = set()
+        start(first)
+        deadline = time.monotonic() + self._delay_for(first)
+        second_started = hedge_declined = False
+
+        while True:
+            if not pending:
+                if second_started:
+                    return None
+                # First provider failed: fail over right away
+                second_started = True
+                start(second)
+
+            waiting = second_started or hedge_declined
+            timeout = None if waiting else max(0.0, deadline - time.monotonic())
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    return task.result()
+                except (ProviderError, QuotaExceeded) as e:
+                    if isinstance(e, ProviderError) and not e.retryable:
+                        raise
+                    errors.append((tasks[task], e))
+
+            if not done and not waiting:
+                # First provider is slower than its p95: hedge, if the budget allows
+                if self._take_hedge():
+                    provider_hedges.inc(second.name)
+                    second_started = True
+                    start(second)
+                else:
+                    hedge_declined = True
+
+    def _raise(self, errors):
+        quota = [e for _, e in errors if isinstance(e, QuotaExceeded)]
+        if quota and len(quota) == len(errors):
+            raise quota[0]
+        if len(errors) == 1:
+            raise errors[0][1]
+        raise ProviderError('; '.join(f"{provider.name}: {e}" for provider, e in errors))
+
+    def after_fork(self):
+        """Drop the hedge pool inherited from a parent process"""
+        self._pool = None
+
+    def stats(self):
+        """Per-provider breaker state, health and routing score"""
+        return {
+            'calls': self.calls,
+            'hedges': self.hedges,
+            'providers': [{
+                'name': p.name,
+                'state': p.breaker.state,
+                'breaker_opened': p.breaker.opened,
+                'success_rate': round(p.health.success_rate, 3),
+                'p95_ms': round(p.health.p95() * 1000, 1) if p.health.p95() is not None else None,
+                'score': round(p.score(), 3),
+            } for p in self.providers],
+        }
+
+
+def _parse_providers(spec):
+    """'openweathermap,open-meteo:0.5' -> [(name, weight), ...]"""
+    providers = []
+    for item in spec.split(','):
+        name, _, weight = item.strip().partition(':')
+        if name:
+            providers.append((name.lower(), float(weight) if weight else 1.0))
+    return providers
+
+
+def create_router_from_env(service):
+    """Build the provider router for a WeatherService
+
+    WEATHER_PROVIDERS        - providers in order of preference, optionally
+                               weighted: 'openweathermap,open-meteo:0.5'
+                               (default openweathermap only)
+    WEATHER_OPEN_METEO_HOST  - Open-Meteo API host (e.g. a local stub)
+    WEATHER_HEDGE            - set to 0 to turn off hedged requests
+    WEATHER_HEDGE_DELAY_MS   - fixed hedge delay instead of the first provider's p95
+    """
+    factories = {
+        'openweathermap': lambda weight: OpenWeatherMapProvider(service, weight),
+        'open-meteo': lambda weight: OpenMeteoProvider(
+            os.getenv('WEATHER_OPEN_METEO_HOST', DEFAULT_OPEN_METEO_HOST), weight),
+    }
+    providers = []
+    for name, weight in _parse_providers(os.getenv('WEATHER_PROVIDERS', DEFAULT_PROVIDERS)):
+        if name not in factories:
+            raise Exception(f"Unknown weather provider '{name}' (choose from {', '.join(factories)})")
+        providers.append(factories[name](weight))
+
+    delay = os.getenv('WEATHER_HEDGE_DELAY_MS')
+    return ProviderRouter(
+        providers,
+        hedging=os.getenv('WEATHER_HEDGE', '1').lower() not in ('0', 'false', 'no'),
+        hedge_delay=float(delay) / 1000 if delay else None
+    )
@@ -0,0 +1,231 @@
+# Weather App - Rate Limiting
+# Keeps upstream API spend inside our plan and stops one client hogging it
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_UPSTREAM_PER_MINUTE = 60   # OpenWeatherMap free tier
+DEFAULT_UPSTREAM_PER_DAY = 0       # 0 = no daily cap
+DEFAULT_CLIENT_RATE = 5.0          # Inbound requests per second per client
+DEFAULT_CLIENT_BURST = 20
+MAX_TRACKED_CLIENTS = 10000
+
+
+class QuotaExceeded(Exception):
+    """Raised when an upstream call would exceed the API budget"""
+
+    def __init__(self, retry_after, message="Weather service is busy, please try again shortly"):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class TokenBucket:
+    """In-process token bucket: capacity tokens, refilled at rate per second"""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available; return 0, or seconds until they would be"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            return (tokens - self.tokens) / self.rate
+
+    def refund(self, tokens=1):
+        """Give back tokens taken for a call that didn't happen"""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def available(self):
+        """Tokens that could be taken right now"""
+        with self._lock:
+            elapsed = time.monotonic() - self.updated
+            return min(self.capacity, self.tokens + elapsed * self.rate)
+
+
+class SQLiteTokenBucket:
+    """Token bucket stored in SQLite so every worker process draws from one budget"""
+
+    def __init__(self, path, name, capacity, rate):
+        self.path = path
+        self.name = name
+        self.capacity = capacity
+        self.rate = rate
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            " name TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO rate_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+            (name, capacity, time.time())
+        )
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use (and after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available; return 0, or seconds until they would be"""
+        conn = self._connect()
+        # IMMEDIATE takes the write lock up front so workers can't double-spend
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current, updated = conn.execute(
+                "SELECT tokens, updated FROM rate_buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            current = min(self.capacity, current + max(0, now - updated) * self.rate)
+            wait = 0
+            if current >= tokens:
+                current -= tokens
+            else:
+                wait = (tokens - current) / self.rate
+            conn.execute(
+                "UPDATE rate_buckets SET tokens = ?, updated = ? WHERE name = ?",
+                (current, now, self.name)
+            )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def refund(self, tokens=1):
+        """Give back tokens taken for a call that didn't happen"""
+        self._connect().execute(
+            "UPDATE rate_buckets SET tokens = MIN(?, tokens + ?) WHERE name = ?",
+            (self.capacity, tokens, self.name)
+        )
+
+    def available(self):
+        """Tokens that could be taken right now"""
+        current, updated = self._connect().execute(
+            "SELECT tokens, updated FROM rate_buckets WHERE name = ?", (self.name,)
+        ).fetchone()
+        return min(self.capacity, current + max(0, time.time() - updated) * self.rate)
+
+
+class UpstreamQuota:
+    """Per-minute and optional per-day budget for upstream API calls"""
+
+    def __init__(self, per_minute=DEFAULT_UPSTREAM_PER_MINUTE, per_day=DEFAULT_UPSTREAM_PER_DAY,
+                 path=None):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.buckets = []
+        for name, limit, period in (('minute', per_minute, 60), ('day', per_day, 86400)):
+            if limit > 0:
+                if path:
+                    bucket = SQLiteTokenBucket(path, f"upstream_{name}", limit, limit / period)
+                else:
+                    bucket = TokenBucket(limit, limit / period)
+                self.buckets.append((name, bucket))
+        self.granted = 0
+        self.throttled = 0
+
+    def acquire(self):
+        """Spend one upstream call, or raise QuotaExceeded
+
+        A call refused by a later bucket (say the daily cap) gives back the
+        tokens already taken from the earlier ones, so throttled calls
+        don't use up the per-minute budget.
+        """
+        taken = []
+        for _, bucket in self.buckets:
+            wait = bucket.try_acquire()
+            if wait:
+                for spent in taken:
+                    spent.refund()
+                self.throttled += 1
+                raise QuotaExceeded(wait)
+            taken.append(bucket)
+        self.granted += 1
+
+    def stats(self):
+        """Return remaining budget and counters"""
+        stats = {
+            'per_minute': self.per_minute,
+            'per_day': self.per_day,
+            'granted': self.granted,
+            'throttled': self.throttled,
+        }
+        for name, bucket in self.buckets:
+            stats[f'remaining_{name}'] = int(bucket.available())
+        return stats
+
+
+class ClientRateLimiter:
+    """Inbound token bucket per client (e.g. per IP address)"""
+
+    def __init__(self, rate=DEFAULT_CLIENT_RATE, burst=DEFAULT_CLIENT_BURST,
+                 max_clients=MAX_TRACKED_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def check(self, client_id):
+        """Return 0 if the request may proceed, else seconds to wait"""
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                bucket = TokenBucket(self.burst, self.rate)
+                self._buckets[client_id] = bucket
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client_id)
+
+        wait = bucket.try_acquire()
+        if wait:
+            self.rejected += 1
+        return wait
+
+
+def shared_quota_path():
+    """Default SQLite file for a call budget shared by several workers"""
+    return os.path.join(tempfile.gettempdir(), 'weather_app_quota.db')
+
+
+def create_quota_from_env():
+    """Build the UpstreamQuota from the environment
+
+    WEATHER_QUOTA_PER_MINUTE - upstream calls allowed per minute (0 = unlimited)
+    WEATHER_QUOTA_PER_DAY    - upstream calls allowed per day (0 = unlimited)
+    WEATHER_QUOTA_PATH       - SQLite file shared by all workers
+                               (defaults to WEATHER_CACHE_PATH when that is set)
+
+    Without either path the budget is per process. `main.py --web` points
+    its workers at shared_quota_path() when neither is set.
+    """
+    return UpstreamQuota(
+        per_minute=int(os.getenv('WEATHER_QUOTA_PER_MINUTE', DEFAULT_UPSTREAM_PER_MINUTE)),
+        per_day=int(os.getenv('WEATHER_QUOTA_PER_DAY', DEFAULT_UPSTREAM_PER_DAY)),
+        path=os.getenv('WEATHER_QUOTA_PATH') or os.getenv('WEATHER_CACHE_PATH') or None
+    )
@@ -4,15 +4,54 @@
 
 import os
 import json
-from flask import Flask, render_template, request, jsonify
-from weather_app import WeatherService, LocationService
+import atexit
+import importlib
+import uuid
+from collections import Counter
+from flask import Flask, Response, g, render_template, request, jsonify, session
+from weather_app import SUPPORTED_UNITS, WeatherService, LocationService
+import http_client
+from cache import make_cache_key
+from http_caching import etag_matches, finalize_response, make_etag, not_modified, compressed_bodies
+from ratelimit import ClientRateLimiter, QuotaExceeded, DEFAULT_CLIENT_RATE, DEFAULT_CLIENT_BURST
+from live_updates import LiveUpdateHub, start_stream_server, stream_settings_from_env
+from lazy_imports import is_installed, lazy_module
+from metrics import (api_errors, create_profiler_from_env, http_in_flight, http_latency,
+                     http_requests, registry)
 from datetime import datetime
 import threading
 import time
 
+# Only the async report, live updates and shutdown need an event loop
+asyncio = lazy_module('asyncio')
+# Imported on first use, or up front by warm_up(preload=True) before forking
+PRELOAD_MODULES = ('requests', 'urllib3.util.retry', 'aiohttp.web', 'async_weather')
+
+# Background refresh settings
+REFRESH_ENABLED = os.getenv('WEATHER_REFRESH_ENABLED', '1').lower() not in ('0', 'false', 'no')
+REFRESH_TOP_K = int(os.getenv('WEATHER_REFRESH_TOP_K', 50))
+REFRESH_INTERVAL = float(os.getenv('WEATHER_REFRESH_INTERVAL', 30))
+REFRESH_BUDGET = float(os.getenv('WEATHER_REFRESH_BUDGET', 30))  # upstream calls per minute
+
+# Inbound rate limit per client on /api/* routes
+CLIENT_RATE = float(os.getenv('WEATHER_CLIENT_RATE', DEFAULT_CLIENT_RATE))
+CLIENT_BURST = int(os.getenv('WEATHER_CLIENT_BURST', DEFAULT_CLIENT_BURST))
+
+# Batch endpoint limits
+BATCH_MAX_LOCATIONS = int(os.getenv('WEATHER_BATCH_MAX_LOCATIONS', 100))
+BATCH_MAX_WORKERS = int(os.getenv('WEATHER_BATCH_WORKERS', 8))
+
 # Create Flask application
 app = Flask(__name__)
 app.secret_key = 'my-weather-app-secret-key-2024'
+# Let browsers keep static files for a while (they revalidate with ETags after)
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = int(os.getenv('WEATHER_STATIC_MAX_AGE', 3600))
+# Behind N reverse proxies, take the client address (used for rate limits and
+# /api/location) from X-Forwarded-For
+TRUSTED_PROXIES = int(os.getenv('WEATHER_TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
 
 # Create weather and location service instances
 weather_service = WeatherService()
@@ -30,16 +69,482 @@ def setup_api_key():
 # Initialize API key when server starts
 setup_api_key()
 
+class HotLocationRefresher:
+    """Keeps the most requested locations fresh in a background thread
+
+    WeatherService reports every cache lookup through touch(). Every
+    interval the top_k most requested keys that are about to expire are
+    re-fetched ahead of time, and revalidate() lets a request be answered
+    from a stale entry while it is refreshed here. All background fetches
+    share a token bucket of budget_per_minute upstream calls.
+    """
+
+    def __init__(self, service, top_k=REFRESH_TOP_K, interval=REFRESH_INTERVAL,
+                 budget_per_minute=REFRESH_BUDGET, decay=0.5):
+        self.service = service
+        self.top_k = top_k
+        self.interval = interval
+        self.budget_per_minute = budget_per_minute
+        self.decay = decay
+
+        self._counts = Counter()
+        self._fetchers = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._tokens = budget_per_minute
+        self._last_refill = time.monotonic()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.refreshed = 0
+        self.revalidated = 0
+        self.over_budget = 0
+        self.errors = 0
+
+    def touch(self, endpoint, location, units, fetch):
+        """Count a request for a key and remember how to fetch it"""
+        key = (endpoint, location, units)
+        with self._lock:
+            self._counts[key] += 1
+            self._fetchers[key] = fetch
+
+    def touch_known(self, endpoint, location, units):
+        """Count a request that was answered without a lookup (e.g. a 304)"""
+        key = (endpoint, location, units)
+        with self._lock:
+            if key in self._fetchers:
+                self._counts[key] += 1
+
+    def revalidate(self, endpoint, location, units, fetch):
+        """Queue a background refresh; False if the budget can't cover it"""
+        key = (endpoint, location, units)
+        with self._lock:
+            if key in self._pending:
+                return True
+            if not self._take_token():
+                self.over_budget += 1
+                return False
+            self._pending[key] = fetch
+        self._wake.set()
+        return True
+
+    def _take_token(self):
+        """Spend one upstream call from the refresh budget (lock must be held)"""
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(self.budget_per_minute,
+                           self._tokens + elapsed * self.budget_per_minute / 60)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _refresh(self, key, fetch):
+        """Re-fetch one key through WeatherService, never raising"""
+        try:
+            self.service.refresh_entry(*key, fetch)
+            return True
+        except Exception:
+            self.errors += 1
+            return False
+
+    def _refresh_hot(self):
+        """Refresh popular keys that expire before the next scan comes round"""
+        with self._lock:
+            hot = [key for key, _ in self._counts.most_common(self.top_k)]
+            # Decay counts so yesterday's favourites eventually cool off
+            for key in list(self._counts):
+                self._counts[key] *= self.decay
+                if self._counts[key] < 0.01:
+                    del self._counts[key]
+                    self._fetchers.pop(key, None)
+
+        now = time.time()
+        for key in hot:
+            if self._stop.is_set():
+                return
+            expires_at = self.service.cache.expires_at(*key)
+            lead_time = max(2 * self.interval, 0.1 * self.service.cache.ttl_for(key[0]))
+            if expires_at is None or expires_at - now > lead_time:
+                continue
+
+            with self._lock:
+                fetch = self._fetchers.get(key)
+                allowed = fetch is not None and self._take_token()
+                if fetch is not None and not allowed:
+                    self.over_budget += 1
+            if allowed and self._refresh(key, fetch):
+                self.refreshed += 1
+
+    def _run(self):
+        """Background loop: handle revalidations, scan hot keys every interval"""
+        next_scan = time.monotonic() + self.interval
+        while not self._stop.is_set():
+            self._wake.wait(max(0, next_scan - time.monotonic()))
+            self._wake.clear()
+
+            while not self._stop.is_set():
+                with self._lock:
+                    if not self._pending:
+                        break
+                    key, fetch = next(iter(self._pending.items()))
+                if self._refresh(key, fetch):
+                    self.revalidated += 1
+                with self._lock:
+                    self._pending.pop(key, None)
+
+            if time.monotonic() >= next_scan and not self._stop.is_set():
+                self._refresh_hot()
+                next_scan = time.monotonic() + self.interval
+
+    def start(self):
+        """Start the background thread (once)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='weather-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the background thread, waiting for an in-progress fetch"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        """Return refresh counters"""
+        with self._lock:
+            tracked = len(self._counts)
+            pending = len(self._pending)
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'tracked_keys': tracked,
+            'pending': pending,
+            'refreshed': self.refreshed,
+            'revalidated': self.revalidated,
+            'over_budget': self.over_budget,
+            'errors': self.errors,
+            'budget_per_minute': self.budget_per_minute,
+        }
+
+refresher = HotLocationRefresher(weather_service)
+if REFRESH_ENABLED:
+    weather_service.refresher = refresher
+    refresher.start()
+
+# The async service runs on one background event loop so its connection
+# pool and request coalescing are shared across all Flask worker threads
+_async_loop = None
+_async_service = None
+_async_lock = threading.Lock()
+
+def get_async_runtime():
+    """Return (event loop, AsyncWeatherService), starting the loop thread on first use"""
+    global _async_loop, _async_service
+    with _async_lock:
+        if _async_loop is None:
+            from async_weather import AsyncWeatherService
+            _async_loop = asyncio.new_event_loop()
+            threading.Thread(target=_async_loop.run_forever, name='weather-async-loop', daemon=True).start()
+            # One cache, quota, router and station index for both: breaker
+            # state, budget and nearby stations are shared
+            _async_service = AsyncWeatherService(shared=weather_service)
+    return _async_loop, _async_service
+
+def run_async(make_coro, timeout=30):
+    """Run make_coro(async_service) on the shared event loop and wait for the result"""
+    loop, service = get_async_runtime()
+    future = asyncio.run_coroutine_threadsafe(make_coro(service), loop)
+    return future.result(timeout)
+
+STREAM_SETTINGS = stream_settings_from_env()
+live_hub = None
+_stream_runner = None
+
+def start_live_updates(reuse_port=False, wait=True):
+    """Serve /api/stream (Server-Sent Events) from the shared event loop
+
+    The stream gets its own port because a WSGI worker would tie up a
+    thread per open connection; on the event loop an idle subscriber is
+    just a queue. Under gunicorn every worker binds the port with
+    SO_REUSEPORT and the kernel spreads connections across them.
+    With wait=False it starts in the background (importing aiohttp takes
+    a while), so the web server can answer its first request sooner.
+    """
+    global live_hub, _stream_runner
+    if not STREAM_SETTINGS['port'] or _stream_runner is not None:
+        return False
+    if not wait:
+        threading.Thread(target=start_live_updates, args=(reuse_port,),
+                         name='weather-live-start', daemon=True).start()
+        return True
+    try:
+        loop, service = get_async_runtime()
+        live_hub = LiveUpdateHub(service, STREAM_SETTINGS['interval'], STREAM_SETTINGS['max_subscribers'])
+        _stream_runner = asyncio.run_coroutine_threadsafe(
+            start_stream_server(live_hub, os.getenv('WEATHER_HOST', '0.0.0.0'),
+                                STREAM_SETTINGS['port'], reuse_port,
+                                validate=location_service.validate_location, limiter=client_limiter,
+                                extra_origins=STREAM_SETTINGS['origins']),
+            loop
+        ).result(10)
+        return True
+    except (ImportError, OSError) as e:
+        live_hub = None
+        print(f"⚠️  Live updates disabled: {e}")
+        return False
+
+def shutdown_background_tasks():
+    """Stop the refresher and the async event loop (runs at interpreter exit)"""
+    refresher.stop()
+    if _async_loop is not None and _async_loop.is_running():
+        if _stream_runner is not None:
+            asyncio.run_coroutine_threadsafe(_stream_runner.cleanup(), _async_loop).result(10)
+        if _async_service is not None:
+            asyncio.run_coroutine_threadsafe(_async_service.close(), _async_loop).result(5)
+        _async_loop.call_soon_threadsafe(_async_loop.stop)
+
+atexit.register(shutdown_background_tasks)
+
+def warm_up(preload=False):
+    """Load shared, read-mostly state up front
+
+    Under a pre-forking server this runs once in the master, so every
+    worker inherits the mapped gazetteer and the suggestion index instead
+    of building its own on the first request. preload=True also imports
+    the modules that are otherwise loaded lazily, so forked workers share
+    them instead of each importing its own copy.
+    """
+    started = time.time()
+    if preload:
+        for name in PRELOAD_MODULES:
+            if is_installed(name.split('.')[0]):
+                importlib.import_module(name)
+    try:
+        location_service.gazetteer.load()
+        location_service.suggestion_index.search('a')
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Gazetteer not available: {e}")
+    if weather_service.snapshot is not None:
+        try:
+            snapshot = weather_service.snapshot.open()
+            mode = "serving offline" if weather_service.offline else "fallback when the upstream is down"
+            print(f"📦 Offline snapshot: {snapshot.count} entries ({mode})")
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Offline snapshot not available: {e}")
+    return time.time() - started
+
+def after_fork():
+    """Give a freshly forked worker its own connections and background threads"""
+    # Sockets and threads don't survive fork() safely; SQLite connections
+    # notice the new pid and reopen by themselves
+    http_client.close_session()
+    weather_service.session = None      # Reopened on the first upstream call
+    location_service.ip_locator.after_fork()
+    weather_service.providers.after_fork()
+    if REFRESH_ENABLED:
+        refresher.start()
+    start_live_updates(reuse_port=True)
+
+client_limiter = ClientRateLimiter(CLIENT_RATE, CLIENT_BURST)
+
+# Opt-in: WEATHER_PROFILE_SLOW_MS dumps stacks of slow requests
+profiler = create_profiler_from_env()
+
+def route_label():
+    """Route pattern for metric labels (the pattern, not the URL, to bound cardinality)"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def api_error(e):
+    """Turn an exception from the weather service into a JSON error response"""
+    api_errors.inc(route_label(), type(e).__name__)
+    if isinstance(e, QuotaExceeded):
+        response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    app.logger.error("%s %s failed: %s: %s", request.method, request.path, type(e).__name__, e)
+    return jsonify({'error': str(e)}), 500
+
+@app.before_request
+def start_request_metrics():
+    """Start timing the request (registered first so rejected requests are counted too)"""
+    g.request_started = time.perf_counter()
+    http_in_flight.inc()
+    if profiler is not None:
+        profiler.begin()
+
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc=None):
+    """Record latency and status once the response is done"""
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    duration = time.perf_counter() - started
+    route = route_label()
+    http_in_flight.dec()
+    http_requests.inc(route, request.method, g.get('response_status', 500))
+    http_latency.observe(duration, route)
+    if profiler is not None:
+        profiler.end(f"{request.method} {route}", duration)
+
+@app.before_request
+def limit_client_rate():
+    """Reject /api/* requests from clients going over their request rate"""
+    if not request.path.startswith('/api/'):
+        return None
+
+    wait = client_limiter.check(request.remote_addr or 'unknown')
+    if wait:
+        retry_after = max(1, int(wait + 0.999))
+        response = jsonify({'error': 'Too many requests, please slow down', 'retry_after': retry_after})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 429
+    return None
+
+@app.after_request
+def add_http_caching(response):
+    """ETags, conditional GET and compression for every successful GET"""
+    return finalize_response(request, response)
+
+def cache_validators(endpoint, location, units, *variant):
+    """(ETag, max-age) for a response built from a cached upstream entry, or None
+
+    The ETag changes whenever the upstream entry is refreshed, so it can be
+    checked before doing any formatting work.
+    """
+    expires_at = weather_service.cache.expires_at(endpoint, location, units)
+    if expires_at is None:
+        return None
+    etag = make_etag(request.path, make_cache_key(endpoint, location, units), expires_at, *variant)
+    return etag, max(0, int(expires_at - time.time()))
+
+def check_not_modified(endpoint, location, units, *variant):
+    """Return a 304 response if the client already has the current version
+
+    Only a fresh entry can answer early. An entry in its stale window goes
+    through the normal path, which starts a refresh (or fetches) before
+    validators are compared again.
+    """
+    expires_at = weather_service.cache.expires_at(endpoint, location, units)
+    if expires_at is None or expires_at <= time.time():
+        return None
+    validators = cache_validators(endpoint, location, units, *variant)
+    if validators and etag_matches(request, validators[0]):
+        refresher.touch_known(endpoint, location, units)
+        return not_modified(*validators)
+    return None
+
+def with_validators(response, data, endpoint, location, units, *variant):
+    """Set ETag and Cache-Control on a response built from data, if data is the cache entry
+
+    A fresh entry is what the service answered with. Past expiry the answer
+    may instead be a snapshot fallback, which must not carry the entry's
+    validators, so the entry is compared with data.
+    """
+    validators = cache_validators(endpoint, location, units, *variant)
+    if validators and not validators[1]:
+        entry = weather_service.cache.lookup(endpoint, location, units)
+        if entry is None or entry[0] != data:
+            return response
+    if validators:
+        response.set_etag(validators[0])
+        response.cache_control.public = True
+        response.cache_control.max_age = validators[1]
+    return response
+
+def get_client_id():
+    """Return this browser's anonymous ID, used to keep search history per user"""
+    if 'client_id' not in session:
+        session['client_id'] = uuid.uuid4().hex
+    return session['client_id']
+
+@app.route('/healthz')
+def health_check():
+    """Readiness probe for load balancers and process managers"""
+    ready = bool(weather_service.api_key) or weather_service.offline
+    return jsonify({
+        'status': 'ok' if ready else 'starting',
+        'pid': os.getpid(),
+        'offline': weather_service.offline,
+        'gazetteer_loaded': location_service.gazetteer.count > 0,
+        'refresher_running': refresher.stats()['running']
+    }), 200 if ready else 503
+
+def collect_service_metrics():
+    """Read cache, coalescing, quota and refresher counters at scrape time"""
+    cache = weather_service.cache.stats()
+    coalescing = weather_service.inflight.stats()
+    quota = weather_service.quota.stats()
+    refresh = refresher.stats()
+    providers = weather_service.providers.stats()['providers']
+    collected = [
+        ('weather_cache_entries', 'Responses currently cached', 'gauge', cache.get('entries')),
+        ('weather_cache_evictions_total', 'Cache entries evicted to stay under max size', 'counter',
+         cache.get('evictions')),
+        ('weather_upstream_coalesced_total', 'Requests that shared another request\'s upstream call',
+         'counter', coalescing['coalesced']),
+        ('weather_quota_granted_total', 'Upstream calls allowed by the quota', 'counter', quota['granted']),
+        ('weather_quota_throttled_total', 'Upstream calls refused by the quota', 'counter',
+         quota['throttled']),
+        ('weather_quota_remaining', 'Upstream calls left in the current window', 'gauge',
+         {(('window', name[len('remaining_'):]),): value
+          for name, value in quota.items() if name.startswith('remaining_')}),
+        ('weather_refresher_refreshed_total', 'Entries refreshed in the background', 'counter',
+         refresh['refreshed']),
+        ('weather_refresher_pending', 'Background refreshes waiting to run', 'gauge', refresh['pending']),
+        ('weather_client_rate_limited_total', 'Requests rejected with 429', 'counter',
+         client_limiter.rejected),
+        ('weather_provider_breaker_open', 'Whether a provider\'s circuit breaker is open (1) or not (0)',
+         'gauge', {(('provider', p['name']),): int(p['state'] == 'open') for p in providers}),
+        ('weather_provider_success_rate', 'Recent success rate per provider', 'gauge',
+         {(('provider', p['name']),): p['success_rate'] for p in providers}),
+    ]
+    if weather_service.snapshot is not None:
+        snapshot = weather_service.snapshot.stats()
+        collected.append(('weather_snapshot_age_seconds', 'Seconds since the offline snapshot was written',
+                          'gauge', snapshot['age_seconds']))
+        collected.append(('weather_snapshot_served_total', 'Responses answered from the offline snapshot',
+                          'counter', snapshot['hits']))
+    if profiler is not None:
+        collected.append(('weather_profiler_dumps_total', 'Slow requests whose stacks were dumped',
+                          'counter', profiler.dumped))
+    return collected
+
+registry.add_collector(collect_service_metrics)
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus text exposition of this process's metrics"""
+    return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/')
 def home():
     """Display the main weather app page"""
-    return render_template('weather_index.html')
+    stream_url = STREAM_SETTINGS['url']
+    if not stream_url and live_hub is not None:
+        stream_url = f"{request.scheme}://{request.host.split(':')[0]}:{STREAM_SETTINGS['port']}/api/stream"
+    return render_template('weather_index.html', stream_url=stream_url)
 
 @app.route('/api/weather')
 def get_weather():
-    """API endpoint to get current weather"""
+    """API endpoint to get current weather (by location name, or by lat and lon)"""
     location = request.args.get('location', '').strip()
     units = request.args.get('units', 'metric')
+    if units not in SUPPORTED_UNITS:
+        return jsonify({'error': 'units must be metric or imperial'}), 400
+    # The raw upstream copy doubles the payload, so it's opt-in
+    include_raw = request.args.get('raw', '').lower() in ('1', 'true', 'yes')
+
+    if 'lat' in request.args or 'lon' in request.args:
+        return get_weather_at_coordinates(units, include_raw)
 
     if not location:
         return jsonify({'error': 'Location parameter is required'}), 400
@@ -49,6 +554,10 @@ def get_weather():
     if not is_valid:
         return jsonify({'error': message}), 400
 
+    unchanged = check_not_modified('weather', location, units, include_raw)
+    if unchanged:
+        return unchanged
+
     try:
         # Ensure API key is set
         if not weather_service.api_key:
@@ -57,24 +566,189 @@ def get_weather():
 
         # Get weather data
         weather_data = weather_service.get_current_weather(location, units)
-        formatted_data = weather_service.format_weather_data(weather_data, units)
+        formatted_data = weather_service.format_weather_data(weather_data, units, include_raw)
+        location_service.add_to_history(location, get_client_id())
 
-        return jsonify({
+        return with_validators(jsonify({
             'success': True,
             'data': formatted_data
-        })
+        }), weather_data, 'weather', location, units, include_raw)
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return api_error(e)
+
+def parse_coordinates(args):
+    """(lat, lon) from request arguments, or raise ValueError"""
+    try:
+        lat, lon = float(args['lat']), float(args['lon'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("lat and lon must both be numbers")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("Coordinates out of range")
+    return lat, lon
+
+def get_weather_at_coordinates(units, include_raw):
+    """Current weather for /api/weather?lat=&lon=, shared by everyone in the same geohash cell"""
+    try:
+        lat, lon = parse_coordinates(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # A nearby station's entry may answer instead of the point's own cell;
+    # validators come from whichever entry does
+    source = weather_service.coordinate_source(lat, lon, units)
+    unchanged = check_not_modified('weather', source, units, include_raw)
+    if unchanged:
+        return unchanged
+
+    try:
+        weather_data = weather_service.get_weather_by_coordinates(lat, lon, units)
+        formatted_data = weather_service.format_weather_data(weather_data, units, include_raw)
+        return with_validators(jsonify({
+            'success': True,
+            'data': formatted_data
+        }), weather_data, 'weather', weather_service.coordinate_source(lat, lon, units), units, include_raw)
+    except Exception as e:
+        return api_error(e)
+
+@app.route('/api/stations/nearest')
+def get_nearest_stations():
+    """API endpoint listing the closest stations this server has observations for"""
+    try:
+        lat, lon = parse_coordinates(request.args)
+        limit = max(1, min(int(request.args.get('limit', 5)), 50))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    max_distance = request.args.get('max_km', type=float)
+
+    return jsonify({
+        'success': True,
+        'stations': weather_service.nearest_stations(lat, lon, limit, max_distance)
+    })
+
+def parse_batch_location(item):
+    """Turn one batch entry into a location key, or raise ValueError"""
+    if isinstance(item, str):
+        location = item.strip()
+        is_valid, message = location_service.validate_location(location)
+        if not is_valid:
+            raise ValueError(message)
+        return location
+
+    if isinstance(item, dict):
+        if 'id' in item:
+            return int(item['id'])
+        if 'lat' in item and 'lon' in item:
+            lat, lon = float(item['lat']), float(item['lon'])
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError("Coordinates out of range")
+            return (lat, lon)
+
+    raise ValueError("Each location must be a name, {lat, lon} or {id}")
+
+@app.route('/api/weather/batch', methods=['POST'])
+def get_weather_batch():
+    """API endpoint to get current weather for many locations in one request
+
+    units=both returns a metric and an imperial view of each location,
+    both formatted from one metric fetch.
+    """
+    body = request.get_json(silent=True) or {}
+    items = body.get('locations')
+    units = body.get('units', 'metric')
+
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'locations must be a non-empty list'}), 400
+    if units not in ('metric', 'imperial', 'both'):
+        return jsonify({'error': 'units must be metric, imperial or both'}), 400
+    if len(items) > BATCH_MAX_LOCATIONS:
+        return jsonify({'error': f'At most {BATCH_MAX_LOCATIONS} locations per request'}), 400
+
+    # Ensure API key is set
+    if not weather_service.api_key:
+        weather_service.api_key = os.getenv('WEATHER_API_KEY') or "eadd8028ae3041f819b0f4068e02a02c"
+
+    parsed = []
+    for item in items:
+        try:
+            parsed.append(parse_batch_location(item))
+        except (TypeError, ValueError) as e:
+            parsed.append(e)
+
+    fetch_units = 'metric' if units == 'both' else units
+    views = ('metric', 'imperial') if units == 'both' else (units,)
+    fetched = weather_service.get_current_weather_batch(
+        [loc for loc in parsed if not isinstance(loc, Exception)],
+        fetch_units,
+        max_workers=BATCH_MAX_WORKERS
+    )
+
+    outcomes = [loc if isinstance(loc, Exception) else fetched.get(loc) for loc in parsed]
+    ok = [i for i, outcome in enumerate(outcomes) if outcome is not None and not isinstance(outcome, Exception)]
+    # Every successful response is formatted in one columnar pass per view
+    formatted = weather_service.format_weather_batch([outcomes[i] for i in ok], fetch_units, views)
+    position = {i: n for n, i in enumerate(ok)}
+
+    results = []
+    for i, (item, outcome) in enumerate(zip(items, outcomes)):
+        if i not in position:
+            results.append({'location': item, 'success': False, 'error': str(outcome or 'No data')})
+            continue
+        data = {view: formatted[view][position[i]] for view in views}
+        error = next((value for value in data.values() if isinstance(value, Exception)), None)
+        if error is not None:
+            results.append({'location': item, 'success': False, 'error': f'Unexpected weather data: {error}'})
+        else:
+            results.append({'location': item, 'success': True, 'data': data if units == 'both' else data[units]})
+
+    return jsonify({
+        'success': True,
+        'count': len(results),
+        'results': results
+    })
+
+@app.route('/api/suggest')
+def suggest_locations():
+    """API endpoint for location autocomplete"""
+    query = request.args.get('q', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limit', 5)), 1), 20)
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+
+    suggestions = location_service.get_location_suggestions(query, get_client_id(), limit)
+    return jsonify({
+        'success': True,
+        'query': query,
+        'suggestions': suggestions
+    })
 
 @app.route('/api/forecast')
 def get_forecast():
-    """API endpoint to get weather forecast"""
+    """API endpoint to get weather forecast
+
+    format=raw (default) returns the upstream response as-is,
+    format=compact parallel arrays per field; aggregate=daily returns one
+    compact row per day with min/max/mean values instead of 3-hour slots.
+    """
     location = request.args.get('location', '').strip()
     units = request.args.get('units', 'metric')
+    if units not in SUPPORTED_UNITS:
+        return jsonify({'error': 'units must be metric or imperial'}), 400
+    output_format = request.args.get('format', 'raw')
+    aggregate = request.args.get('aggregate', '')
 
     if not location:
         return jsonify({'error': 'Location parameter is required'}), 400
+    if output_format not in ('compact', 'raw'):
+        return jsonify({'error': 'format must be compact or raw'}), 400
+    if aggregate not in ('', 'daily'):
+        return jsonify({'error': 'aggregate must be daily'}), 400
+
+    endpoint = 'forecast' if output_format == 'raw' and not aggregate else 'forecast_compact'
+    unchanged = check_not_modified(endpoint, location, units, aggregate)
+    if unchanged:
+        return unchanged
 
     try:
         # Ensure API key is set
@@ -83,25 +757,83 @@ def get_forecast():
             weather_service.api_key = api_key
 
         # Get forecast data
-        forecast_data = weather_service.get_forecast(location, units)
+        if endpoint == 'forecast':
+            source = forecast_data = weather_service.get_forecast(location, units)
+        else:
+            source = weather_service.get_compact_forecast(location, units)
+            forecast_data = source['daily'] if aggregate == 'daily' else source['slots']
 
-        return jsonify({
+        return with_validators(jsonify({
             'success': True,
             'data': forecast_data
+        }), source, endpoint, location, units, aggregate)
+
+    except Exception as e:
+        return api_error(e)
+
+@app.route('/api/report')
+def get_full_report():
+    """API endpoint for current weather, forecast and air quality in one call"""
+    location = request.args.get('location', '').strip()
+    units = request.args.get('units', 'metric')
+    if units not in SUPPORTED_UNITS:
+        return jsonify({'error': 'units must be metric or imperial'}), 400
+
+    if not location:
+        return jsonify({'error': 'Location parameter is required'}), 400
+
+    is_valid, message = location_service.validate_location(location)
+    if not is_valid:
+        return jsonify({'error': message}), 400
+
+    try:
+        report = run_async(lambda service: service.get_full_report(location, units))
+        if report['weather'] is None:
+            return jsonify({'error': report['errors'].get('weather', 'Weather data unavailable')}), 500
+
+        return jsonify({
+            'success': True,
+            'data': report
         })
 
+    except ImportError as e:
+        return jsonify({'error': str(e)}), 501
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return api_error(e)
+
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    """API endpoint to inspect the upstream response cache"""
+    return jsonify({
+        'success': True,
+        'cache': weather_service.cache.stats(),
+        'coalescing': weather_service.inflight.stats(),
+        'refresher': refresher.stats(),
+        'quota': weather_service.quota.stats(),
+        'rate_limited_requests': client_limiter.rejected,
+        'compressed_bodies': compressed_bodies.stats(),
+        'live_updates': live_hub.stats() if live_hub is not None else None,
+        'stations': len(weather_service.stations),
+        'ip_locations': location_service.ip_locator.stats(),
+        'providers': weather_service.providers.stats(),
+        'snapshot': weather_service.snapshot.stats() if weather_service.snapshot is not None else None,
+        'offline': weather_service.offline
+    })
 
 @app.route('/api/location')
 def auto_detect_location():
-    """API endpoint for automatic location detection"""
+    """API endpoint for automatic location detection from the client's IP"""
     try:
-        location = location_service.get_location_by_ip()
-        if location:
+        # ProxyFix has already taken the client from X-Forwarded-For when
+        # WEATHER_TRUSTED_PROXIES is set; otherwise the header can be forged
+        detected = location_service.get_location_by_ip(request.remote_addr)
+        if detected:
             return jsonify({
                 'success': True,
-                'location': location
+                'location': detected['name'],
+                'lat': detected['lat'],
+                'lon': detected['lon'],
+                'method': detected['method']
             })
         else:
             return jsonify({
@@ -109,34 +841,45 @@ def auto_detect_location():
                 'error': 'Could not detect location automatically'
             }), 404
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return api_error(e)
 
 @app.route('/api/weather-history')
 def get_weather_history():
-    """API endpoint to get weather history (mock data for demo)"""
+    """API endpoint to get recorded weather history
+
+    days (default 7, max 366) picks the range, resolution is raw, hourly
+    or daily (default) and units converts the stored metric values.
+    """
     location = request.args.get('location', '').strip()
+    units = request.args.get('units', 'metric')
+    if units not in SUPPORTED_UNITS:
+        return jsonify({'error': 'units must be metric or imperial'}), 400
+    resolution = request.args.get('resolution', 'daily')
 
     if not location:
         return jsonify({'error': 'Location parameter is required'}), 400
 
-    # Mock historical data for demonstration
-    import random
-    from datetime import datetime, timedelta
-
-    history = []
-    for i in range(7):  # Last 7 days
-        date = datetime.now() - timedelta(days=i)
-        temp = random.randint(15, 30)
-        history.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'temperature': temp,
-            'condition': random.choice(['Sunny', 'Cloudy', 'Rainy', 'Partly Cloudy']),
-            'humidity': random.randint(40, 80)
-        })
+    if weather_service.history is None:
+        return jsonify({'error': 'Weather history recording is disabled'}), 404
+
+    try:
+        days = min(max(int(request.args.get('days', 7)), 1), 366)
+    except ValueError:
+        return jsonify({'error': 'days must be a number'}), 400
+
+    end = int(time.time())
+    start = end - days * 86400
+    try:
+        history = weather_service.history.query(location, start, end, resolution, units)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return api_error(e)
 
     return jsonify({
         'success': True,
         'location': location,
+        'resolution': resolution,
         'history': history
     })
 
@@ -0,0 +1,121 @@
+# Weather App - Request Coalescing
+# Lets concurrent identical upstream fetches share a single call
+
+import threading
+
+from lazy_imports import lazy_module
+
+asyncio = lazy_module('asyncio')
+
+
+class _Call:
+    """One in-flight call that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key (for threaded workers)
+
+    The first caller for a key runs the function; everyone else who asks
+    for the same key while it is running waits and gets the same result
+    or exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Run fn() once per key at a time and share its outcome"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self):
+        """Number of keys currently being fetched"""
+        return len(self._calls)
+
+    def stats(self):
+        """Return executed/coalesced counters"""
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'in_flight': self.in_flight(),
+        }
+
+
+class AsyncSingleFlight:
+    """Coalesces concurrent coroutine calls with the same key (for asyncio)"""
+
+    def __init__(self):
+        self._futures = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key, coro_fn):
+        """Await coro_fn() once per key at a time and share its outcome"""
+        future = self._futures.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # shield() so one cancelled waiter doesn't cancel everyone else
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        self.executed += 1
+        try:
+            result = await coro_fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self._futures.pop(key, None)
+
+    def in_flight(self):
+        """Number of keys currently being fetched"""
+        return len(self._futures)
+
+    def stats(self):
+        """Return executed/coalesced counters"""
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'in_flight': self.in_flight(),
+        }
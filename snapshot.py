@@ -0,0 +1,274 @@
+# Weather App - Offline Snapshots
+# Prefetched weather and forecasts in one memory-mapped file, indexed by canonical location
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from locations import location_key
+
+SNAPSHOT_MAGIC = b'WSNP'
+SNAPSHOT_VERSION = 1
+# magic, version, entry count, written at
+_HEADER = struct.Struct('<4sIId')
+# key offset, key length, data offset, data length, crc32 of the JSON, fetched at
+_ENTRY = struct.Struct('<IIQIId')
+
+# Snapshots hold metric data; other units are converted on the way out
+SNAPSHOT_ENDPOINTS = ('weather', 'forecast')
+RELOAD_CHECK_INTERVAL = 5.0     # Seconds between checks for a replaced snapshot file
+PREFETCH_WORKERS = 8
+
+# data: compressed JSON (a memoryview into the mapped file, or bytes)
+SnapshotEntry = namedtuple('SnapshotEntry', ['data', 'crc', 'fetched_at'])
+
+
+def _entry_key(endpoint, location):
+    return f"{endpoint}|{location_key(location)}".encode('utf-8')
+
+
+def write_snapshot(path, entries):
+    """Write {key bytes: SnapshotEntry} to path atomically
+
+    Layout: header, a fixed-size entry table sorted by key, the keys, then
+    each entry's compressed JSON. Readers bisect the table in place, so
+    opening a snapshot reads nothing but the header.
+    """
+    keys = sorted(entries)
+    table_size = _HEADER.size + len(keys) * _ENTRY.size
+    key_offset = table_size
+    data_offset = table_size + sum(len(key) for key in keys)
+
+    rows = []
+    for key in keys:
+        entry = entries[key]
+        rows.append(_ENTRY.pack(key_offset, len(key), data_offset, len(entry.data), entry.crc, entry.fetched_at))
+        key_offset += len(key)
+        data_offset += len(entry.data)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(keys), time.time()))
+            out.writelines(rows)
+            out.writelines(keys)
+            for key in keys:
+                out.write(entries[key].data)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    # Servers that have the old file mapped keep reading it until they reopen
+    os.replace(tmp_path, path)
+    return len(keys)
+
+
+class Snapshot:
+    """Read-only view of a snapshot file
+
+    Opening maps the file and reads the header; lookups bisect the sorted
+    entry table inside the mapping and only decompress the entry asked
+    for. When the file is replaced (a new snapshot shipped or refreshed),
+    the next lookup after RELOAD_CHECK_INTERVAL maps the new one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mmap = None
+        # (mapping, entry count), swapped as one so a reload can't pair them wrongly
+        self._state = None
+        self._identity = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.count = 0
+        self.written_at = None
+        self.hits = 0
+        self.misses = 0
+
+    def open(self):
+        """Map the file (safe to call repeatedly); raises OSError/ValueError if unusable"""
+        if self._mmap is None:
+            with self._lock:
+                if self._mmap is None:
+                    self._map()
+        return self
+
+    def _map(self):
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, written_at = _HEADER.unpack_from(mapped, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            mapped.close()
+            raise ValueError(f"Unsupported snapshot file: {self.path}")
+        # The previous mapping is left to the garbage collector: entries
+        # handed out earlier may still point into it
+        self._mmap = mapped
+        self._state = (mapped, count)
+        self._identity = (stat.st_ino, stat.st_mtime_ns)
+        self._checked_at = time.time()
+        self.count = count
+        self.written_at = written_at
+
+    def _reload_if_replaced(self):
+        now = time.time()
+        if now - self._checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                return
+            if (stat.st_ino, stat.st_mtime_ns) != self._identity:
+                self._map()
+                print(f"📦 Reloaded offline snapshot {self.path} ({self.count} entries)")
+
+    def _row(self, mapped, i):
+        return _ENTRY.unpack_from(mapped, _HEADER.size + i * _ENTRY.size)
+
+    def _find(self, key):
+        mapped, count = self._state
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key_offset, key_length = self._row(mapped, mid)[:2]
+            probe = mapped[key_offset:key_offset + key_length]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                _, _, data_offset, data_length, crc, fetched_at = self._row(mapped, mid)
+                return SnapshotEntry(memoryview(mapped)[data_offset:data_offset + data_length], crc, fetched_at)
+        return None
+
+    def entry(self, endpoint, location):
+        """SnapshotEntry for an endpoint and location, or None"""
+        self.open()
+        self._reload_if_replaced()
+        return self._find(_entry_key(endpoint, location))
+
+    def get(self, endpoint, location):
+        """(decoded metric response, fetched at) for an endpoint and location, or None"""
+        entry = self.entry(endpoint, location)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(zlib.decompress(entry.data)), entry.fetched_at
+
+    def entries(self):
+        """{key bytes: SnapshotEntry} for every entry, data still in the mapping"""
+        self.open()
+        mapped, count = self._state
+        result = {}
+        for i in range(count):
+            key_offset, key_length, data_offset, data_length, crc, fetched_at = self._row(mapped, i)
+            result[mapped[key_offset:key_offset + key_length]] = SnapshotEntry(
+                memoryview(mapped)[data_offset:data_offset + data_length], crc, fetched_at)
+        return result
+
+    def stats(self):
+        """Return entry counts and age"""
+        return {
+            'path': self.path,
+            'entries': self.count,
+            'written_at': self.written_at,
+            'age_seconds': round(time.time() - self.written_at) if self.written_at else None,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+def refresh_snapshot(service, locations, path, max_age=0, workers=PREFETCH_WORKERS):
+    """Prefetch current weather and forecasts for locations into a snapshot file
+
+    Goes through service, so its cache, quota and providers apply. An
+    existing snapshot is refreshed incrementally: entries younger than
+    max_age seconds aren't fetched again, and a refetched entry whose
+    JSON is unchanged keeps its compressed bytes, which are copied
+    straight from the old file. A failed fetch keeps the old entry.
+    Locations no longer listed are dropped. Returns counts per outcome.
+    """
+    previous = {}
+    if os.path.exists(path):
+        try:
+            previous = Snapshot(path).open().entries()
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable snapshot {path}: {e}")
+
+    fetchers = {'weather': service.get_current_weather, 'forecast': service.get_forecast}
+    now = time.time()
+    entries = {}
+    tasks = []
+    counts = {'fetched': 0, 'changed': 0, 'unchanged': 0, 'kept': 0, 'failed': 0, 'removed': 0}
+    for location in dict.fromkeys(locations):
+        for endpoint in SNAPSHOT_ENDPOINTS:
+            key = _entry_key(endpoint, location)
+            old = previous.get(key)
+            if old is not None and now - old.fetched_at < max_age:
+                entries[key] = old
+                counts['kept'] += 1
+            else:
+                tasks.append((key, endpoint, location))
+
+    def fetch(task):
+        key, endpoint, location = task
+        try:
+            return fetchers[endpoint](location, 'metric')
+        except Exception as e:
+            return e
+
+    if tasks:
+        with ThreadPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            for (key, endpoint, location), value in zip(tasks, pool.map(fetch, tasks)):
+                old = previous.get(key)
+                if isinstance(value, Exception) or not value:
+                    print(f"⚠️  {endpoint} for {location}: {value or 'no data'}")
+                    counts['failed'] += 1
+                    if old is not None:
+                        entries[key] = old
+                    continue
+                counts['fetched'] += 1
+                raw = json.dumps(value, sort_keys=True, separators=(',', ':')).encode('utf-8')
+                if old is not None and zlib.crc32(raw) == old.crc:
+                    entries[key] = old._replace(fetched_at=now)
+                    counts['unchanged'] += 1
+                else:
+                    entries[key] = SnapshotEntry(zlib.compress(raw, 6), zlib.crc32(raw), now)
+                    counts['changed'] += 1
+
+    counts['removed'] = len(set(previous) - set(entries))
+    counts['entries'] = write_snapshot(path, entries)
+    return counts
+
+
+def read_location_list(value):
+    """Locations from a file (one per line, # comments) or a ';'-separated list"""
+    if value and os.path.isfile(value):
+        with open(value, 'r', encoding='utf-8') as f:
+            lines = [line.split('#', 1)[0].strip() for line in f]
+        return [line for line in lines if line]
+    return [part.strip() for part in (value or '').split(';') if part.strip()]
+
+
+def open_snapshot_from_env():
+    """Snapshot named by WEATHER_SNAPSHOT_PATH, or None
+
+    The file doesn't need to exist yet; it is mapped on the first lookup.
+    """
+    path = os.getenv('WEATHER_SNAPSHOT_PATH')
+    return Snapshot(path) if path else None
+
+
+def offline_mode():
+    """Whether WEATHER_OFFLINE asks for snapshot-only serving"""
+    return os.getenv('WEATHER_OFFLINE', '0').lower() in ('1', 'true', 'yes')
@@ -4,6 +4,8 @@
 
 let currentWeatherData = null;
 let currentUnits = 'metric';
+let suggestTimer = null;
+let liveUpdates = null;
 
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function() {
@@ -32,6 +34,7 @@ function initializeApp() {
     // Add input validation
     const locationInput = document.getElementById('locationInput');
     locationInput.addEventListener('input', validateLocationInput);
+    locationInput.addEventListener('input', scheduleSuggestions);
     
     console.log('🌤️ Weather app ready to go!');
 }
@@ -58,6 +61,35 @@ function validateLocationInput() {
     }
 }
 
+function scheduleSuggestions() {
+    // Wait for a short pause in typing before asking the server
+    clearTimeout(suggestTimer);
+    suggestTimer = setTimeout(loadSuggestions, 150);
+}
+
+async function loadSuggestions() {
+    const query = document.getElementById('locationInput').value.trim();
+    const list = document.getElementById('locationSuggestions');
+    
+    try {
+        const response = await fetch(`/api/suggest?q=${encodeURIComponent(query)}`);
+        const result = await response.json();
+        if (!result.success) {
+            return;
+        }
+        
+        list.innerHTML = '';
+        result.suggestions.forEach(suggestion => {
+            const option = document.createElement('option');
+            option.value = suggestion.label;
+            list.appendChild(option);
+        });
+    } catch (error) {
+        // Suggestions are a nice-to-have; typing still works without them
+        console.warn('Suggestion lookup failed:', error);
+    }
+}
+
 function showLoading() {
     document.getElementById('loadingSpinner').style.display = 'block';
     document.getElementById('weatherDisplay').style.display = 'none';
@@ -220,6 +252,7 @@ async function getWeather() {
         
         if (result.success) {
             showWeatherData(result.data);
+            subscribeToUpdates(location);
         } else {
             showError(result.error || 'Failed to fetch weather data');
         }
@@ -229,9 +262,64 @@ async function getWeather() {
     }
 }
 
+function subscribeToUpdates(location) {
+    // One server-side fetch per city feeds every open page; we only get changed fields
+    if (liveUpdates) {
+        liveUpdates.close();
+        liveUpdates = null;
+    }
+    const streamUrl = document.body.dataset.streamUrl;
+    if (!streamUrl || !window.EventSource) {
+        return;
+    }
+
+    liveUpdates = new EventSource(`${streamUrl}?location=${encodeURIComponent(location)}&units=${currentUnits}`);
+    const applyUpdate = (event, replace) => {
+        const fields = JSON.parse(event.data);
+        const updated = replace ? fields : { ...currentWeatherData, ...fields };
+        if (JSON.stringify(updated) !== JSON.stringify(currentWeatherData)) {
+            currentWeatherData = updated;
+            document.getElementById('weatherDisplay').innerHTML = createWeatherHTML(updated);
+        }
+    };
+    liveUpdates.addEventListener('snapshot', event => applyUpdate(event, true));
+    liveUpdates.addEventListener('update', event => applyUpdate(event, false));
+    liveUpdates.addEventListener('error', event => {
+        if (event.data) {
+            console.warn('Live update failed:', JSON.parse(event.data).error);
+        }
+    });
+}
+
+function getBrowserPosition() {
+    return new Promise((resolve, reject) => {
+        if (!navigator.geolocation) {
+            reject(new Error('Geolocation not supported'));
+            return;
+        }
+        navigator.geolocation.getCurrentPosition(resolve, reject, { timeout: 8000, maximumAge: 600000 });
+    });
+}
+
 async function autoDetectLocation() {
     showLoading();
-    
+
+    // Browser geolocation is the most precise; nearby users share one cached answer
+    try {
+        const position = await getBrowserPosition();
+        const { latitude, longitude } = position.coords;
+        const response = await fetch(`/api/weather?lat=${latitude}&lon=${longitude}&units=${currentUnits}`);
+        const result = await response.json();
+        if (result.success) {
+            document.getElementById('locationInput').value = result.data.location;
+            showWeatherData(result.data);
+            subscribeToUpdates(result.data.location);
+            return;
+        }
+    } catch (error) {
+        console.log('Browser location unavailable, falling back to IP lookup');
+    }
+
     try {
         const response = await fetch('/api/location');
         const result = await response.json();
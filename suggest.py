@@ -0,0 +1,181 @@
+# Weather App - Location Suggestions
+# Prefix autocomplete over the city gazetteer plus each client's recent searches
+
+import bisect
+import heapq
+import math
+import threading
+from collections import Counter, OrderedDict, deque
+
+from gazetteer import normalize_name, qualifier_filter
+from locations import location_key, place_key
+
+HISTORY_SIZE = 10           # Recent searches remembered per client
+MAX_CLIENTS = 10000         # Clients whose history is kept (least recent dropped)
+PRECOMPUTED_DEPTH = 3       # Prefixes up to this length have their top cities ready
+TOP_K = 20                  # Candidates kept per precomputed prefix
+MAX_TRACKED_SEARCHES = 5000 # Distinct places whose search counts are kept
+
+
+def _search_key(location):
+    """Canonical key of a searched location, so spellings of one place count as one"""
+    try:
+        return location_key(location)
+    except ValueError:
+        return normalize_name(location)
+
+
+class RecentSearches:
+    """Per-client search history, bounded in both clients and entries
+
+    Entries are deduplicated by canonical location, so 'London' and
+    'london, gb' take one slot; the most recent spelling is kept.
+    """
+
+    def __init__(self, size=HISTORY_SIZE, max_clients=MAX_CLIENTS):
+        self.size = size
+        self.max_clients = max_clients
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, client_id, location):
+        """Record a search, moving it to the front if already present"""
+        with self._lock:
+            history = self._clients.get(client_id)
+            if history is None:
+                history = deque(maxlen=self.size)
+                self._clients[client_id] = history
+                while len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+            self._clients.move_to_end(client_id)
+
+            key = _search_key(location)
+            for item in history:
+                if item[0] == key:
+                    history.remove(item)
+                    break
+            history.append((key, location))
+
+    def get(self, client_id):
+        """Return a client's searches, most recent first"""
+        with self._lock:
+            history = self._clients.get(client_id)
+            return [location for _, location in reversed(history)] if history else []
+
+    def clear(self, client_id):
+        """Forget one client's searches"""
+        with self._lock:
+            self._clients.pop(client_id, None)
+
+
+class SuggestionIndex:
+    """Sorted-array prefix index over gazetteer names, ranked by popularity
+
+    Keys are kept in one sorted list so any prefix maps to a contiguous range
+    found with bisect. Short prefixes (the ones with huge ranges) have their
+    most populous cities precomputed, so every lookup touches at most a
+    handful of entries.
+    """
+
+    def __init__(self, gazetteer, depth=PRECOMPUTED_DEPTH, top_k=TOP_K,
+                 max_tracked=MAX_TRACKED_SEARCHES):
+        self.gazetteer = gazetteer
+        self.depth = depth
+        self.top_k = top_k
+        self._keys = None
+        self._entries = None
+        self._top = None
+        self.max_tracked = max_tracked
+        # Search counts per canonical location key
+        self._searches = Counter()
+        self._lock = threading.Lock()
+
+    def _build(self):
+        """Load every gazetteer entry into the sorted arrays (once)"""
+        with self._lock:
+            if self._keys is not None:
+                return
+
+            keys, entries = [], []
+            for key, record in self.gazetteer.iter_entries():
+                qualifier = record['state_code'] if record['country'] == 'US' else record['country']
+                keys.append(key)
+                entries.append({
+                    'key': place_key(record),
+                    'label': f"{record['name']}, {qualifier}" if qualifier else record['name'],
+                    'lat': record['lat'],
+                    'lon': record['lon'],
+                    'population': record['population'],
+                    'country': record['country'],
+                    'state_code': record['state_code'],
+                })
+
+            top = {}
+            for i, key in enumerate(keys):
+                for length in range(1, min(self.depth, len(key)) + 1):
+                    top.setdefault(key[:length], []).append(i)
+            for prefix, indices in top.items():
+                top[prefix] = heapq.nlargest(self.top_k, indices,
+                                             key=lambda i: entries[i]['population'])
+
+            self._entries = entries
+            self._top = top
+            self._keys = keys
+
+    def _candidates(self, key, fits=None):
+        """Indices of the most populous entries starting with key (and passing fits)"""
+        if len(key) <= self.depth and fits is None:
+            return self._top.get(key, [])
+
+        lo = bisect.bisect_left(self._keys, key)
+        hi = bisect.bisect_left(self._keys, key + '\uffff', lo)
+        indices = range(lo, hi)
+        if fits is not None:
+            indices = [i for i in indices if fits(self._entries[i])]
+        return heapq.nlargest(self.top_k, indices,
+                              key=lambda i: self._entries[i]['population'])
+
+    def record_search(self, label):
+        """Count a search so frequently requested places rank higher
+
+        Counts are keyed on the canonical location, the same key the
+        gazetteer entries carry. Once twice max_tracked places are counted,
+        only the max_tracked most searched are kept, so arbitrary input
+        can't grow the table without bound.
+        """
+        key = _search_key(label)
+        with self._lock:
+            self._searches[key] += 1
+            if len(self._searches) > 2 * self.max_tracked:
+                self._searches = Counter(dict(self._searches.most_common(self.max_tracked)))
+
+    def _score(self, entry):
+        """Popularity score: city size plus how often people search for it"""
+        searches = self._searches.get(entry['key'], 0)
+        return math.log10(entry['population'] + 10) + 2 * math.log2(1 + searches)
+
+    def search(self, prefix, limit=5):
+        """Return up to limit city suggestions for a typed prefix
+
+        'springfield, il' only suggests places that fit the qualifier
+        (see gazetteer.qualifier_filter).
+        """
+        if self._keys is None:
+            self._build()
+
+        name, _, qualifier = prefix.partition(',')
+        key = normalize_name(name)
+        if not key:
+            return []
+        fits = qualifier_filter(qualifier) if qualifier.strip() else None
+
+        seen = set()
+        results = []
+        for i in self._candidates(key, fits):
+            entry = self._entries[i]
+            if entry['label'] not in seen:
+                seen.add(entry['label'])
+                results.append(entry)
+
+        results.sort(key=self._score, reverse=True)
+        return results[:limit]
@@ -0,0 +1,57 @@
+# Weather App - Test Fixtures
+# Tests run against a local StubUpstream instead of the real weather APIs
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import StubUpstream
+
+# Configuration is read at import time, so the stub has to be up before
+# weather_app or server is imported anywhere
+_stub = StubUpstream(latency=0, jitter=0)
+_stub_url = _stub.start()
+os.environ.update({
+    'WEATHER_API_HOST': _stub_url,
+    'WEATHER_API_KEY': 'test-key',
+    'WEATHER_HISTORY_ENABLED': '0',
+    'WEATHER_REFRESH_ENABLED': '0',
+    'WEATHER_CLIENT_RATE': '10000',
+    'WEATHER_CLIENT_BURST': '10000',
+    'WEATHER_HTTP_BACKOFF': '0.01',
+})
+for name in ('WEATHER_CACHE_PATH', 'WEATHER_SNAPSHOT_PATH', 'WEATHER_OFFLINE', 'WEATHER_PROVIDERS'):
+    os.environ.pop(name, None)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def _stop_stub():
+    yield
+    _stub.stop()
+
+
+@pytest.fixture
+def stub():
+    """The shared StubUpstream, with its call counts and error rate reset"""
+    _stub.error_rate = 0.0
+    _stub.calls.clear()
+    _stub.errors = 0
+    yield _stub
+    _stub.error_rate = 0.0
+
+
+@pytest.fixture
+def server_module(stub):
+    """The server module with an empty response cache"""
+    import server
+    server.weather_service.cache.clear()
+    yield server
+    server.weather_service.cache.clear()
+
+
+@pytest.fixture
+def client(server_module):
+    return server_module.app.test_client()
@@ -0,0 +1,124 @@
+# Weather App - Response Cache Tests
+
+from types import SimpleNamespace
+
+import pytest
+
+import cache
+from cache import MemoryCache, ResponseCache, SQLiteCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time for the cache module; advance with clock.now += seconds"""
+    fake = SimpleNamespace(now=1000.0)
+    fake.time = lambda: fake.now
+    monkeypatch.setattr(cache, 'time', fake)
+    return fake
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def response_cache(request, tmp_path):
+    backend = MemoryCache() if request.param == 'memory' else SQLiteCache(str(tmp_path / 'cache.db'))
+    return ResponseCache(backend, ttls={'weather': 10}, stale_factor=1.0)
+
+
+def test_entries_expire_after_their_ttl(response_cache, clock):
+    response_cache.set('weather', 'London', 'metric', {'temp': 1})
+
+    clock.now += 9
+    assert response_cache.get('weather', 'London', 'metric') == {'temp': 1}
+    clock.now += 2
+    assert response_cache.get('weather', 'London', 'metric') is None
+    assert response_cache.get('forecast', 'London', 'metric') is None
+
+
+def test_entries_are_fresh_then_stale_then_gone(response_cache, clock):
+    response_cache.set('weather', 'London', 'metric', {'temp': 1})
+
+    clock.now += 5
+    assert response_cache.get('weather', 'London', 'metric') == {'temp': 1}
+
+    # Past the TTL but inside the stale window: only lookup() still serves it
+    clock.now += 10
+    assert response_cache.get('weather', 'London', 'metric') is None
+    value, expires_at = response_cache.lookup('weather', 'London', 'metric')
+    assert value == {'temp': 1}
+    assert expires_at == 1010.0
+
+    clock.now += 10
+    assert response_cache.lookup('weather', 'London', 'metric') is None
+    assert response_cache.expires_at('weather', 'London', 'metric') is None
+
+
+def test_spellings_share_an_entry(response_cache):
+    response_cache.set('weather', 'London', 'metric', {'temp': 1})
+    assert response_cache.get('weather', '  london, GB ', 'metric') == {'temp': 1}
+    assert response_cache.get('weather', 'London', 'imperial') is None
+
+
+def test_explicit_ttl_overrides_the_endpoint_ttl(response_cache, clock):
+    response_cache.set('weather', 'London', 'metric', {'temp': 1}, ttl=2)
+    assert response_cache.expires_at('weather', 'London', 'metric') == 1002.0
+
+
+def test_memory_cache_evicts_least_recently_used():
+    backend = MemoryCache(max_entries=2)
+    backend.set('a', 1, 60)
+    backend.set('b', 2, 60)
+    backend.get('a')
+    backend.set('c', 3, 60)
+    assert backend.get('b') is None
+    assert backend.get('a') == 1
+    assert backend.evictions == 1
+
+
+def test_derived_units_expire_with_their_metric_source(server_module):
+    service = server_module.weather_service
+    service.get_current_weather('London', 'metric')
+    metric_expiry = service.cache.expires_at('weather', 'London', 'metric')
+    # Make the metric entry look half-used before imperial is derived from it
+    entry = service.cache.lookup('weather', 'London', 'metric')
+    service.cache.set('weather', 'London', 'metric', entry[0], ttl=30)
+
+    service.get_current_weather('London', 'imperial')
+    imperial_expiry = service.cache.expires_at('weather', 'London', 'imperial')
+    assert imperial_expiry <= service.cache.expires_at('weather', 'London', 'metric') + 0.5
+    assert imperial_expiry < metric_expiry
+
+
+def test_quota_exhaustion_serves_the_stale_entry(server_module, stub, monkeypatch):
+    service = server_module.weather_service
+    service.get_current_weather('Madrid', 'metric')
+    entry = service.cache.lookup('weather', 'Madrid', 'metric')
+    service.cache.set('weather', 'Madrid', 'metric', entry[0], ttl=-1)
+
+    def spent():
+        raise server_module.QuotaExceeded(30)
+    monkeypatch.setattr(service.quota, 'acquire', spent)
+
+    assert service.get_current_weather('Madrid', 'metric') == entry[0]
+    assert stub.stats()['total'] == 1
+
+
+def test_every_upstream_attempt_is_charged_to_the_quota(server_module, stub, monkeypatch):
+    service = server_module.weather_service
+    charges = []
+    monkeypatch.setattr(service.quota, 'acquire', lambda: charges.append(1))
+    stub.error_rate = 1.0
+
+    response = service._upstream_get(f"{service.base_url}/weather", {'q': 'Oslo', 'appid': 'test-key'})
+    assert response.status_code == 500
+    assert len(charges) == stub.stats()['total'] == service.retries + 1
+
+
+def test_upstream_429_is_not_retried(server_module, monkeypatch):
+    service = server_module.weather_service
+    charges = []
+    monkeypatch.setattr(service.quota, 'acquire', lambda: charges.append(1))
+    limited = SimpleNamespace(status_code=429, headers={'Retry-After': '7'})
+    monkeypatch.setattr(service.session, 'get', lambda *args, **kwargs: limited)
+
+    with pytest.raises(server_module.QuotaExceeded):
+        service._upstream_get(f"{service.base_url}/weather", {'q': 'Oslo', 'appid': 'test-key'})
+    assert len(charges) == 1
@@ -0,0 +1,27 @@
+# Weather App - Gazetteer Tests
+
+import pytest
+
+from gazetteer import get_gazetteer
+
+
+@pytest.fixture
+def gazetteer():
+    return get_gazetteer()
+
+
+def test_exact_lookup_honours_the_qualifier(gazetteer):
+    assert gazetteer.resolve('Springfield, IL')['state_code'] == 'IL'
+    assert gazetteer.resolve('Springfield, Massachusetts')['state_code'] == 'MA'
+
+
+@pytest.mark.parametrize('prefix, state', [('springfield, il', 'IL'), ('springfield, ma', 'MA'),
+                                           ('spring, illinois', 'IL'), ('springfield, i', 'IL')])
+def test_prefix_lookup_honours_the_qualifier(gazetteer, prefix, state):
+    assert {record['state_code'] for record in gazetteer.prefix(prefix)} == {state}
+
+
+def test_prefix_lookup_without_a_qualifier(gazetteer):
+    states = [record['state_code'] for record in gazetteer.prefix('springfield')]
+    assert {'IL', 'MA', 'MO'} <= set(states)
+    assert gazetteer.prefix('springfield, xx') == []
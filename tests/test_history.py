@@ -0,0 +1,23 @@
+# Weather App - Observation History Tests
+
+from history_store import APP_DIR, HistoryStore
+
+OBSERVATION = {'dt': 1700000000, 'main': {'temp': 11.5, 'humidity': 80}, 'weather': [{'description': 'light rain'}]}
+
+
+def test_relative_path_resolves_against_the_data_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('WEATHER_DATA_DIR', str(tmp_path))
+    assert HistoryStore('history.db').path == str(tmp_path / 'history.db')
+    monkeypatch.delenv('WEATHER_DATA_DIR')
+    assert HistoryStore('history.db').path.startswith(APP_DIR)
+
+
+def test_database_is_created_on_first_write(tmp_path):
+    store = HistoryStore(str(tmp_path / 'data' / 'history.db'))
+    assert store.query('London', 0, 2000000000) == []
+    assert store.stats()['observations'] == 0
+    assert not (tmp_path / 'data').exists()
+
+    store.record('London', OBSERVATION)
+    rows = store.query('London', 0, 2000000000, resolution='raw')
+    assert [row['condition'] for row in rows] == ['Light Rain']
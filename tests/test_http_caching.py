@@ -0,0 +1,60 @@
+# Weather App - Conditional Request Tests
+
+
+def test_matching_etag_answers_304(client, stub):
+    first = client.get('/api/weather?location=London')
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+    assert 'max-age=' in first.headers['Cache-Control']
+
+    second = client.get('/api/weather?location=London', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.headers['ETag'] == etag
+    assert stub.stats()['total'] == 1
+
+
+def test_etag_differs_per_variant(client):
+    metric = client.get('/api/weather?location=London').headers['ETag']
+    imperial = client.get('/api/weather?location=London&units=imperial').headers['ETag']
+    raw = client.get('/api/weather?location=London&raw=1').headers['ETag']
+    assert len({metric, imperial, raw}) == 3
+
+
+def test_stale_entry_is_not_answered_with_304(client, server_module, stub):
+    etag = client.get('/api/weather?location=London').headers['ETag']
+    cache = server_module.weather_service.cache
+    value, _ = cache.lookup('weather', 'London', 'metric')
+    cache.set('weather', 'London', 'metric', value, ttl=-1)
+
+    response = client.get('/api/weather?location=London', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert stub.stats()['by_endpoint'] == {'weather': 2}
+
+
+def test_nearby_station_answers_carry_validators(client, server_module, stub):
+    client.get('/api/weather?location=London')
+    station = server_module.weather_service.cache.get('weather', 'London', 'metric')['coord']
+    path = f"/api/weather?lat={station['lat'] + 0.001}&lon={station['lon']}"
+
+    first = client.get(path)
+    assert first.status_code == 200
+    assert 'no-cache' not in first.headers.get('Cache-Control', '')
+
+    second = client.get(path, headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+    assert stub.stats()['total'] == 1
+
+
+def test_forecast_defaults_to_the_upstream_shape(client):
+    raw = client.get('/api/forecast?location=London').get_json()['data']
+    assert 'list' in raw
+    compact = client.get('/api/forecast?location=London&format=compact').get_json()['data']
+    assert 'times' in compact
+
+
+def test_same_entry_gives_the_same_body(client):
+    first = client.get('/api/weather?location=London', headers={'Accept-Encoding': 'identity'})
+    second = client.get('/api/weather?location=London', headers={'Accept-Encoding': 'identity'})
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert first.get_data() == second.get_data()
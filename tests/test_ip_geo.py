@@ -0,0 +1,23 @@
+# Weather App - IP Geolocation Tests
+
+from ip_geo import IPLocator
+
+PLACE = {'name': 'Dublin, IE', 'method': 'ip_detection'}
+
+
+def test_client_ips_stay_local_without_opt_in(monkeypatch):
+    locator = IPLocator()
+    queries = []
+    monkeypatch.setattr(locator, '_lookup_online', lambda query: queries.append(query) or PLACE)
+
+    assert locator.locate('8.8.8.8') is None
+    assert queries == []
+    # The server's own public address may still be looked up for local clients
+    assert locator.locate('127.0.0.1') == PLACE
+    assert queries == ['me']
+
+
+def test_online_fallback_is_opt_in(monkeypatch):
+    locator = IPLocator(online_fallback=True)
+    monkeypatch.setattr(locator, '_lookup_online', lambda query: PLACE)
+    assert locator.locate('8.8.8.8') == PLACE
@@ -0,0 +1,46 @@
+# Weather App - Live Update Tests
+
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from live_updates import Channel, LiveUpdateHub, allowed_origin, create_stream_app
+from ratelimit import ClientRateLimiter
+
+
+def test_full_queue_is_never_sent_an_empty_snapshot():
+    async def publish():
+        hub = LiveUpdateHub(service=None)
+        channel = Channel('London', 'metric')
+        queue = asyncio.Queue(maxsize=1)
+        channel.subscribers.add(queue)
+        hub._publish(channel, 'error', {'error': 'first'})
+        hub._publish(channel, 'error', {'error': 'second'})
+        return queue.get_nowait()
+
+    assert asyncio.run(publish()) == ('error', {'error': 'second'})
+
+
+def test_only_the_app_host_and_listed_origins_may_read_the_stream():
+    assert allowed_origin('http://weather.example:5000', 'weather.example:5001')
+    assert not allowed_origin('http://evil.example', 'weather.example:5001')
+    assert allowed_origin('https://app.example', 'weather.example:5001', ('https://app.example',))
+    assert not allowed_origin('', 'weather.example:5001')
+
+
+def test_stream_applies_the_app_checks():
+    def validate(location):
+        return (False, "Location not found") if location == 'Atlantis' else (True, "Valid location")
+
+    async def requests():
+        app = create_stream_app(LiveUpdateHub(service=None), validate=validate,
+                                limiter=ClientRateLimiter(rate=0.001, burst=1))
+        async with TestClient(TestServer(app)) as client:
+            rejected = await client.get('/api/stream?location=Atlantis', headers={'Origin': 'http://evil.example'})
+            limited = await client.get('/api/stream?location=London')
+            return (rejected.status, await rejected.json(), rejected.headers.get('Access-Control-Allow-Origin'),
+                    limited.status)
+
+    status, body, cors, limited = asyncio.run(requests())
+    assert (status, body['error'], cors) == (400, "Location not found", None)
+    assert limited == 429
@@ -0,0 +1,139 @@
+# Weather App - Provider Failover Tests
+
+import asyncio
+import time
+
+import pytest
+
+from benchmark import StubUpstream
+from cache import ResponseCache
+from http_client import MAX_RETRY_DELAY, retry_delay
+from bulk_format import format_one
+from providers import BREAKER_FAILURES, CircuitBreaker, OpenMeteoProvider, ProviderQuery
+
+
+@pytest.fixture
+def open_meteo():
+    """A second stub standing in for Open-Meteo"""
+    upstream = StubUpstream(latency=0, jitter=0)
+    url = upstream.start()
+    yield upstream, url
+    upstream.stop()
+
+
+@pytest.fixture
+def service(open_meteo, stub, monkeypatch):
+    """A WeatherService routing to OpenWeatherMap first, then Open-Meteo"""
+    monkeypatch.setenv('WEATHER_PROVIDERS', 'openweathermap,open-meteo')
+    monkeypatch.setenv('WEATHER_OPEN_METEO_HOST', open_meteo[1])
+    monkeypatch.setenv('WEATHER_HEDGE', '0')
+    from weather_app import WeatherService
+    return WeatherService(cache=ResponseCache())
+
+
+def test_healthy_primary_answers(service, stub, open_meteo):
+    assert 'provider' not in service.get_current_weather('London')
+    assert stub.stats()['by_endpoint'] == {'weather': 1}
+    assert open_meteo[0].stats()['total'] == 0
+
+
+def test_failing_primary_fails_over(service, stub, open_meteo):
+    stub.error_rate = 1.0
+    data = service.get_current_weather('London')
+    assert data['provider'] == 'open-meteo'
+    assert data['main']['temp'] is not None
+    assert service.get_forecast('Paris')['provider'] == 'open-meteo'
+
+
+def test_failing_primary_stops_being_called(service, stub):
+    stub.error_rate = 1.0
+    cities = ['London', 'Paris', 'Berlin', 'Madrid', 'Rome', 'Vienna', 'Prague', 'Lisbon']
+    for city in cities[:BREAKER_FAILURES]:
+        service.get_current_weather(city)
+    # Demoted by its success rate, if its breaker hasn't opened already
+    assert service.providers.ranked(service._provider_query('Vienna'))[0].name == 'open-meteo'
+
+    calls = stub.stats()['total']
+    for city in cities[BREAKER_FAILURES:]:
+        assert service.get_current_weather(city)['provider'] == 'open-meteo'
+    assert stub.stats()['total'] == calls
+
+
+def test_all_providers_failing_raises(service, stub, open_meteo):
+    stub.error_rate = 1.0
+    open_meteo[0].error_rate = 1.0
+    with pytest.raises(Exception, match="Failed to fetch weather data"):
+        service.get_current_weather('London')
+
+
+def test_breaker_opens_after_repeated_failures_then_probes():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    breaker.opened_at -= 61
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_async_service_fails_over_on_its_own_session(service, stub, open_meteo):
+    from async_weather import AsyncWeatherService
+    stub.error_rate = 1.0
+
+    async def fetch():
+        async with AsyncWeatherService(shared=service) as client:
+            return await client.get_current_weather('London')
+
+    assert asyncio.run(fetch())['provider'] == 'open-meteo'
+    assert open_meteo[0].stats()['by_endpoint'] == {'forecast': 1}
+
+
+def test_retry_after_is_capped():
+    assert retry_delay('3600', 0) == MAX_RETRY_DELAY
+    assert retry_delay('1', 0) == 1.0
+    assert retry_delay('', 10) == MAX_RETRY_DELAY
+
+
+def test_async_hedge_beats_a_slow_primary(service, stub, open_meteo):
+    from async_weather import AsyncWeatherService
+    service.providers.hedging = True
+    service.providers.hedge_delay = 0.05
+    stub.latency = 0.5
+
+    async def fetch():
+        async with AsyncWeatherService(shared=service) as client:
+            return await client.get_current_weather('London')
+
+    try:
+        assert asyncio.run(fetch())['provider'] == 'open-meteo'
+    finally:
+        stub.latency = 0
+    assert service.providers.hedges == 1
+
+
+def test_open_meteo_nulls_get_defaults():
+    provider = OpenMeteoProvider()
+    query = ProviderQuery({}, 51.5, -0.12, 'London', 'GB')
+    nulls = dict.fromkeys(['apparent_temperature', 'relative_humidity_2m', 'weather_code', 'cloud_cover',
+                           'pressure_msl', 'wind_speed_10m', 'wind_direction_10m', 'wind_gusts_10m',
+                           'visibility', 'is_day'])
+    data = {'latitude': 51.5, 'longitude': -0.12, 'utc_offset_seconds': 0,
+            'current': dict(nulls, temperature_2m=11.0, time=1700000000),
+            'daily': {'temperature_2m_min': [None], 'temperature_2m_max': [None],
+                      'sunrise': [None], 'sunset': [None]}}
+
+    weather = provider.parse('current', query, data)
+    assert weather['visibility'] == 10000
+    info = format_one(weather)
+    assert (info['wind_direction'], info['temp_max'], info['visibility']) == ('0°', '11.0°C', '10.0 km')
+
+    hourly = {'time': [int(time.time()) // 10800 * 10800 + 10800 * i for i in range(2)],
+              'temperature_2m': [None, 9.0], 'wind_direction_10m': [None, None]}
+    slots = provider.parse('forecast', query, {**data, 'hourly': hourly})['list']
+    assert [(slot['main']['temp'], slot['wind']['deg']) for slot in slots] == [(9.0, 0)]
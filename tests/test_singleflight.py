@@ -0,0 +1,85 @@
+# Weather App - Request Coalescing Tests
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    runs = []
+
+    def fetch():
+        runs.append(1)
+        started.set()
+        release.wait(5)
+        return {'temp': 1}
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        leader = pool.submit(flight.do, 'weather|london, gb|metric', fetch)
+        started.wait(5)
+        followers = [pool.submit(flight.do, 'weather|london, gb|metric', fetch) for _ in range(4)]
+        while flight.coalesced < 4:
+            time.sleep(0.01)
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert runs == [1]
+    assert all(result == {'temp': 1} for result in results)
+    assert flight.stats() == {'executed': 1, 'coalesced': 4, 'in_flight': 0}
+
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise Exception("upstream down")
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(flight.do, 'key', fetch)]
+        while flight.in_flight() == 0:
+            time.sleep(0.01)
+        futures += [pool.submit(flight.do, 'key', fetch) for _ in range(2)]
+        while flight.coalesced < 2:
+            time.sleep(0.01)
+        release.set()
+        for future in futures:
+            with pytest.raises(Exception, match="upstream down"):
+                future.result()
+
+
+def test_async_calls_share_one_execution():
+    flight = AsyncSingleFlight()
+    runs = []
+
+    async def fetch():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def main():
+        return await asyncio.gather(*(flight.do('key', fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == [42] * 5
+    assert runs == [1]
+
+
+def test_concurrent_misses_make_one_upstream_call(server_module, stub):
+    stub.latency = 0.2
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: server_module.weather_service.get_current_weather('Berlin'),
+                                    range(8)))
+    finally:
+        stub.latency = 0
+    assert all(result == results[0] for result in results)
+    assert stub.stats()['by_endpoint'] == {'weather': 1}
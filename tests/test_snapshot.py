@@ -0,0 +1,110 @@
+# Weather App - Offline Snapshot Tests
+
+import json
+import zlib
+
+import pytest
+
+from snapshot import Snapshot, SnapshotEntry, _entry_key, read_location_list, refresh_snapshot, write_snapshot
+
+
+@pytest.fixture
+def snapshot_path(server_module, tmp_path):
+    """A snapshot of London written through the server's service"""
+    path = str(tmp_path / 'weather.snap')
+    counts = refresh_snapshot(server_module.weather_service, ['London'], path)
+    assert counts['entries'] == 2
+    server_module.weather_service.cache.clear()
+    return path
+
+
+def test_written_entries_read_back(tmp_path):
+    path = str(tmp_path / 'weather.snap')
+    documents = {('weather', 'London'): {'main': {'temp': 12.3}}, ('forecast', 'Paris'): {'list': [1, 2]}}
+    entries = {}
+    for (endpoint, location), document in documents.items():
+        raw = json.dumps(document).encode('utf-8')
+        entries[_entry_key(endpoint, location)] = SnapshotEntry(zlib.compress(raw), zlib.crc32(raw), 100.0)
+    assert write_snapshot(path, entries) == 2
+
+    snapshot = Snapshot(path).open()
+    assert snapshot.count == 2
+    assert snapshot.get('weather', 'london, gb') == ({'main': {'temp': 12.3}}, 100.0)
+    assert snapshot.get('forecast', 'Paris') == ({'list': [1, 2]}, 100.0)
+    assert snapshot.get('weather', 'Paris') is None
+    assert (snapshot.hits, snapshot.misses) == (2, 1)
+
+
+def test_refresh_keeps_young_entries_and_drops_unlisted(server_module, snapshot_path, stub):
+    stub.calls.clear()
+    counts = refresh_snapshot(server_module.weather_service, ['London'], snapshot_path, max_age=3600)
+    assert counts['kept'] == 2
+    assert stub.stats()['total'] == 0
+
+    counts = refresh_snapshot(server_module.weather_service, ['Paris'], snapshot_path, max_age=3600)
+    assert (counts['fetched'], counts['removed'], counts['entries']) == (2, 2, 2)
+    assert Snapshot(snapshot_path).get('weather', 'London') is None
+
+
+def test_failed_refresh_keeps_the_old_entry(server_module, snapshot_path, stub):
+    before = Snapshot(snapshot_path).get('weather', 'London')
+    stub.error_rate = 1.0
+    counts = refresh_snapshot(server_module.weather_service, ['London'], snapshot_path)
+    assert counts['failed'] == 2
+    assert Snapshot(snapshot_path).get('weather', 'London') == before
+
+
+def test_location_lists(tmp_path):
+    path = tmp_path / 'cities.txt'
+    path.write_text("London, UK\n# comment\n\nParis  # capital\n", encoding='utf-8')
+    assert read_location_list(str(path)) == ['London, UK', 'Paris']
+    assert read_location_list('London; Paris ;') == ['London', 'Paris']
+
+
+def test_sync_offline_mode_serves_the_snapshot(server_module, stub, snapshot_path, monkeypatch):
+    service = server_module.weather_service
+    monkeypatch.setattr(service, 'snapshot', Snapshot(snapshot_path))
+    monkeypatch.setattr(service, 'offline', True)
+    stub.calls.clear()
+
+    assert service.get_forecast('London', 'metric')['list']
+    assert stub.stats()['total'] == 0
+
+
+def test_async_offline_mode_serves_the_snapshot(server_module, stub, snapshot_path, monkeypatch):
+    loop, service = server_module.get_async_runtime()
+    monkeypatch.setattr(service, 'snapshot', Snapshot(snapshot_path))
+    monkeypatch.setattr(service, 'offline', True)
+    stub.calls.clear()
+
+    async def fetch(service):
+        return await service.get_current_weather('London', 'imperial')
+
+    data = server_module.run_async(fetch)
+    assert data['main']['temp'] == pytest.approx(12.3 * 9 / 5 + 32, abs=0.1)
+    assert stub.stats()['total'] == 0
+
+
+def test_async_upstream_failure_falls_back_to_the_snapshot(server_module, stub, snapshot_path, monkeypatch):
+    loop, service = server_module.get_async_runtime()
+    monkeypatch.setattr(service, 'snapshot', Snapshot(snapshot_path))
+    stub.error_rate = 1.0
+
+    async def fetch(service):
+        return await service.get_forecast('London', 'metric')
+
+    assert server_module.run_async(fetch)['list']
+
+
+def test_snapshot_fallback_carries_no_entry_validators(client, server_module, stub, snapshot_path, monkeypatch):
+    service = server_module.weather_service
+    monkeypatch.setattr(service, 'snapshot', Snapshot(snapshot_path))
+    client.get('/api/weather?location=London')
+    value, _ = service.cache.lookup('weather', 'London', 'metric')
+    service.cache.set('weather', 'London', 'metric', dict(value, name='Cached'), ttl=-1)
+    stub.error_rate = 1.0
+
+    response = client.get('/api/weather?location=London')
+    assert response.status_code == 200
+    assert not response.get_json()['data']['location'].startswith('Cached')
+    assert 'max-age' not in response.headers.get('Cache-Control', '')
@@ -0,0 +1,54 @@
+# Weather App - Location Suggestion Tests
+
+import pytest
+
+from gazetteer import get_gazetteer
+from suggest import RecentSearches, SuggestionIndex
+
+
+@pytest.fixture
+def index():
+    return SuggestionIndex(get_gazetteer())
+
+
+def test_larger_cities_rank_first(index):
+    populations = [entry['population'] for entry in index.search('lon', limit=5)]
+    assert populations == sorted(populations, reverse=True)
+    assert index.search('lon', limit=1)[0]['label'] == 'London, GB'
+
+
+def test_searches_raise_a_place(index):
+    labels = [entry['label'] for entry in index.search('springfield', limit=10)]
+    underdog = labels[-1]
+    assert labels[0] != underdog
+
+    for _ in range(20):
+        index.record_search(underdog)
+    assert index.search('springfield', limit=1)[0]['label'] == underdog
+
+
+def test_spellings_of_a_place_count_together(index):
+    index.record_search('London')
+    index.record_search('london, gb')
+    key = index.search('london', limit=1)[0]['key']
+    assert index._searches[key] == 2
+
+
+def test_search_counts_are_bounded():
+    index = SuggestionIndex(get_gazetteer(), max_tracked=2)
+    for i in range(10):
+        index.record_search(f"Nowhere {i}")
+    assert len(index._searches) <= 4
+
+
+def test_recent_searches_dedupe_by_location():
+    history = RecentSearches(size=3)
+    history.add('client', 'London')
+    history.add('client', 'Paris')
+    history.add('client', 'london, gb')
+    assert history.get('client') == ['london, gb', 'Paris']
+
+
+def test_qualifier_narrows_suggestions(index):
+    assert [entry['label'] for entry in index.search('springfield, il')] == ['Springfield, IL']
+    assert [entry['label'] for entry in index.search('par, france', limit=1)] == ['Paris, FR']
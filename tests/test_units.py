@@ -0,0 +1,33 @@
+# Weather App - Unit System Tests
+
+import pytest
+
+
+@pytest.mark.parametrize('path', [
+    '/api/weather?location=London&units=standard',
+    '/api/weather?lat=51.5&lon=-0.12&units=standard',
+    '/api/forecast?location=London&units=standard',
+    '/api/report?location=London&units=standard',
+])
+def test_unknown_units_are_rejected(client, stub, path):
+    response = client.get(path)
+    assert response.status_code == 400
+    assert 'units' in response.get_json()['error']
+    assert stub.stats()['total'] == 0
+
+
+def test_imperial_labels(client):
+    data = client.get('/api/weather?location=London&units=imperial').get_json()['data']
+    assert data['temperature'].endswith('°F')
+    assert data['wind_speed'].endswith('mph')
+
+
+def test_async_imperial_is_derived_from_metric(server_module, stub):
+    async def fetch(service):
+        metric = await service.get_current_weather('Paris', 'metric')
+        imperial = await service.get_current_weather('Paris', 'imperial')
+        return metric, imperial
+
+    metric, imperial = server_module.run_async(fetch)
+    assert imperial['main']['temp'] == pytest.approx(metric['main']['temp'] * 9 / 5 + 32, abs=0.1)
+    assert stub.stats()['by_endpoint'] == {'weather': 1}
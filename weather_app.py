@@ -2,27 +2,101 @@
 # Created: December 2024
 # Description: Weather and location services for web interface
 
-import requests
-import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, Optional, List
-try:
+from cache import create_cache_from_env, make_cache_key
+from singleflight import SingleFlight
+from http_client import RETRY_STATUSES, get_backoff, get_retries, get_session, get_timeout, retry_delay
+from gazetteer import get_gazetteer, gazetteer_is_authoritative
+from ip_geo import get_ip_locator
+from locations import canonical_location, coordinate_location, location_key, validate_format
+from geohash import StationIndex
+from suggest import RecentSearches, SuggestionIndex
+from ratelimit import QuotaExceeded, create_quota_from_env
+from forecast import compact_forecast
+from bulk_format import convert_weather, format_current, format_one
+from history_store import create_history_from_env
+from snapshot import SNAPSHOT_ENDPOINTS, offline_mode, open_snapshot_from_env
+from metrics import UpstreamTimer, cache_lookups
+from providers import ProviderError, ProviderQuery, create_router_from_env
+from lazy_imports import is_installed, lazy_module
+
+# Only needed once an upstream call is made (or fails)
+requests = lazy_module('requests')
+
+# python-dotenv is only imported when there is a .env file to read
+if os.path.exists('.env') and is_installed('dotenv'):
     from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    pass
+    load_dotenv('.env')
+
+# OpenWeatherMap's /group endpoint accepts at most this many city IDs
+GROUP_REQUEST_LIMIT = 20
+# A coordinate miss may be answered by a fresh observation from a station this close
+NEAREST_STATION_KM = float(os.getenv('WEATHER_NEAREST_STATION_KM', 2))
+# Providers that only return coordinates name the point after a station this close
+NAMED_STATION_KM = 10
+# Imperial responses are converted from the metric ones instead of fetched separately
+DERIVED_UNITS = ('imperial',)
+# Unit systems the formatters have labels for
+SUPPORTED_UNITS = ('metric',) + DERIVED_UNITS
 
 class WeatherService:
     """Handles weather API interactions and data processing"""
 
-    def __init__(self):
+    def __init__(self, cache=None, shared=None):
+        # shared: another WeatherService whose key, cache, quota, history,
+        # stations, providers and snapshot to use instead of building new ones
         # Using OpenWeatherMap API (free tier)
-        self.api_key = os.getenv('WEATHER_API_KEY', '')
-        self.base_url = "http://api.openweathermap.org/data/2.5"
-        self.forecast_url = "http://api.openweathermap.org/data/2.5/forecast"
-        self.icon_url = "http://openweathermap.org/img/wn"
-        self.geocoding_url = "http://api.openweathermap.org/geo/1.0"
+        self.api_key = shared.api_key if shared is not None else os.getenv('WEATHER_API_KEY', '')
+        # WEATHER_API_HOST can point at a local stub server for testing
+        api_host = os.getenv('WEATHER_API_HOST', 'https://api.openweathermap.org').rstrip('/')
+        self.base_url = f"{api_host}/data/2.5"
+        self.forecast_url = f"{api_host}/data/2.5/forecast"
+        self.icon_url = "https://openweathermap.org/img/wn"
+        self.geocoding_url = f"{api_host}/geo/1.0"
+
+        # Shared keep-alive connection pool with retries on 429/5xx,
+        # created on the first upstream call
+        self._session = None
+        self.timeout = get_timeout()
+        self.retries = get_retries()
+        self.backoff = get_backoff()
+        # Concurrent misses for the same key share one upstream call
+        self.inflight = SingleFlight()
+        # Offline city index so known names skip the geocoding round-trip
+        self.gazetteer = get_gazetteer()
+        # Optional background refresher (see server.HotLocationRefresher)
+        self.refresher = None
+        self._snapshot_error = None
+
+        if shared is not None:
+            self.quota = shared.quota
+            self.cache = cache if cache is not None else shared.cache
+            self.history = shared.history
+            self.stations = shared.stations
+            self.providers = shared.providers
+            self.snapshot = shared.snapshot
+            self.offline = shared.offline
+        else:
+            # Every upstream call spends from the API plan's budget
+            self.quota = create_quota_from_env()
+            # Cache upstream responses so popular cities don't burn API quota
+            self.cache = cache if cache is not None else create_cache_from_env()
+            # Every fresh observation is kept for /api/weather-history
+            self.history = create_history_from_env()
+            # Stations seen in responses, for nearest-station lookups by coordinates
+            self.stations = StationIndex()
+            # Current weather and forecasts go to the healthiest configured provider
+            self.providers = create_router_from_env(self)
+            # Prefetched responses for when the upstream can't be reached (python main.py snapshot)
+            self.snapshot = open_snapshot_from_env()
+            self.offline = offline_mode()
+            if self.offline and self.snapshot is None:
+                print("⚠️  WEATHER_OFFLINE needs WEATHER_SNAPSHOT_PATH; using the upstream API")
+                self.offline = False
 
         # Weather condition emojis for better display
         self.weather_emojis = {
@@ -43,8 +117,18 @@ class WeatherService:
             'smoke': '💨'
         }
         
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = get_session()
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
     def get_api_key(self):
-        """Get API key from environment, .env file, or user input"""
+        """Get API key from environment or .env file (never prompts)"""
         # First try environment variable
         api_key = os.getenv('WEATHER_API_KEY')
 
@@ -76,67 +160,391 @@ class WeatherService:
             print("2. Sign up for a free account")
             print("3. Get your API key")
             print("4. Set it as environment variable: WEATHER_API_KEY")
-            print("   Or enter it below (temporary for this session)")
+            print("   Or add WEATHER_API_KEY=your_key to a .env file")
             print("-" * 40)
-            api_key = input("Enter your API key: ").strip()
-            if api_key:
-                self.api_key = api_key
-                return True
+            # No input() here: servers and workers have no terminal to ask on
             return False
     
+    def _upstream_get(self, url, params):
+        """GET from the upstream API within the call budget
+
+        5xx answers are retried with capped backoff, and every attempt is
+        charged to the quota, so it tracks what the provider bills. Raises
+        QuotaExceeded if our budget is spent or the upstream answers 429.
+        """
+        for attempt in range(self.retries + 1):
+            self.quota.acquire()
+            with UpstreamTimer(url) as timer:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                timer.status = response.status_code
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                break
+            time.sleep(retry_delay(response.headers.get('Retry-After', ''), attempt, self.backoff))
+        if response.status_code == 429:
+            retry_after = response.headers.get('Retry-After', '')
+            raise QuotaExceeded(int(retry_after) if retry_after.isdigit() else 60)
+        return response
+
+    def resolve_offline(self, location):
+        """Look a location up in the offline gazetteer, or return None"""
+        return canonical_location(location).place
+
+    def _location_params(self, location):
+        """Query parameters for a location: coordinates when known offline, else its canonical form"""
+        parsed = canonical_location(location)
+        if parsed.place:
+            return {'lat': parsed.place['lat'], 'lon': parsed.place['lon']}
+        return dict(parsed.params)
+
+    def _provider_query(self, location):
+        """What the providers need for a location: query parameters, plus coordinates and name when known"""
+        parsed = canonical_location(location)
+        if parsed.place:
+            place = parsed.place
+            return ProviderQuery({'lat': place['lat'], 'lon': place['lon']}, place['lat'], place['lon'],
+                                 place['name'], place['country'])
+        if parsed.kind == 'coordinates':
+            return self._coordinate_query(parsed.params['lat'], parsed.params['lon'])
+        return ProviderQuery(dict(parsed.params), None, None, None, None)
+
+    def _coordinate_query(self, lat, lon):
+        """ProviderQuery for a point, named after the closest known station if there is one"""
+        nearest = self.stations.nearest(lat, lon, 1, NAMED_STATION_KM)
+        station = nearest[0][1] if nearest else {}
+        return ProviderQuery({'lat': lat, 'lon': lon}, lat, lon, station.get('name'), station.get('country'))
+
+    def _cached_fetch(self, endpoint, location, units, fetch):
+        """Serve from cache, coalescing concurrent misses into one upstream call
+
+        With a refresher attached, every lookup is reported to it and an
+        expired-but-servable entry is returned immediately while the
+        refresher fetches a new one in the background.
+        """
+        # Spellings of the same place share one cache entry and refresher slot
+        location = location_key(location)
+        if self.offline:
+            fetch = lambda: self._offline_fetch(endpoint, location, units)
+        if self.refresher is not None:
+            self.refresher.touch(endpoint, location, units, fetch)
+
+        entry = self.cache.lookup(endpoint, location, units)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.time():
+                cache_lookups.inc(endpoint, 'hit')
+                return value
+            if self.refresher is not None and self.refresher.revalidate(endpoint, location, units, fetch):
+                cache_lookups.inc(endpoint, 'stale')
+                return value
+
+        try:
+            value = self.refresh_entry(endpoint, location, units, fetch)
+            cache_lookups.inc(endpoint, 'miss')
+            return value
+        except QuotaExceeded:
+            # Out of budget: slightly old weather beats an error
+            if entry is not None:
+                cache_lookups.inc(endpoint, 'stale')
+                return entry[0]
+            fallback = self.from_snapshot(endpoint, location, units)
+            if fallback is None:
+                raise
+            return fallback
+        except Exception:
+            # Upstream unreachable: answer from the offline snapshot if it has the place
+            fallback = self.from_snapshot(endpoint, location, units)
+            if fallback is None:
+                raise
+            return fallback
+
+    def from_snapshot(self, endpoint, location, units='metric'):
+        """A response from the offline snapshot (not cached), or None"""
+        source = 'forecast' if endpoint == 'forecast_compact' else endpoint
+        if (self.snapshot is None or source not in SNAPSHOT_ENDPOINTS
+                or (units != 'metric' and units not in DERIVED_UNITS)):
+            return None
+        try:
+            found = self.snapshot.get(source, location)
+        except (OSError, ValueError) as e:
+            if str(e) != self._snapshot_error:
+                self._snapshot_error = str(e)
+                print(f"⚠️  Offline snapshot unavailable: {e}")
+            return None
+        if found is None:
+            return None
+
+        data = convert_weather(found[0], 'metric', units)
+        if endpoint == 'forecast_compact':
+            data = compact_forecast(data, units)
+        cache_lookups.inc(endpoint, 'snapshot')
+        return data
+
+    def _offline_fetch(self, endpoint, location, units):
+        """Stand-in for an upstream fetch in offline mode"""
+        data = self.from_snapshot(endpoint, location, units)
+        if data is None:
+            raise Exception(f"No offline data for {location}")
+        return data
+
+    def refresh_entry(self, endpoint, location, units, fetch):
+        """Fetch a response from upstream (coalesced) and store it in the cache"""
+        key = make_cache_key(endpoint, location, units)
+        value = self.inflight.do(key, fetch)
+        if value is not None:
+            self.cache.set(endpoint, location, units, value, self._derived_ttl(endpoint, location, units))
+            self._record_observation(endpoint, location, units, value)
+        return value
+
+    def _derived_ttl(self, endpoint, location, units):
+        """Seconds left on the metric entry a derived-unit response came from, or None
+
+        Caching the converted copy for a full TTL would let it outlive its
+        source and keep serving a reading the metric entry has replaced.
+        """
+        if units not in DERIVED_UNITS or endpoint not in ('weather', 'forecast'):
+            return None
+        expires_at = self.cache.expires_at(endpoint, location, 'metric')
+        if expires_at is None:
+            return None
+        return max(expires_at - time.time(), 1)
+
+    def _record_observation(self, endpoint, location, units, value):
+        """Index a fresh current-weather response's station and append it to the history store"""
+        if endpoint != 'weather':
+            return
+        self.stations.add(value, location, units)
+        if self.history is None:
+            return
+        try:
+            self.history.record(location, value, units)
+        except Exception as e:
+            # History is a side effect; never fail a weather request over it
+            print(f"⚠️  Could not record observation: {e}")
+
+    def _from_metric(self, endpoint, location, fetch):
+        """Fresh metric response for a location (cached or fetched), to derive other units from
+
+        Like get_compact_forecast, only fresh data is used so a derived
+        entry never outlives the response it came from.
+        """
+        location = location_key(location)
+        data = self.cache.get(endpoint, location, 'metric')
+        if data is None:
+            data = self.refresh_entry(endpoint, location, 'metric', fetch)
+        return data
+
     def get_current_weather(self, location, units='metric'):
-        """Fetch current weather data for a location"""
+        """Fetch current weather data for a location (cached)"""
+        return self._cached_fetch(
+            'weather', location, units,
+            lambda: self._fetch_current_weather(location, units)
+        )
+
+    def _fetch_current_weather(self, location, units='metric'):
+        """Fetch current weather data from the best available provider"""
+        if units in DERIVED_UNITS:
+            data = self._from_metric('weather', location, lambda: self._fetch_current_weather(location))
+            return convert_weather(data, 'metric', units)
         try:
-            url = f"{self.base_url}/weather"
-            params = {
-                'q': location,
-                'appid': self.api_key,
-                'units': units
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return self.providers.current(self._provider_query(location), units)
+        except ProviderError as e:
             raise Exception(f"Failed to fetch weather data: {str(e)}")
-        except json.JSONDecodeError:
-            raise Exception("Invalid response from weather service")
     
     def get_forecast(self, location, units='metric'):
-        """Fetch 5-day weather forecast"""
+        """Fetch 5-day weather forecast (cached)"""
+        return self._cached_fetch(
+            'forecast', location, units,
+            lambda: self._fetch_forecast(location, units)
+        )
+
+    def get_compact_forecast(self, location, units='metric'):
+        """Fetch the forecast as columnar slots plus a daily summary (cached)
+
+        The reshaped form is cached on its own, so repeat requests skip
+        both the JSON parsing and the reshaping.
+        """
+        def build():
+            # Only reshape fresh data so a stale forecast isn't re-cached as new
+            raw = self.cache.get('forecast', location, units)
+            if raw is None:
+                raw = self.refresh_entry(
+                    'forecast', location, units,
+                    lambda: self._fetch_forecast(location, units)
+                )
+            return compact_forecast(raw, units) if raw else None
+
+        return self._cached_fetch('forecast_compact', location, units, build)
+
+    def _fetch_forecast(self, location, units='metric'):
+        """Fetch 5-day weather forecast from the best available provider"""
+        if units in DERIVED_UNITS:
+            data = self._from_metric('forecast', location, lambda: self._fetch_forecast(location))
+            return convert_weather(data, 'metric', units)
         try:
-            url = self.forecast_url
-            params = {
-                'q': location,
-                'appid': self.api_key,
-                'units': units
-            }
-
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return self.providers.forecast(self._provider_query(location), units)
+        except ProviderError as e:
             raise Exception(f"Failed to fetch forecast data: {str(e)}")
 
     def get_weather_by_coordinates(self, lat: float, lon: float, units='metric'):
-        """Fetch weather data using coordinates"""
+        """Fetch weather data using coordinates (cached per geohash cell)
+
+        Coordinates snap to their geohash cell, so nearby requests share one
+        cache entry and one upstream call. On a miss, a fresh observation
+        from a station within NEAREST_STATION_KM is served instead.
+        """
+        bucket = coordinate_location(lat, lon)
+        source = self.coordinate_source(lat, lon, units)
+        if source != bucket.key:
+            entry = self.cache.lookup('weather', source, units)
+            if entry is not None and entry[1] > time.time():
+                cache_lookups.inc('weather', 'nearby')
+                return entry[0]
+
+        return self._cached_fetch(
+            'weather', bucket.key, units,
+            lambda: self._fetch_weather_by_coordinates(bucket.params['lat'], bucket.params['lon'], units)
+        )
+
+    def nearest_stations(self, lat: float, lon: float, limit=5, max_distance_km=None):
+        """Stations with cached observations closest to a point, closest first"""
+        return [dict(station, distance_km=round(distance, 2))
+                for distance, station in self.stations.nearest(lat, lon, limit, max_distance_km)]
+
+    def nearest_cached_location(self, lat: float, lon: float, units, max_distance_km):
+        """Cache key of fresh weather from the closest station within range, or None"""
+        now = time.time()
+        for distance, station in self.stations.nearest(lat, lon, 3, max_distance_km):
+            location = station['locations'].get(units)
+            expires_at = self.cache.expires_at('weather', location, units) if location else None
+            if expires_at is not None and expires_at > now:
+                return location
+        return None
+
+    def coordinate_source(self, lat: float, lon: float, units='metric'):
+        """Cache location get_weather_by_coordinates answers a point from
+
+        The point's own geohash cell when it is cached (or nothing nearby
+        is), else the closest fresh station within NEAREST_STATION_KM. The
+        server builds ETags from this entry.
+        """
+        bucket = coordinate_location(lat, lon)
+        if NEAREST_STATION_KM > 0 and self.cache.expires_at('weather', bucket.key, units) is None:
+            nearby = self.nearest_cached_location(lat, lon, units, NEAREST_STATION_KM)
+            if nearby is not None:
+                return nearby
+        return bucket.key
+
+    def _fetch_weather_by_coordinates(self, lat: float, lon: float, units='metric'):
+        """Fetch weather data for coordinates from the best available provider"""
+        if units in DERIVED_UNITS:
+            data = self._from_metric('weather', coordinate_location(lat, lon).key,
+                                     lambda: self._fetch_weather_by_coordinates(lat, lon))
+            return convert_weather(data, 'metric', units)
         try:
-            url = f"{self.base_url}/weather"
-            params = {
-                'lat': lat,
-                'lon': lon,
-                'appid': self.api_key,
-                'units': units
-            }
+            return self.providers.current(self._coordinate_query(lat, lon), units)
+        except ProviderError as e:
+            raise Exception(f"Failed to fetch weather data: {str(e)}")
 
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
+    def get_weather_by_city_ids(self, city_ids, units='metric'):
+        """Fetch current weather for several OpenWeatherMap city IDs in one call
+
+        Uses the bulk /group endpoint (max 20 IDs per request) for IDs that
+        aren't already cached. Returns a dict of city ID to weather data.
+        Imperial results are converted in one pass from the metric ones.
+        """
+        if units in DERIVED_UNITS:
+            found = self.get_weather_by_city_ids(city_ids, 'metric')
+            ids = list(found)
+            converted = convert_weather({'list': [found[city_id] for city_id in ids]}, 'metric', units)
+            return dict(zip(ids, converted['list']))
+
+        results = {}
+        missing = []
+        for city_id in city_ids:
+            cached = self.cache.get('weather', f"id:{city_id}", units)
+            if cached is not None:
+                results[city_id] = cached
+            else:
+                missing.append(city_id)
+
+        if self.offline:
+            for city_id in missing:
+                data = self.from_snapshot('weather', f"id:{city_id}", units)
+                if data is not None:
+                    results[city_id] = data
+            return results
+
+        for start in range(0, len(missing), GROUP_REQUEST_LIMIT):
+            chunk = missing[start:start + GROUP_REQUEST_LIMIT]
+            try:
+                url = f"{self.base_url}/group"
+                params = {
+                    'id': ','.join(str(city_id) for city_id in chunk),
+                    'appid': self.api_key,
+                    'units': units
+                }
 
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Failed to fetch weather data: {str(e)}")
+                response = self._upstream_get(url, params)
+                response.raise_for_status()
+
+                for data in response.json().get('list', []):
+                    results[data['id']] = data
+                    self.cache.set('weather', f"id:{data['id']}", units, data)
+            except requests.exceptions.RequestException as e:
+                fallback = {city_id: self.from_snapshot('weather', f"id:{city_id}", units) for city_id in chunk}
+                if not any(fallback.values()):
+                    raise Exception(f"Failed to fetch weather data: {str(e)}")
+                results.update((city_id, data) for city_id, data in fallback.items() if data is not None)
+
+        return results
+
+    def get_current_weather_batch(self, locations, units='metric', max_workers=8):
+        """Fetch current weather for many locations at once
+
+        Each location is a name string, a (lat, lon) tuple or an int city ID.
+        Duplicates are fetched once, cache hits are answered inline, city IDs
+        go through the bulk endpoint and the remaining misses are fetched
+        concurrently by at most max_workers threads.
+        Returns a dict of location to weather data or the Exception raised.
+        """
+        unique = list(dict.fromkeys(locations))
+        results = {}
+
+        city_ids = [loc for loc in unique if isinstance(loc, int) and not isinstance(loc, bool)]
+        if city_ids:
+            try:
+                found = self.get_weather_by_city_ids(city_ids, units)
+                for city_id in city_ids:
+                    results[city_id] = found.get(city_id) or Exception(f"City ID {city_id} not found")
+            except Exception as e:
+                for city_id in city_ids:
+                    results[city_id] = e
+
+        misses = []
+        for loc in unique:
+            if loc in results:
+                continue
+            cache_location = f"{loc[0]:.4f},{loc[1]:.4f}" if isinstance(loc, tuple) else loc
+            cached = self.cache.get('weather', cache_location, units)
+            if cached is not None:
+                results[loc] = cached
+            else:
+                misses.append(loc)
+
+        def fetch(loc):
+            try:
+                if isinstance(loc, tuple):
+                    return self.get_weather_by_coordinates(loc[0], loc[1], units)
+                return self.get_current_weather(loc, units)
+            except Exception as e:
+                return e
+
+        if misses:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(misses))) as pool:
+                for loc, result in zip(misses, pool.map(fetch, misses)):
+                    results[loc] = result
+
+        return results
 
     def get_air_quality(self, lat: float, lon: float):
         """Fetch air quality data"""
@@ -148,7 +556,7 @@ class WeatherService:
                 'appid': self.api_key
             }
 
-            response = requests.get(url, params=params, timeout=10)
+            response = self._upstream_get(url, params)
             response.raise_for_status()
 
             return response.json()
@@ -156,16 +564,27 @@ class WeatherService:
             raise Exception(f"Failed to fetch air quality data: {str(e)}")
 
     def geocode_location(self, location: str):
-        """Convert location name to coordinates"""
+        """Convert location name to coordinates (offline index first, then cached API)"""
+        place = self.resolve_offline(location)
+        if place:
+            return place
+
+        return self._cached_fetch(
+            'geocode', location, '',
+            lambda: self._fetch_geocode(location)
+        )
+
+    def _fetch_geocode(self, location: str):
+        """Convert location name to coordinates using the upstream API"""
         try:
             url = f"{self.geocoding_url}/direct"
             params = {
-                'q': location,
+                'q': canonical_location(location).params.get('q', location),
                 'limit': 1,
                 'appid': self.api_key
             }
 
-            response = requests.get(url, params=params, timeout=10)
+            response = self._upstream_get(url, params)
             response.raise_for_status()
 
             data = response.json()
@@ -175,48 +594,20 @@ class WeatherService:
         except requests.exceptions.RequestException as e:
             raise Exception(f"Failed to geocode location: {str(e)}")
     
-    def format_weather_data(self, data, units='metric'):
-        """Format weather data for display"""
+    def format_weather_data(self, data, units='metric', include_raw=True):
+        """Format weather data for display (include_raw=False drops the raw upstream copy)"""
         if not data:
             return None
 
-        temp_unit = "°C" if units == 'metric' else "°F"
-        speed_unit = "m/s" if units == 'metric' else "mph"
-        pressure_unit = "hPa"
-
-        # Get weather emoji
-        description = data['weather'][0]['description'].lower()
-        emoji = self.weather_emojis.get(description, '🌤️')
-
-        # Calculate additional info
-        temp_min = data['main'].get('temp_min', data['main']['temp'])
-        temp_max = data['main'].get('temp_max', data['main']['temp'])
-
-        weather_info = {
-            'location': f"{data['name']}, {data['sys']['country']}",
-            'coordinates': f"{data['coord']['lat']:.2f}, {data['coord']['lon']:.2f}",
-            'temperature': f"{data['main']['temp']:.1f}{temp_unit}",
-            'temp_min': f"{temp_min:.1f}{temp_unit}",
-            'temp_max': f"{temp_max:.1f}{temp_unit}",
-            'feels_like': f"{data['main']['feels_like']:.1f}{temp_unit}",
-            'description': data['weather'][0]['description'].title(),
-            'emoji': emoji,
-            'humidity': f"{data['main']['humidity']}%",
-            'pressure': f"{data['main']['pressure']} {pressure_unit}",
-            'wind_speed': f"{data['wind']['speed']} {speed_unit}",
-            'wind_direction': f"{data['wind'].get('deg', 0)}°",
-            'wind_gust': f"{data['wind'].get('gust', 0)} {speed_unit}" if 'gust' in data['wind'] else None,
-            'visibility': f"{data.get('visibility', 0) / 1000:.1f} km",
-            'cloudiness': f"{data['clouds']['all']}%",
-            'icon': data['weather'][0]['icon'],
-            'sunrise': datetime.fromtimestamp(data['sys']['sunrise']).strftime('%H:%M'),
-            'sunset': datetime.fromtimestamp(data['sys']['sunset']).strftime('%H:%M'),
-            'timezone': data.get('timezone', 0),
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'raw_data': data  # Keep raw data for advanced processing
-        }
+        return format_one(data, units, self.weather_emojis, include_raw)
 
-        return weather_info
+    def format_weather_batch(self, docs, units='metric', views=None, include_raw=True):
+        """Format many weather responses at once, in one or more unit systems
+
+        docs are in units; views defaults to [units]. Returns {view: [formatted
+        dict or the exception for a malformed response, ...]} in docs order.
+        """
+        return format_current(docs, units, views, emojis=self.weather_emojis, include_raw=include_raw)
 
     def convert_temperature(self, temp: float, from_unit: str, to_unit: str) -> float:
         """Convert temperature between Celsius and Fahrenheit"""
@@ -238,31 +629,21 @@ class LocationService:
     """Handles location detection and validation"""
 
     def __init__(self):
-        self.current_location = None
-        self.location_history = []
-
-    def get_location_by_ip(self):
-        """Get location using IP geolocation"""
-        try:
-            import geocoder
-            g = geocoder.ip('me')
-            if g.ok:
-                location = f"{g.city}, {g.country}"
-                self.current_location = {
-                    'name': location,
-                    'lat': g.latlng[0] if g.latlng else None,
-                    'lon': g.latlng[1] if g.latlng else None,
-                    'method': 'ip_detection'
-                }
-                return location
-            return None
-        except ImportError:
-            print("💡 Tip: Install 'geocoder' package for automatic location detection")
-            print("   Run: pip install geocoder")
-            return None
-        except Exception as e:
-            print(f"⚠️  Location detection failed: {e}")
-            return None
+        self.gazetteer = get_gazetteer()
+        self.ip_locator = get_ip_locator()
+        # Each client gets its own history; city suggestions come from the gazetteer
+        self.recent_searches = RecentSearches()
+        self.suggestion_index = SuggestionIndex(self.gazetteer)
+
+    def get_location_by_ip(self, ip=None):
+        """Get a client's location from its IP address
+
+        Returns a dict (name, city, region, country, lat, lon, method) or
+        None. Each call gets its own result, so concurrent requests for
+        different clients can't see each other's location. Without an
+        IP (or with a local one) this machine's own location is looked up.
+        """
+        return self.ip_locator.locate(ip or '127.0.0.1')
 
     def get_location_by_gps(self):
         """Get location using GPS (placeholder for mobile implementation)"""
@@ -271,54 +652,52 @@ class LocationService:
         return None
 
     def validate_location(self, location):
-        """Validate location input"""
-        if not location or len(location.strip()) < 2:
-            return False, "Location must be at least 2 characters long"
-
-        # Remove extra spaces
-        location = ' '.join(location.split())
-
-        # Basic validation - allow letters, numbers, spaces, commas, hyphens, apostrophes
-        import re
-        if not re.match(r'^[a-zA-Z0-9\s,.\'-]+$', location):
-            return False, "Location contains invalid characters"
-
-        # Check for common location patterns
-        valid_patterns = [
-            r'^[a-zA-Z\s]+$',  # City name only
-            r'^[a-zA-Z\s]+,\s*[a-zA-Z\s]+$',  # City, Country
-            r'^[a-zA-Z\s]+,\s*[A-Z]{2}$',  # City, State Code
-            r'^\d{5}$',  # ZIP code (US)
-            r'^[a-zA-Z]\d[a-zA-Z]\s*\d[a-zA-Z]\d$',  # Postal code (Canada)
-        ]
-
-        if any(re.match(pattern, location) for pattern in valid_patterns):
-            return True, "Valid location"
-
-        # If no pattern matches but basic validation passed, still allow it
-        return True, "Location format accepted"
-
-    def add_to_history(self, location):
-        """Add location to search history"""
-        if location not in self.location_history:
-            self.location_history.append(location)
-            # Keep only last 10 locations
-            if len(self.location_history) > 10:
-                self.location_history.pop(0)
-
-    def get_location_suggestions(self, partial_location):
-        """Get location suggestions based on history"""
+        """Validate location input (patterns are precompiled and results memoized)"""
+        is_valid, message = validate_format(location)
+        if is_valid and message == "Valid location" and gazetteer_is_authoritative():
+            # With a full gazetteer loaded, unknown city names never reach the API
+            parsed = canonical_location(location)
+            if parsed.kind == 'city' and parsed.place is None:
+                return False, "Location not found"
+        return is_valid, message
+
+    def add_to_history(self, location, client_id=None):
+        """Add location to a client's search history"""
+        self.recent_searches.add(client_id, location)
+        self.suggestion_index.record_search(location)
+
+    def get_location_suggestions(self, partial_location, client_id=None, limit=5):
+        """Get location suggestions from the client's history, then matching cities"""
+        history = self.recent_searches.get(client_id)
         if not partial_location:
-            return self.location_history[-5:]  # Return last 5 locations
+            return [{'label': location, 'source': 'history'} for location in history[:limit]]
 
-        suggestions = []
         partial_lower = partial_location.lower()
+        suggestions = [
+            {'label': location, 'source': 'history'}
+            for location in history
+            if partial_lower in location.lower()
+        ][:limit]
 
-        for location in self.location_history:
-            if partial_lower in location.lower():
-                suggestions.append(location)
-
-        return suggestions[:5]  # Return max 5 suggestions
+        seen = {s['label'].lower() for s in suggestions}
+        try:
+            cities = self.suggestion_index.search(partial_location, limit)
+        except (OSError, ValueError):
+            cities = []
+
+        for city in cities:
+            if len(suggestions) >= limit:
+                break
+            if city['label'].lower() not in seen:
+                seen.add(city['label'].lower())
+                suggestions.append({
+                    'label': city['label'],
+                    'source': 'city',
+                    'lat': city['lat'],
+                    'lon': city['lon']
+                })
+
+        return suggestions
 
 # This module provides WeatherService and LocationService classes
 # for the web interface to use